@@ -0,0 +1,209 @@
+"""Batch replay of the review log into skill states.
+
+Rebuilds every (user, skill) SkillState from `skill_reviews` (seeded from
+`skill_baselines` where present) with vectorised NumPy passes, so a change to
+SchedulerParams can be rolled out as a full recompute.
+
+The recurrence is sequential per skill, so the engine vectorises *across*
+skills instead: step k applies the k-th review of every skill in one pass.
+Times are int64 microseconds since the epoch, which keeps next_due exact.
+
+    cd backend && python -m app.adaptive.replay --dry-run
+    python -m app.adaptive.replay --params '{"retry_hours": 6}'
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import asdict, fields
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .scheduler import DEFAULT_PARAMS, SchedulerParams, SkillState
+
+US_PER_HOUR = 3_600_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+NO_TIME = np.iinfo(np.int64).min  # stands in for None
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def initial_arrays(n: int) -> Dict[str, np.ndarray]:
+    """State arrays for n skills at the Skill column defaults."""
+    return {
+        "strength": np.full(n, 0.3),
+        "ease": np.full(n, 2.0),
+        "interval_days": np.ones(n, dtype=np.int64),
+        "last_seen": np.full(n, NO_TIME, dtype=np.int64),
+        "next_due": np.full(n, NO_TIME, dtype=np.int64),
+        "streak": np.zeros(n, dtype=np.int64),
+        "mistakes": np.zeros(n, dtype=np.int64),
+    }
+
+def replay_arrays(group: np.ndarray, quality: np.ndarray, ts_us: np.ndarray, state: Dict[str, np.ndarray],
+                  params: SchedulerParams = DEFAULT_PARAMS) -> Dict[str, np.ndarray]:
+    """Apply events to `state` in place and return it.
+
+    `group[i]` indexes the state arrays; events of one group must appear in
+    time order (any interleaving of groups is fine).
+    """
+    p = params
+    n = len(group)
+    if n == 0:
+        return state
+    # rank of each event within its group, computed from a stable sort by group
+    by_group = np.argsort(group, kind="stable")
+    g_sorted = group[by_group]
+    starts = np.flatnonzero(np.r_[True, g_sorted[1:] != g_sorted[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_group] = np.arange(n) - np.repeat(starts, counts)
+    # events ordered by step; each step touches every group at most once
+    by_step = np.argsort(rank, kind="stable")
+    bounds = np.searchsorted(rank[by_step], np.arange(int(rank.max()) + 2))
+
+    retry_us = int(round(p.retry_hours * US_PER_HOUR))
+    s, e, iv = state["strength"], state["ease"], state["interval_days"]
+    for k in range(len(bounds) - 1):
+        idx = by_step[bounds[k]:bounds[k + 1]]
+        g = group[idx]
+        q = np.clip(quality[idx].astype(np.float64), 0.0, 5.0)
+        t = ts_us[idx]
+        fail = q < p.fail_below
+
+        s_old, e_old, iv_old = s[g], e[g], iv[g]
+        e_fail = np.clip(e_old - p.fail_ease_penalty, p.min_ease, p.max_ease)
+        e_ok = np.clip(e_old + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)), p.min_ease, p.max_ease)
+        e_new = np.where(fail, e_fail, e_ok)
+        iv_ok = np.where(iv_old <= 1, p.first_interval_days, np.rint(iv_old * e_ok).astype(np.int64))
+        iv_new = np.where(fail, 1, iv_ok)
+        gain = p.gain_base + p.gain_per_quality * (q - 3.0)
+        s_new = np.where(
+            fail,
+            np.clip(s_old - p.fail_strength_penalty, 0.0, 1.0),
+            np.clip(s_old + gain * (1.0 - s_old), 0.0, 1.0),
+        )
+
+        s[g], e[g], iv[g] = s_new, e_new, iv_new
+        state["next_due"][g] = np.where(fail, t + retry_us, t + iv_new * US_PER_DAY)
+        state["last_seen"][g] = t
+        state["streak"][g] = np.where(fail, 0, state["streak"][g] + 1)
+        state["mistakes"][g] = state["mistakes"][g] + fail
+    return state
+
+def to_us(dt: datetime | None) -> int:
+    if dt is None:
+        return NO_TIME
+    if dt.tzinfo is None:  # SQLite hands back naive UTC datetimes
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def from_us(us: int) -> datetime | None:
+    if us == NO_TIME:
+        return None
+    return EPOCH + timedelta(microseconds=int(us))
+
+def state_at(state: Dict[str, np.ndarray], i: int) -> SkillState:
+    return SkillState(
+        strength=float(state["strength"][i]),
+        ease=float(state["ease"][i]),
+        interval_days=int(state["interval_days"][i]),
+        last_seen=from_us(state["last_seen"][i]),
+        next_due=from_us(state["next_due"][i]),
+        streak=int(state["streak"][i]),
+        mistakes=int(state["mistakes"][i]),
+    )
+
+async def recompute(db, params: SchedulerParams = DEFAULT_PARAMS, user_id: str | None = None,
+                    dry_run: bool = False, chunk: int = 50_000) -> Dict[str, float]:
+    """Replay the whole review log (optionally one user) and write the states back to `skills`."""
+    from sqlalchemy import select
+    from ..db.models import Skill, SkillBaseline, SkillReview
+    from ..db.session import dialect_insert
+    from ..practice_plans import invalidate_plans
+
+    keys: Dict[Tuple[str, int], int] = {}
+    groups: List[np.ndarray] = []
+    qualities: List[np.ndarray] = []
+    times: List[np.ndarray] = []
+
+    t0 = time.perf_counter()
+    q = select(SkillReview.user_id, SkillReview.skill_int_id, SkillReview.quality, SkillReview.ts).order_by(SkillReview.id)
+    if user_id is not None:
+        q = q.where(SkillReview.user_id == user_id)
+    result = await db.stream(q.execution_options(yield_per=chunk))
+    async for part in result.partitions(chunk):
+        groups.append(np.fromiter((keys.setdefault((r[0], r[1]), len(keys)) for r in part), np.int64, len(part)))
+        qualities.append(np.fromiter((r[2] for r in part), np.int64, len(part)))
+        times.append(np.fromiter((to_us(r[3]) for r in part), np.int64, len(part)))
+    group = np.concatenate(groups) if groups else np.zeros(0, np.int64)
+    quality = np.concatenate(qualities) if qualities else np.zeros(0, np.int64)
+    ts_us = np.concatenate(times) if times else np.zeros(0, np.int64)
+
+    state = initial_arrays(len(keys))
+    bq = select(SkillBaseline)
+    if user_id is not None:
+        bq = bq.where(SkillBaseline.user_id == user_id)
+    for b in (await db.execute(bq)).scalars():
+        i = keys.get((b.user_id, b.skill_int_id))
+        if i is None:
+            continue
+        for name in ("strength", "ease", "interval_days", "streak", "mistakes"):
+            state[name][i] = getattr(b, name)
+        state["last_seen"][i] = to_us(b.last_seen)
+        state["next_due"][i] = to_us(b.next_due)
+    t_load = time.perf_counter()
+
+    replay_arrays(group, quality, ts_us, state, params)
+    t_replay = time.perf_counter()
+
+    if not dry_run and keys:
+        names = [f.name for f in fields(SkillState)]
+        items = list(keys.items())
+        batch = 2000  # keeps bound parameters under SQLite's limit
+        for start in range(0, len(items), batch):
+            values = [
+                {"user_id": u, "skill_int_id": sk, **asdict(state_at(state, i))}
+                for (u, sk), i in items[start:start + batch]
+            ]
+            stmt = dialect_insert(db, Skill).values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Skill.user_id, Skill.skill_int_id],
+                set_={n: stmt.excluded[n] for n in names},
+            )
+            await db.execute(stmt)
+        await invalidate_plans(db, user_id)
+        await db.commit()
+    t_write = time.perf_counter()
+
+    replay_s = t_replay - t_load
+    return {
+        "events": int(len(group)),
+        "skills": len(keys),
+        "load_s": round(t_load - t0, 3),
+        "replay_s": round(replay_s, 4),
+        "write_s": round(t_write - t_replay, 3),
+        "events_per_s": round(len(group) / replay_s) if replay_s > 0 else 0,
+    }
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from ..db.init_db import init_db
+    from ..db.session import init_engine, dispose_engine, get_sessionmaker
+
+    load_dotenv()
+    params = SchedulerParams(**{**asdict(DEFAULT_PARAMS), **json.loads(args.params)})
+    await init_db(init_engine())
+    async with get_sessionmaker()() as db:
+        stats = await recompute(db, params=params, user_id=args.user, dry_run=args.dry_run)
+    await dispose_engine()
+    print(json.dumps({"params": asdict(params), **stats}, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Recompute skill states from the review log")
+    ap.add_argument("--params", default="{}", help="JSON overrides for SchedulerParams")
+    ap.add_argument("--user", default=None, help="only replay this user_id")
+    ap.add_argument("--dry-run", action="store_true", help="compute but do not write back")
+    asyncio.run(_main(ap.parse_args()))
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from typing import Iterable, List, Tuple
 from datetime import datetime, timedelta, timezone
 
 UTC = timezone.utc
@@ -14,54 +15,82 @@ class SkillState:
     streak: int
     mistakes: int
 
+@dataclass(frozen=True)
+class SchedulerParams:
+    """Tunable constants of update_skill (replayed in bulk by adaptive/replay.py)."""
+    fail_below: float = 3.0            # quality < this counts as a mistake
+    fail_strength_penalty: float = 0.15
+    fail_ease_penalty: float = 0.15
+    retry_hours: float = 8.0           # quick retry after a mistake
+    min_ease: float = 1.3
+    max_ease: float = 2.7
+    first_interval_days: int = 2
+    gain_base: float = 0.08
+    gain_per_quality: float = 0.02
+
+DEFAULT_PARAMS = SchedulerParams()
+
 def clamp(x: float, lo: float, hi: float) -> float:
     return max(lo, min(hi, x))
 
 def now_utc() -> datetime:
     return datetime.now(tz=UTC)
 
-def update_skill(state: SkillState, quality: int) -> SkillState:
+def update_skill(state: SkillState, quality: int, now: datetime | None = None, params: SchedulerParams = DEFAULT_PARAMS) -> SkillState:
     """Update scheduling based on a 0..5 quality score.
     - quality 0-2: failure (schedule soon, reduce strength)
     - quality 3-5: success (increase interval, boost strength)
+    `now` is the review time (defaults to the current time).
     """
-    t = now_utc()
+    t = now or now_utc()
+    p = params
     # Normalize quality
     q = clamp(float(quality), 0.0, 5.0)
 
     # Mistake vs success
-    if q < 3.0:
+    if q < p.fail_below:
         state.mistakes += 1
         state.streak = 0
-        state.strength = clamp(state.strength - 0.15, 0.0, 1.0)
-        state.ease = clamp(state.ease - 0.15, 1.3, 2.7)
+        state.strength = clamp(state.strength - p.fail_strength_penalty, 0.0, 1.0)
+        state.ease = clamp(state.ease - p.fail_ease_penalty, p.min_ease, p.max_ease)
         state.interval_days = 1
-        state.next_due = t + timedelta(hours=8)  # quick retry
+        state.next_due = t + timedelta(hours=p.retry_hours)  # quick retry
     else:
         state.streak += 1
         # Ease factor update (SM-2-like)
-        state.ease = clamp(state.ease + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)), 1.3, 2.7)
+        state.ease = clamp(state.ease + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)), p.min_ease, p.max_ease)
         # Interval growth
         if state.interval_days <= 1:
-            state.interval_days = 2
+            state.interval_days = p.first_interval_days
         else:
             state.interval_days = int(round(state.interval_days * state.ease))
         # Strength grows slower as you approach 1.0
-        gain = 0.08 + 0.02 * (q - 3.0)
+        gain = p.gain_base + p.gain_per_quality * (q - 3.0)
         state.strength = clamp(state.strength + gain * (1.0 - state.strength), 0.0, 1.0)
         state.next_due = t + timedelta(days=state.interval_days)
 
     state.last_seen = t
     return state
 
-def score_candidate(due: bool, strength: float, next_due: datetime | None) -> float:
+def score_candidate(due: bool, strength: float, next_due: datetime | None, now: datetime | None = None) -> float:
     """Lower score => higher priority."""
     base = 1.0 - strength
     if due:
         return base - 0.5
     if next_due:
         # time until due in hours
-        dt = (next_due - now_utc()).total_seconds() / 3600.0
+        dt = (next_due - (now or now_utc())).total_seconds() / 3600.0
         # soon-due gets better score
         return base + clamp(dt / 72.0, 0.0, 2.0)
     return base + 2.0
+
+def score_candidates(items: Iterable[Tuple[float, datetime | None]], now: datetime) -> List[float]:
+    """Batch form of score_candidate over (strength, next_due) pairs with a single `now`."""
+    out = []
+    for strength, next_due in items:
+        if next_due is None or next_due <= now:
+            out.append(1.0 - strength - 0.5)
+        else:
+            dt = (next_due - now).total_seconds() / 3600.0
+            out.append(1.0 - strength + clamp(dt / 72.0, 0.0, 2.0))
+    return out
@@ -1,9 +1,23 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Iterable
+
+from .scheduler import DEFAULT_PARAMS, SchedulerParams, SkillState, update_skill
 
 @dataclass
 class SkillEvent:
     skill_id: str
     quality: int  # 0..5
     ts: datetime
+
+def new_state() -> SkillState:
+    # mirrors the Skill column defaults
+    return SkillState(strength=0.3, ease=2.0, interval_days=1, last_seen=None, next_due=None, streak=0, mistakes=0)
+
+def replay(events: Iterable[SkillEvent], state: SkillState | None = None, params: SchedulerParams = DEFAULT_PARAMS) -> SkillState:
+    """Scalar reference replay of one skill's review history (events in time order)."""
+    state = state or new_state()
+    for ev in events:
+        state = update_skill(state, ev.quality, now=ev.ts, params=params)
+    return state
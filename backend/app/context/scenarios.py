@@ -28,7 +28,22 @@ SCENARIOS = {
     ],
 }
 
+# new skills suggested per context (practice/next) and tagged by the local tutor (tutor/tagger.py)
+SUGGESTED_SKILLS = {
+    "Airport": ["phrase:check_in", "vocab:overweight_bag", "phrase:rebook_flight"],
+    "Restaurant": ["phrase:table_for_two", "vocab:allergy", "phrase:order_modification"],
+    "Classroom": ["phrase:ask_clarification", "phrase:request_extension", "vocab:assignment"],
+    "Office": ["phrase:status_update", "phrase:disagree_politely", "phrase:schedule_meeting"],
+    "Shopping": ["phrase:return_item", "vocab:refund", "phrase:ask_alternative"],
+}
+
+DEFAULT_CONTEXT = "Airport"
+
+def known_context(context: str) -> str:
+    """`context` if it is one of SCENARIOS, else the default one (whose plan and scenario it gets anyway)."""
+    return context if context in SCENARIOS else DEFAULT_CONTEXT
+
 def pick_scenario(context: str) -> str:
-    arr = SCENARIOS.get(context) or SCENARIOS["Airport"]
+    arr = SCENARIOS.get(context) or SCENARIOS[DEFAULT_CONTEXT]
     # simple deterministic-ish pick
     return arr[0]
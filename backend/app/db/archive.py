@@ -0,0 +1,123 @@
+"""Compressed JSONL segments of chat turns that retention moved out of the database.
+
+    {CHAT_ARCHIVE_DIR}/{user key}/{first id}-{last id}.jsonl.gz   (.jsonl.zst with CHAT_ARCHIVE_CODEC=zstd)
+
+One line per turn (`id`, `role`, `content`, `ts`), oldest first. The id range
+in the file name lets `/api/history` pick the segments below its cursor without
+opening the others. Segments are written to a temp file and renamed into place
+before the rows are deleted, so a crash in between leaves a duplicate rather
+than a gap (`archived_upto` lets the next pass skip what is already on disk).
+Everything here is blocking file I/O; call it from a thread.
+"""
+from __future__ import annotations
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import orjson
+
+SUFFIXES = (".jsonl.gz", ".jsonl.zst")
+
+# held while a segment is written and its rows deleted, and while a user's archive is removed
+lock = asyncio.Lock()
+
+def archive_dir() -> str:
+    return os.getenv("CHAT_ARCHIVE_DIR", os.path.join("data", "archive"))
+
+def _codec() -> str:
+    """zstd is opt-in (CHAT_ARCHIVE_CODEC=zstd) and needs the optional `zstandard` package."""
+    if os.getenv("CHAT_ARCHIVE_CODEC", "gzip").strip().lower() != "zstd":
+        return ".jsonl.gz"
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return ".jsonl.gz"
+    return ".jsonl.zst"
+
+def _user_dir(user_id: str) -> str:
+    return os.path.join(archive_dir(), hashlib.blake2b(user_id.encode(), digest_size=16).hexdigest())
+
+def _segments(user_id: str) -> List[Tuple[int, int, str]]:
+    """(first id, last id, path) of the user's segments, oldest first."""
+    try:
+        names = os.listdir(_user_dir(user_id))
+    except FileNotFoundError:
+        return []
+    out = []
+    for name in names:
+        suffix = next((s for s in SUFFIXES if name.endswith(s)), None)
+        if suffix is None:
+            continue
+        first, _, last = name[:-len(suffix)].partition("-")
+        out.append((int(first), int(last), os.path.join(_user_dir(user_id), name)))
+    return sorted(out)
+
+def has_archive(user_id: str) -> bool:
+    return os.path.isdir(_user_dir(user_id))
+
+def archived_upto(user_id: str) -> int:
+    """Highest turn id already in a segment (0 if none)."""
+    segments = _segments(user_id)
+    return max(last for _, last, _ in segments) if segments else 0
+
+def write_segment(user_id: str, rows: List[Dict[str, Any]]) -> str:
+    """Write turns (dicts with id, role, content, ts; ascending id) as one segment; returns its path."""
+    suffix = _codec()
+    body = b"".join(orjson.dumps({k: r[k] for k in ("id", "role", "content", "ts")}) + b"\n" for r in rows)
+    if suffix == ".jsonl.zst":
+        import zstandard
+        data = zstandard.ZstdCompressor(level=9).compress(body)
+    else:
+        data = gzip.compress(body, compresslevel=6)
+    folder = _user_dir(user_id)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{rows[0]['id']:012d}-{rows[-1]['id']:012d}{suffix}")
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+def _read(path: str) -> List[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".zst"):
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 30)
+    else:
+        data = gzip.decompress(data)
+    rows = [orjson.loads(line) for line in data.splitlines() if line]
+    for r in rows:
+        r["ts"] = datetime.fromisoformat(r["ts"])
+    return rows
+
+def read_before(user_id: str, before: int | None, n: int) -> List[Dict[str, Any]]:
+    """Up to `n` archived turns with id < `before` (None: the newest), newest first."""
+    out: List[Dict[str, Any]] = []
+    seen = before
+    for first, _, path in reversed(_segments(user_id)):
+        if len(out) >= n:
+            break
+        if seen is not None and first >= seen:
+            continue
+        for r in reversed(_read(path)):
+            if seen is None or r["id"] < seen:  # also skips duplicates left by an interrupted pass
+                out.append(r)
+                seen = r["id"]
+                if len(out) >= n:
+                    break
+    return out
+
+def remove_user(user_id: str):
+    shutil.rmtree(_user_dir(user_id), ignore_errors=True)
@@ -1,14 +1,64 @@
+"""Schema setup: create_all + versioned migrations (migrations.py), once per database.
+
+Every worker calls init_db from the app lifespan. They take an exclusive file
+lock first (next to a SQLite file, else data/db-init.lock), so with
+`uvicorn --workers N` one worker builds/migrates the schema while the rest wait,
+then find it current and skip straight to serving. Deploys can run it ahead of
+the app instead:  python -m app.db.init_db
+"""
 from __future__ import annotations
+import asyncio
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncEngine
+
 from .models import Base
+from .migrations import run_migrations, schema_current
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers fall back to racing on create_all
+    fcntl = None
+
+def lock_path(url: URL) -> str | None:
+    if url.get_backend_name() == "sqlite":
+        db = url.database
+        return None if not db or db == ":memory:" else f"{db}.init.lock"
+    return os.path.join("data", "db-init.lock")
+
+@asynccontextmanager
+async def _init_lock(path: str | None) -> AsyncIterator[None]:
+    if fcntl is None or path is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+async def init_db(engine: AsyncEngine) -> List[int]:
+    """Create missing tables and apply pending migrations; returns the versions applied."""
+    async with _init_lock(lock_path(engine.url)):
+        async with engine.begin() as conn:
+            if await conn.run_sync(schema_current):
+                return []
+            await conn.run_sync(Base.metadata.create_all)
+            return await conn.run_sync(run_migrations)
+
+async def _main():
+    from dotenv import load_dotenv
+    from .session import init_engine, dispose_engine
 
-def get_engine():
-    url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/app.db")
-    return create_async_engine(url, echo=False)
+    load_dotenv()
+    applied = await init_db(init_engine())
+    await dispose_engine()
+    print(f"applied migrations: {applied}" if applied else "schema is current")
 
-async def init_db():
-    engine = get_engine()
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    await engine.dispose()
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,177 @@
+"""Lightweight, versioned schema migrations.
+
+`Base.metadata.create_all` only creates missing tables, so changes to existing
+tables (new indexes, constraints, backfills) go here. Each migration runs once,
+in order, inside the init_db transaction and is recorded in `schema_version`.
+Migrations must also be safe on a database that create_all just built at the
+latest schema (use IF [NOT] EXISTS / checkfirst).
+"""
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from .models import ActivityDaily, Base, ChatMemory, SchemaVersion, SkillAlias, SkillBaseline, SkillCatalog, SkillReview, StoredPracticePlan
+from .skill_catalog import normalize, spelling_key
+
+SKILL_TABLES = ("skills", "skill_reviews", "skill_baselines")
+
+def _create_indexes(conn: Connection, table: str, *names: str):
+    for idx in Base.metadata.tables[table].indexes:
+        if idx.name in names:
+            idx.create(conn, checkfirst=True)
+
+def _keyed_on_names(conn: Connection, table: str) -> bool:
+    """`table` still has the skill name string column (before migration 7)."""
+    insp = inspect(conn)
+    return insp.has_table(table) and "skill_id" in {c["name"] for c in insp.get_columns(table)}
+
+def _intern_skill_ids(conn: Connection):
+    """Rebuild the skill tables that are still keyed on name strings around skill_catalog ids.
+
+    Names are normalized; spellings with the same spelling_key share one catalog
+    row (named after the most used one, the others become aliases), and the
+    per-user rows they leave in `skills` / `skill_baselines` are merged, keeping
+    the most recently reviewed. Names that normalize to nothing are dropped.
+    """
+    tables = [t for t in SKILL_TABLES if _keyed_on_names(conn, t)]
+    if not tables:
+        return
+    SkillCatalog.__table__.create(conn, checkfirst=True)
+    SkillAlias.__table__.create(conn, checkfirst=True)
+    uses: Counter = Counter()
+    for t in tables:
+        uses.update(dict(conn.execute(text(f"SELECT skill_id, COUNT(*) FROM {t} GROUP BY skill_id")).all()))
+    groups: Dict[str, List[Tuple[str, str]]] = {}
+    for raw, _ in uses.most_common():
+        norm = normalize(raw or "")
+        if norm:
+            groups.setdefault(spelling_key(norm), []).append((raw, norm))
+    known = set(conn.execute(select(SkillCatalog.key)).scalars())
+    new = [{"name": spellings[0][1], "key": key} for key, spellings in groups.items() if key not in known]
+    if new:
+        conn.execute(insert(SkillCatalog), new)
+    ids = dict(conn.execute(select(SkillCatalog.key, SkillCatalog.id)).all())
+    names = set(conn.execute(select(SkillCatalog.name)).scalars()) | set(conn.execute(select(SkillAlias.alias)).scalars())
+    aliases = {norm: ids[key] for key, spellings in groups.items() for _, norm in spellings if norm not in names}
+    if aliases:
+        conn.execute(insert(SkillAlias), [{"alias": a, "skill_int_id": i} for a, i in aliases.items()])
+
+    conn.execute(text("CREATE TEMPORARY TABLE skill_id_map (raw VARCHAR PRIMARY KEY, id INTEGER NOT NULL)"))
+    conn.execute(text("INSERT INTO skill_id_map (raw, id) VALUES (:raw, :id)"),
+                 [{"raw": raw, "id": ids[key]} for key, spellings in groups.items() for raw, _ in spellings])
+    for t in tables:
+        for idx in inspect(conn).get_indexes(t):
+            conn.execute(text(f"DROP INDEX IF EXISTS {idx['name']}"))
+        conn.execute(text(f"ALTER TABLE {t} RENAME TO {t}_old"))
+        table = Base.metadata.tables[t]
+        table.create(conn)
+        cols = ", ".join(c.name for c in table.columns if c.name != "skill_int_id")
+        src = ", ".join(f"o.{c.name}" for c in table.columns if c.name != "skill_int_id")
+        rows = f"SELECT {src}, m.id AS skill_int_id FROM {t}_old o JOIN skill_id_map m ON m.raw = o.skill_id"
+        if t != "skill_reviews":
+            rows = (f"SELECT {cols}, skill_int_id FROM (SELECT {src}, m.id AS skill_int_id, ROW_NUMBER() OVER ("
+                    "PARTITION BY o.user_id, m.id ORDER BY o.last_seen IS NULL, o.last_seen DESC, o.id DESC) AS rn "
+                    f"FROM {t}_old o JOIN skill_id_map m ON m.raw = o.skill_id) merged WHERE rn = 1")
+        conn.execute(text(f"INSERT INTO {t} ({cols}, skill_int_id) {rows}"))
+        conn.execute(text(f"DROP TABLE {t}_old"))
+        if conn.dialect.name == "postgresql":  # the copied ids bypassed the new table's sequence
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), COALESCE(MAX(id), 1)) FROM {t}"))
+    conn.execute(text("DROP TABLE skill_id_map"))
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("ANALYZE"))
+
+def _m1_skills_unique(conn: Connection):
+    col = "skill_id" if _keyed_on_names(conn, "skills") else "skill_int_id"
+    # fold duplicate rows (possible before the unique index existed)
+    conn.execute(text(
+        f"DELETE FROM skills WHERE id NOT IN (SELECT MAX(id) FROM skills GROUP BY user_id, {col})"
+    ))
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_skills_user_skill ON skills (user_id, {col})"))
+
+def _m2_composite_indexes(conn: Connection):
+    _create_indexes(conn, "chat_turns", "ix_chat_turns_user_id_id")
+    _create_indexes(conn, "activity_logs", "ix_activity_logs_user_ts")
+    _create_indexes(conn, "skills", "ix_skills_user_next_due")
+    # single-column indexes now covered by a composite prefix (or unused)
+    for name in ("ix_chat_turns_user_id", "ix_activity_logs_user_id", "ix_skills_user_id", "ix_skills_skill_id"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+def _m3_activity_rollups(conn: Connection):
+    cols = {c["name"] for c in inspect(conn).get_columns("user_profiles")}
+    if "timezone" not in cols:
+        conn.execute(text("ALTER TABLE user_profiles ADD COLUMN timezone VARCHAR NOT NULL DEFAULT 'UTC'"))
+    ActivityDaily.__table__.create(conn, checkfirst=True)
+    # every existing profile is on UTC at this point, so the SQL date() is the local day
+    if not conn.execute(select(func.count()).select_from(ActivityDaily)).scalar():
+        conn.execute(text(
+            "INSERT INTO activity_daily (user_id, day, context, minutes, turns, last_ts) "
+            "SELECT user_id, date(ts), context, SUM(minutes), SUM(turns), MAX(ts) "
+            "FROM activity_logs GROUP BY user_id, date(ts), context"
+        ))
+
+def _m4_skills_strength_index(conn: Connection):
+    _create_indexes(conn, "skills", "ix_skills_user_strength")
+    if conn.dialect.name == "sqlite":
+        # give the planner real statistics so it picks the ordered index scans
+        conn.execute(text("ANALYZE"))
+
+def _m5_skill_reviews(conn: Connection):
+    SkillReview.__table__.create(conn, checkfirst=True)
+    SkillBaseline.__table__.create(conn, checkfirst=True)
+    # the new tables are keyed on skill_catalog ids; bring an older `skills` table to the same layout first
+    _intern_skill_ids(conn)
+    # skills that predate the review log keep their current state as replay seed
+    conn.execute(text(
+        "INSERT INTO skill_baselines (user_id, skill_int_id, strength, ease, interval_days, last_seen, next_due, streak, mistakes) "
+        "SELECT user_id, skill_int_id, strength, ease, interval_days, last_seen, next_due, streak, mistakes FROM skills "
+        "WHERE NOT EXISTS (SELECT 1 FROM skill_baselines b WHERE b.user_id = skills.user_id AND b.skill_int_id = skills.skill_int_id)"
+    ))
+
+def _m6_chat_memory(conn: Connection):
+    ChatMemory.__table__.create(conn, checkfirst=True)
+
+def _m7_skill_catalog(conn: Connection):
+    SkillCatalog.__table__.create(conn, checkfirst=True)
+    SkillAlias.__table__.create(conn, checkfirst=True)
+    _intern_skill_ids(conn)
+
+def _m8_practice_plans(conn: Connection):
+    StoredPracticePlan.__table__.create(conn, checkfirst=True)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "skills_user_skill_unique", _m1_skills_unique),
+    (2, "composite_indexes", _m2_composite_indexes),
+    (3, "activity_rollups", _m3_activity_rollups),
+    (4, "skills_strength_index", _m4_skills_strength_index),
+    (5, "skill_reviews", _m5_skill_reviews),
+    (6, "chat_memory", _m6_chat_memory),
+    (7, "skill_catalog", _m7_skill_catalog),
+    (8, "practice_plans", _m8_practice_plans),
+]
+
+def schema_current(conn: Connection) -> bool:
+    """Every table exists and every migration is recorded (nothing for init_db to do)."""
+    tables = set(inspect(conn).get_table_names())
+    if not tables.issuperset(Base.metadata.tables):
+        return False
+    done = set(conn.execute(select(SchemaVersion.version)).scalars())
+    return done.issuperset(version for version, _, _ in MIGRATIONS)
+
+def run_migrations(conn: Connection) -> List[int]:
+    """Apply pending migrations; returns the versions applied."""
+    SchemaVersion.__table__.create(conn, checkfirst=True)
+    done = set(conn.execute(select(SchemaVersion.version)).scalars())
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        fn(conn)
+        conn.execute(SchemaVersion.__table__.insert().values(
+            version=version, name=name, applied_at=datetime.now(tz=timezone.utc)
+        ))
+        applied.append(version)
+    return applied
@@ -1,7 +1,7 @@
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, Float, DateTime, Text, Boolean
+from sqlalchemy import String, Integer, Float, Date, DateTime, Text, Boolean, ForeignKey, Index
 
 class Base(DeclarativeBase):
     pass
@@ -20,16 +20,40 @@ class UserProfile(Base):
     daily_minutes_goal: Mapped[int] = mapped_column(Integer, default=10)
     weekly_minutes_goal: Mapped[int] = mapped_column(Integer, default=70)
     focus_contexts: Mapped[str] = mapped_column(String, default="Airport,Restaurant")  # comma-separated
+    # IANA name; defines the user's day boundaries for progress
+    timezone: Mapped[str] = mapped_column(String, default="UTC", server_default="UTC")
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
+class SkillCatalog(Base):
+    """Interned skill names (see db/skill_catalog.py); skill rows store the integer id."""
+    __tablename__ = "skill_catalog"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String, unique=True)  # canonical, e.g. "phrase:check_in"
+    key: Mapped[str] = mapped_column(String, unique=True)   # name without "_", so "phrase:checkin" finds it
+
+class SkillAlias(Base):
+    """Other spellings of a catalog skill."""
+    __tablename__ = "skill_aliases"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    alias: Mapped[str] = mapped_column(String, unique=True)
+    skill_int_id: Mapped[int] = mapped_column(ForeignKey("skill_catalog.id"))
+
 class Skill(Base):
     __tablename__ = "skills"
+    __table_args__ = (
+        # one scheduling row per (user, skill); target of the bulk upsert in routes/chat.py
+        Index("uq_skills_user_skill", "user_id", "skill_int_id", unique=True),
+        # due queue: WHERE user_id = ? ORDER BY next_due
+        Index("ix_skills_user_next_due", "user_id", "next_due"),
+        # weakest not-yet-due: WHERE user_id = ? AND next_due > ? ORDER BY strength
+        Index("ix_skills_user_strength", "user_id", "strength", "next_due"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str] = mapped_column(String, index=True)
-    skill_id: Mapped[str] = mapped_column(String, index=True)
+    user_id: Mapped[str] = mapped_column(String)
+    skill_int_id: Mapped[int] = mapped_column(ForeignKey("skill_catalog.id"))
 
     strength: Mapped[float] = mapped_column(Float, default=0.3)
     ease: Mapped[float] = mapped_column(Float, default=2.0)
@@ -41,19 +65,90 @@ class Skill(Base):
     streak: Mapped[int] = mapped_column(Integer, default=0)
     mistakes: Mapped[int] = mapped_column(Integer, default=0)
 
+class SkillReview(Base):
+    """Append-only review history; `skills` is a projection of it (see adaptive/replay.py)."""
+    __tablename__ = "skill_reviews"
+    __table_args__ = (Index("ix_skill_reviews_user_skill", "user_id", "skill_int_id", "id"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String)
+    skill_int_id: Mapped[int] = mapped_column(ForeignKey("skill_catalog.id"))
+    quality: Mapped[int] = mapped_column(Integer)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class SkillBaseline(Base):
+    """Skill state captured when review history started; replay starts from here."""
+    __tablename__ = "skill_baselines"
+    __table_args__ = (Index("uq_skill_baselines_user_skill", "user_id", "skill_int_id", unique=True),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String)
+    skill_int_id: Mapped[int] = mapped_column(ForeignKey("skill_catalog.id"))
+    strength: Mapped[float] = mapped_column(Float)
+    ease: Mapped[float] = mapped_column(Float)
+    interval_days: Mapped[int] = mapped_column(Integer)
+    last_seen: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    next_due: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    streak: Mapped[int] = mapped_column(Integer)
+    mistakes: Mapped[int] = mapped_column(Integer)
+
+class StoredPracticePlan(Base):
+    """Precomputed /api/practice/next response per (user, context, limit) (see practice_plans.py)."""
+    __tablename__ = "practice_plans"
+    __table_args__ = (Index("uq_practice_plans_user_ctx_limit", "user_id", "context", "plan_limit", unique=True),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String)
+    context: Mapped[str] = mapped_column(String)
+    plan_limit: Mapped[int] = mapped_column(Integer)
+    body: Mapped[str] = mapped_column(Text)  # the JSON response
+    # earliest future next_due when computed (the due/weak split changes then); NULL = none scheduled
+    valid_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    computed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))  # when its skill read started
+    invalidated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
 class ChatTurn(Base):
     __tablename__ = "chat_turns"
+    # history: WHERE user_id = ? ORDER BY id DESC LIMIT n
+    __table_args__ = (Index("ix_chat_turns_user_id_id", "user_id", "id"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str] = mapped_column(String, index=True)
+    user_id: Mapped[str] = mapped_column(String)
     role: Mapped[str] = mapped_column(String)  # user/assistant
     content: Mapped[str] = mapped_column(Text)
     ts: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
+class ChatMemory(Base):
+    """Rolling summary of the ChatTurns that no longer fit the prompt window (see tutor/memory.py)."""
+    __tablename__ = "chat_memory"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, unique=True)
+    summary: Mapped[str] = mapped_column(Text, default="")
+    covered_turn_id: Mapped[int] = mapped_column(Integer, default=0)  # last ChatTurn.id folded into summary
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
+    # progress: WHERE user_id = ? AND ts >= ?
+    __table_args__ = (Index("ix_activity_logs_user_ts", "user_id", "ts"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str] = mapped_column(String, index=True)
+    user_id: Mapped[str] = mapped_column(String)
     context: Mapped[str] = mapped_column(String, default="Unknown")
     minutes: Mapped[int] = mapped_column(Integer, default=0)
     turns: Mapped[int] = mapped_column(Integer, default=0)
     ts: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class ActivityDaily(Base):
+    """Per-user, per-local-day, per-context activity totals (kept in step with ActivityLog)."""
+    __tablename__ = "activity_daily"
+    __table_args__ = (Index("uq_activity_daily_user_day_ctx", "user_id", "day", "context", unique=True),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String)
+    day: Mapped[date] = mapped_column(Date)  # in the user's timezone
+    context: Mapped[str] = mapped_column(String, default="Unknown")
+    minutes: Mapped[int] = mapped_column(Integer, default=0)
+    turns: Mapped[int] = mapped_column(Integer, default=0)
+    last_ts: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class SchemaVersion(Base):
+    """Applied migrations (see db/migrations.py)."""
+    __tablename__ = "schema_version"
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String)
+    applied_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,261 @@
+"""Retention for the append-only tables (RETENTION=1 runs it in the background).
+
+Per-table policies:
+- chat_turns: turns older than RETENTION_TURNS_DAYS are moved into compressed
+  archive segments (db/archive.py) that `/api/history` keeps paging into; the
+  newest RETENTION_TURNS_KEEP turns of every user always stay in the database
+  (the prompt memory and first history pages read them).
+  RETENTION_TURNS_ARCHIVE=0 deletes them instead.
+- activity_logs: raw rows older than RETENTION_ACTIVITY_DAYS are deleted;
+  progress reads `activity_daily`, which already counts them.
+A policy with days <= 0 is off.
+
+Rows go in chunks of at most RETENTION_BATCH, one short transaction each, with
+RETENTION_PAUSE_MS between chunks so chat writes are never queued behind a long
+delete. Afterwards SQLite's free pages are handed back to the filesystem with
+incremental VACUUM, so the file shrinks instead of only stopping to grow.
+
+    python -m app.db.retention run      # one pass now
+    python -m app.db.retention vacuum   # once, for files created before auto_vacuum=INCREMENTAL: full VACUUM
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import takewhile
+from typing import Dict, List
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from ..env import env_int
+from ..metrics import Counter, span
+from . import archive
+from .models import ChatTurn
+from .rollups import compact
+
+log = logging.getLogger(__name__)
+
+RETENTION_ROWS = Counter("retention_rows_total", "Rows removed from the database by retention.", ("table", "action"))
+RETENTION_RUNS = Counter("retention_runs_total", "Retention passes by result.", ("result",))
+
+def enabled() -> bool:
+    return os.getenv("RETENTION", "0").strip().lower() in ("1", "true", "yes")
+
+@dataclass(frozen=True)
+class Policy:
+    keep_days: int
+    keep_recent: int = 0  # per user, regardless of age
+    archive: bool = False
+
+def policies() -> Dict[str, Policy]:
+    return {
+        "chat_turns": Policy(
+            keep_days=env_int("RETENTION_TURNS_DAYS", 90),
+            keep_recent=max(0, env_int("RETENTION_TURNS_KEEP", 200)),
+            archive=os.getenv("RETENTION_TURNS_ARCHIVE", "1").strip().lower() not in ("0", "false", "no"),
+        ),
+        "activity_logs": Policy(keep_days=env_int("RETENTION_ACTIVITY_DAYS", 30)),
+    }
+
+def _aware(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+class Retention:
+    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession]):
+        self.sessionmaker = sessionmaker
+        self.policies = policies()
+        self.batch = max(1, env_int("RETENTION_BATCH", 1000))
+        self.pause = max(0, env_int("RETENTION_PAUSE_MS", 50)) / 1000.0
+        self.interval = max(1, env_int("RETENTION_INTERVAL_S", 3600))
+        self.vacuum_pages = max(1, env_int("RETENTION_VACUUM_PAGES", 1000))
+        self.max_queued = max(self.batch, env_int("RETENTION_MAX_QUEUED", 20000))  # rows held for segments
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="retention")
+
+    async def aclose(self):
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_once()
+            except Exception:
+                RETENTION_RUNS.inc(result="error")
+                log.exception("retention pass failed; retrying in %ss", self.interval)
+
+    async def run_once(self) -> Dict[str, int]:
+        """One pass over every policy, then incremental VACUUM; returns row/page counts."""
+        stats = {"turns_archived": 0, "turns_deleted": 0, "activity_deleted": 0, "pages_freed": 0}
+        with span("db.retention"):
+            turns = self.policies["chat_turns"]
+            if turns.keep_days > 0:
+                moved = await self.purge_turns(turns)
+                stats["turns_archived" if turns.archive else "turns_deleted"] = moved
+            activity = self.policies["activity_logs"]
+            if activity.keep_days > 0:
+                async with self.sessionmaker() as db:
+                    stats["activity_deleted"] = await compact(db, keep_days=activity.keep_days, batch=self.batch)
+                RETENTION_ROWS.inc(stats["activity_deleted"], table="activity_logs", action="deleted")
+            async with self.sessionmaker() as db:
+                stats["pages_freed"] = await incremental_vacuum(db, self.vacuum_pages, self.pause)
+        RETENTION_RUNS.inc(result="ok")
+        log.info("retention: %s", stats)
+        return stats
+
+    async def purge_turns(self, policy: Policy) -> int:
+        """Archive (or delete) turns past the policy, oldest first, in short transactions."""
+        cutoff = datetime.now(tz=timezone.utc) - timedelta(days=policy.keep_days)
+        cols = (ChatTurn.id, ChatTurn.user_id, ChatTurn.role, ChatTurn.content, ChatTurn.ts)
+        floors: Dict[str, int] = {}  # user -> lowest id among their newest keep_recent turns
+        # archived turns are grouped per user, so a segment holds up to a full batch rather than a chunk's share
+        queue: Dict[str, List[dict]] = defaultdict(list)
+        after, moved, queued, done = 0, 0, 0, False
+        while not done:
+            async with self.sessionmaker() as db:
+                q = select(*cols).where(ChatTurn.id > after).order_by(ChatTurn.id).limit(self.batch)
+                rows = (await db.execute(q)).mappings().all()
+                # ids follow time, so the scan ends at the first turn inside the window
+                old = list(takewhile(lambda r: _aware(r["ts"]) < cutoff, rows))
+                done = len(old) < self.batch
+                after = rows[-1]["id"] if rows else after
+                for user_id in {r["user_id"] for r in old} - floors.keys():
+                    floors[user_id] = await self._floor(db, user_id, policy.keep_recent)
+                for r in old:
+                    if r["id"] < floors[r["user_id"]]:
+                        queue[r["user_id"]].append(r)
+                        queued += 1
+                ready = [u for u, q_rows in queue.items()
+                         if done or not policy.archive or queued >= self.max_queued or len(q_rows) >= self.batch]
+                for user_id in ready:
+                    rows = queue.pop(user_id)
+                    queued -= len(rows)
+                    for i in range(0, len(rows), self.batch):
+                        moved += await self._remove(db, user_id, rows[i:i + self.batch], policy.archive)
+                        await asyncio.sleep(self.pause)
+            await asyncio.sleep(self.pause)
+        return moved
+
+    @staticmethod
+    async def _floor(db: AsyncSession, user_id: str, keep: int) -> int:
+        if keep <= 0:
+            return 1 << 62
+        q = (select(ChatTurn.id).where(ChatTurn.user_id == user_id).order_by(ChatTurn.id.desc())
+             .offset(keep - 1).limit(1))
+        floor = (await db.execute(q)).scalar()
+        return floor if floor is not None else 0  # fewer than `keep` turns: keep them all
+
+    async def _remove(self, db: AsyncSession, user_id: str, rows: List[dict], to_archive: bool) -> int:
+        """Archive then delete one user's rows in one transaction."""
+        async with archive.lock:  # a history clear in between must not be undone by a late segment
+            ids = [r["id"] for r in rows]
+            present = set((await db.execute(select(ChatTurn.id).where(ChatTurn.id.in_(ids)))).scalars())
+            rows = [r for r in rows if r["id"] in present]
+            if not rows:
+                return 0
+            if to_archive:
+                await asyncio.to_thread(_archive_user, user_id, rows)
+            await db.execute(delete(ChatTurn).where(ChatTurn.id.in_([r["id"] for r in rows])))
+            await db.commit()
+        RETENTION_ROWS.inc(len(rows), table="chat_turns", action="archived" if to_archive else "deleted")
+        return len(rows)
+
+async def clear_user_turns(db: AsyncSession, user_id: str) -> int:
+    """Delete all of a user's turns, archived ones included, in RETENTION_BATCH chunks (one commit each)."""
+    batch, removed = max(1, env_int("RETENTION_BATCH", 1000)), 0
+    async with archive.lock:
+        while True:
+            q = select(ChatTurn.id).where(ChatTurn.user_id == user_id).order_by(ChatTurn.id).limit(batch)
+            ids = (await db.execute(q)).scalars().all()
+            if not ids:
+                break
+            await db.execute(delete(ChatTurn).where(ChatTurn.id.in_(ids)))
+            await db.commit()
+            removed += len(ids)
+        await asyncio.to_thread(archive.remove_user, user_id)
+    return removed
+
+def _archive_user(user_id: str, rows: List[dict]):
+    done = archive.archived_upto(user_id)  # rows a crashed pass already wrote are only deleted
+    rows = [r for r in rows if r["id"] > done]
+    if rows:
+        archive.write_segment(user_id, rows)
+
+async def incremental_vacuum(db: AsyncSession, pages: int, pause: float) -> int:
+    """Release SQLite free pages, `pages` per step; no-op elsewhere or without auto_vacuum=INCREMENTAL."""
+    if db.get_bind().dialect.name != "sqlite" or (await db.execute(text("PRAGMA auto_vacuum"))).scalar() != 2:
+        return 0
+    freed = 0
+    while True:
+        free = (await db.execute(text("PRAGMA freelist_count"))).scalar()
+        await db.commit()
+        if not free:
+            return freed
+        # each step of this statement frees one page and the drivers stop after the first; executescript runs it out
+        raw = await (await db.connection()).get_raw_connection()
+        await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({min(free, pages)});")
+        left = (await db.execute(text("PRAGMA freelist_count"))).scalar()
+        if left >= free:
+            return freed
+        freed += free - left
+        await asyncio.sleep(pause)
+
+async def full_vacuum(engine: AsyncEngine):
+    """Switch an existing SQLite file to auto_vacuum=INCREMENTAL (rewrites the whole file)."""
+    if engine.dialect.name != "sqlite":
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        await conn.exec_driver_sql("VACUUM")
+
+_retention: Retention | None = None
+
+def start_retention(sessionmaker: async_sessionmaker[AsyncSession]) -> Retention | None:
+    global _retention
+    if _retention is None and enabled():
+        _retention = Retention(sessionmaker)
+        _retention.start()
+    return _retention
+
+async def stop_retention():
+    global _retention
+    if _retention is not None:
+        job, _retention = _retention, None
+        await job.aclose()
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from .init_db import init_db
+    from .session import init_engine, dispose_engine, get_sessionmaker
+
+    load_dotenv()
+    engine = init_engine()
+    await init_db(engine)
+    if args.cmd == "vacuum":
+        await full_vacuum(engine)
+        print("vacuumed; auto_vacuum=INCREMENTAL")
+    else:
+        print(await Retention(get_sessionmaker()).run_once())
+    await dispose_engine()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Chat transcript / activity log retention")
+    ap.add_argument("cmd", choices=["run", "vacuum"])
+    asyncio.run(_main(ap.parse_args()))
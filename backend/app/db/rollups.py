@@ -0,0 +1,148 @@
+"""Daily activity rollups.
+
+Every activity write goes to the raw `activity_logs` journal *and* increments
+the matching `activity_daily` row, so progress reads a handful of rollup rows
+instead of aggregating the raw log. Days are the user's local days; a
+timezone change re-buckets the user's days still in the raw log (see
+rebuild_user), older compacted days keep the timezone they were recorded in.
+
+Maintenance job (run from backend/):
+    python -m app.db.rollups backfill            # rebuild rollups from the raw log
+    python -m app.db.rollups compact --keep-days 30   # drop raw rows already rolled up
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import case, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ActivityDaily, ActivityLog, UserProfile
+from .session import dialect_insert
+from ..user_cache import get_user_cache
+
+def zone(name: str | None) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+def local_day(ts: datetime, tz: ZoneInfo) -> date:
+    if ts.tzinfo is None:  # SQLite hands back naive UTC datetimes
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(tz).date()
+
+async def user_zone(db: AsyncSession, user_id: str) -> ZoneInfo:
+    profile = get_user_cache().profile(user_id)
+    if profile is not None:
+        return zone(profile.timezone)
+    name = (await db.execute(select(UserProfile.timezone).where(UserProfile.user_id == user_id))).scalar()
+    return zone(name)
+
+async def add_to_rollup(db: AsyncSession, rows: Iterable[Dict]):
+    """Increment rollups; rows are dicts of user_id, day, context, minutes, turns, last_ts."""
+    rows = list(rows)
+    if not rows:
+        return
+    t = ActivityDaily.__table__
+    stmt = dialect_insert(db, ActivityDaily).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.user_id, t.c.day, t.c.context],
+        set_={
+            "minutes": t.c.minutes + stmt.excluded.minutes,
+            "turns": t.c.turns + stmt.excluded.turns,
+            "last_ts": case((stmt.excluded.last_ts > t.c.last_ts, stmt.excluded.last_ts), else_=t.c.last_ts),
+        },
+    )
+    await db.execute(stmt)
+
+async def record_activity(db: AsyncSession, user_id: str, context: str, minutes: int, turns: int, ts: datetime):
+    """Append to the raw log and bump the day's rollup (caller commits)."""
+    db.add(ActivityLog(user_id=user_id, context=context, minutes=minutes, turns=turns, ts=ts))
+    day = local_day(ts, await user_zone(db, user_id))
+    await add_to_rollup(db, [dict(user_id=user_id, day=day, context=context, minutes=minutes, turns=turns, last_ts=ts)])
+
+async def rebuild_user(db: AsyncSession, user_id: str, tz: ZoneInfo, old_tz: ZoneInfo | None = None,
+                       batch: int = 5000) -> bool:
+    """Re-bucket one user's rollups from the raw log by `tz` (caller commits).
+
+    Only days still covered by raw rows (in `old_tz`, the one the rollups were
+    built with, and in `tz`) are replaced, so rollups for days that were already
+    compacted away are kept. False when the user has no raw rows.
+    """
+    agg: Dict[Tuple[date, str], list] = defaultdict(lambda: [0, 0, None])
+    first_ts = None
+    last_id = 0
+    while True:
+        rows = (await db.execute(
+            select(ActivityLog.id, ActivityLog.context, ActivityLog.minutes, ActivityLog.turns, ActivityLog.ts)
+            .where(ActivityLog.user_id == user_id, ActivityLog.id > last_id)
+            .order_by(ActivityLog.id).limit(batch)
+        )).all()
+        if not rows:
+            break
+        for r in rows:
+            first_ts = r.ts if first_ts is None or r.ts < first_ts else first_ts
+            a = agg[(local_day(r.ts, tz), r.context)]
+            a[0] += r.minutes
+            a[1] += r.turns
+            a[2] = r.ts if a[2] is None or r.ts > a[2] else a[2]
+        last_id = rows[-1].id
+    if not agg:
+        return False
+    first_day = min(local_day(first_ts, tz), local_day(first_ts, old_tz or tz))
+    await db.execute(delete(ActivityDaily).where(ActivityDaily.user_id == user_id, ActivityDaily.day >= first_day))
+    await add_to_rollup(db, [
+        dict(user_id=user_id, day=day, context=ctx, minutes=m, turns=n, last_ts=ts)
+        for (day, ctx), (m, n, ts) in agg.items()
+    ])
+    return True
+
+async def backfill(db: AsyncSession, batch: int = 5000) -> int:
+    """Rebuild rollups from the raw log using each user's current timezone (see rebuild_user).
+
+    Returns the number of users rebuilt.
+    """
+    users = (await db.execute(select(ActivityLog.user_id).distinct())).scalars().all()
+    for user_id in users:
+        if await rebuild_user(db, user_id, await user_zone(db, user_id), batch=batch):
+            await db.commit()
+    return len(users)
+
+async def compact(db: AsyncSession, keep_days: int = 30, batch: int = 5000) -> int:
+    """Delete raw rows older than keep_days; they are already in the rollups."""
+    cutoff = datetime.now(tz=timezone.utc) - timedelta(days=keep_days)
+    removed = 0
+    while True:
+        ids = (await db.execute(
+            select(ActivityLog.id).where(ActivityLog.ts < cutoff).order_by(ActivityLog.id).limit(batch)
+        )).scalars().all()
+        if not ids:
+            return removed
+        await db.execute(delete(ActivityLog).where(ActivityLog.id.in_(ids)))
+        await db.commit()
+        removed += len(ids)
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from .init_db import init_db
+    from .session import init_engine, dispose_engine, get_sessionmaker
+
+    load_dotenv()
+    await init_db(init_engine())
+    async with get_sessionmaker()() as db:
+        if args.cmd == "backfill":
+            print(f"rebuilt rollups for {await backfill(db)} users")
+        else:
+            print(f"removed {await compact(db, keep_days=args.keep_days)} raw activity rows")
+    await dispose_engine()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Activity rollup maintenance")
+    ap.add_argument("cmd", choices=["backfill", "compact"])
+    ap.add_argument("--keep-days", type=int, default=30)
+    asyncio.run(_main(ap.parse_args()))
@@ -1,8 +1,119 @@
 from __future__ import annotations
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import AsyncIterator
 
-def make_sessionmaker():
-    url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/app.db")
-    engine = create_async_engine(url, echo=False)
-    return engine, async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+
+from ..env import env_int
+from ..metrics import DB_POOL_WAIT, Gauge, span
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./data/app.db"
+
+# App-scoped engine + sessionmaker (created in the FastAPI lifespan, see main.py)
+_engine: AsyncEngine | None = None
+_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
+
+def database_url() -> str:
+    return os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    """Tune every new SQLite connection for concurrent readers + a single writer."""
+    cur = dbapi_conn.cursor()
+    # first: switching a new file to WAL takes a lock that other workers' connections may hold
+    cur.execute(f"PRAGMA busy_timeout={env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    # only takes effect on a new file (before the first table); lets retention shrink it (db/retention.py)
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA mmap_size={env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}")
+    # negative => size in KiB rather than pages
+    cur.execute(f"PRAGMA cache_size=-{env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024)}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.close()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited (db_pool_checkout_wait_seconds)."""
+
+    def _do_get(self):
+        with DB_POOL_WAIT.time():
+            return super()._do_get()
+
+
+def _checked_out() -> float:
+    checkedout = getattr(_engine.pool, "checkedout", None) if _engine is not None else None
+    return checkedout() if checkedout else 0
+
+
+DB_POOL_IN_USE = Gauge("db_pool_checked_out", "Pooled DB connections currently checked out.", fn=_checked_out)
+
+
+def create_engine(url: str | None = None) -> AsyncEngine:
+    url = url or database_url()
+    kwargs = {"echo": False}
+    # In-memory SQLite uses a StaticPool, which does not take sizing options.
+    # File-backed aiosqlite defaults to NullPool (a new connection + pragmas per
+    # checkout), so opt into a real queue pool for it as well.
+    if ":memory:" not in url:
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=env_int("DB_POOL_SIZE", 5),
+            max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+            pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+        )
+    engine = create_async_engine(url, **kwargs)
+    if is_sqlite(url):
+        event.listen(engine.sync_engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+def init_engine(url: str | None = None) -> AsyncEngine:
+    """Create the process-wide engine/sessionmaker. Called once from the app lifespan."""
+    global _engine, _sessionmaker
+    if _engine is None:
+        _engine = create_engine(url)
+        _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False, class_=AsyncSession)
+    return _engine
+
+
+async def dispose_engine():
+    global _engine, _sessionmaker
+    if _engine is not None:
+        if is_sqlite(str(_engine.url)):
+            # refresh planner statistics for tables whose size changed a lot
+            async with _engine.connect() as conn:
+                await conn.exec_driver_sql("PRAGMA optimize")
+        await _engine.dispose()
+    _engine = None
+    _sessionmaker = None
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    if _sessionmaker is None:
+        init_engine()
+    return _sessionmaker
+
+
+def dialect_insert(session: AsyncSession, table):
+    """INSERT construct with ON CONFLICT support for the session's backend."""
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency shared by every router (its lifetime is the "db.session" span)."""
+    with span("db.session"):
+        async with get_sessionmaker()() as session:
+            yield session
@@ -0,0 +1,111 @@
+"""Interned skill names: `skill_catalog` maps each skill to a small integer id.
+
+Skill rows (`skills`, `skill_reviews`, `skill_baselines`) store `skill_int_id`
+instead of repeating the name string in every row and index entry. Names are
+normalized before interning (`Phrase:Check-In` -> `phrase:check_in`), and a
+spelling that only differs in underscores (`phrase:checkin`) or is listed in
+`skill_aliases` resolves to the same id.
+
+Each process keeps the whole catalog in memory (`get_skill_interner()`, loaded
+by the app lifespan), so resolving the tags of a chat turn is a dict lookup.
+Unknown names are inserted in a short transaction of their own, before the
+turn writes anything, so an id never comes from a transaction that may still
+roll back; other workers find them with the same insert-or-select.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List
+
+from sqlalchemy import select
+
+from ..env import env_int
+from .models import SkillAlias, SkillCatalog
+
+_SEP = re.compile(r"[\s\-_./]+")
+
+def _slug(part: str) -> str:
+    return _SEP.sub("_", part.strip().lower()).strip("_")
+
+def normalize(name: str) -> str:
+    """Canonical spelling: lowercase, `kind:rest` with separators folded to "_"; "" if nothing is left."""
+    kind, sep, rest = name.partition(":")
+    if not sep:
+        return _slug(name)
+    kind, rest = _slug(kind), _slug(rest)
+    return f"{kind}:{rest}" if kind and rest else ""
+
+def spelling_key(norm: str) -> str:
+    """What near-duplicate spellings share (`phrase:check_in` and `phrase:checkin`)."""
+    return norm.replace("_", "")
+
+class SkillInterner:
+    """In-memory copy of the catalog: raw spelling -> id, id -> canonical name."""
+
+    def __init__(self, max_spellings: int | None = None):
+        self.max_spellings = max_spellings or env_int("SKILL_SPELLINGS_MAX", 50000)
+        self._ids: Dict[str, int] = {}      # raw spellings seen so far (capped)
+        self._aliases: Dict[str, int] = {}  # normalized alias -> id
+        self._keys: Dict[str, int] = {}     # spelling_key(name) -> id
+        self._names: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _add(self, skill_id: int, name: str, key: str):
+        self._names[skill_id] = name
+        self._keys[key] = skill_id
+
+    def lookup(self, raw: str) -> int | None:
+        skill_id = self._ids.get(raw)
+        if skill_id is None:
+            norm = normalize(raw)
+            skill_id = self._aliases.get(norm) or self._keys.get(spelling_key(norm))
+            if skill_id is not None and len(self._ids) < self.max_spellings:
+                self._ids[raw] = skill_id
+        return skill_id
+
+    def name(self, skill_id: int) -> str:
+        return self._names[skill_id]
+
+    async def load(self):
+        from .session import get_sessionmaker
+
+        async with get_sessionmaker()() as db:
+            for skill_id, name, key in (await db.execute(select(SkillCatalog.id, SkillCatalog.name, SkillCatalog.key))).all():
+                self._add(skill_id, name, key)
+            self._aliases.update((await db.execute(select(SkillAlias.alias, SkillAlias.skill_int_id))).all())
+
+    async def resolve(self, names: List[str]) -> Dict[str, int]:
+        """Ids for `names` (raw spellings), adding unknown ones to the catalog; unusable names are left out."""
+        from .session import dialect_insert, get_sessionmaker
+
+        out, missing = {}, {}
+        for raw in names:
+            skill_id = self.lookup(raw)
+            if skill_id is not None:
+                out[raw] = skill_id
+            elif norm := normalize(raw):
+                missing.setdefault(spelling_key(norm), norm)
+        if not missing:
+            return out
+        async with get_sessionmaker()() as db:
+            await db.execute(dialect_insert(db, SkillCatalog).values(
+                [{"name": norm, "key": key} for key, norm in missing.items()]
+            ).on_conflict_do_nothing())
+            rows = (await db.execute(
+                select(SkillCatalog.id, SkillCatalog.name, SkillCatalog.key).where(SkillCatalog.key.in_(missing))
+            )).all()
+            await db.commit()
+        for skill_id, name, key in rows:
+            self._add(skill_id, name, key)
+        out.update((raw, self._keys[spelling_key(normalize(raw))]) for raw in names if raw not in out and normalize(raw))
+        return out
+
+_interner: SkillInterner | None = None
+
+def get_skill_interner() -> SkillInterner:
+    """The process-wide catalog copy; the app lifespan loads it at startup."""
+    global _interner
+    if _interner is None:
+        _interner = SkillInterner()
+    return _interner
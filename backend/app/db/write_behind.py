@@ -0,0 +1,247 @@
+"""Write-behind buffer for append-only rows (chat turns, activity logs).
+
+Routes hand their `chat_turns` / `activity_logs` rows to an in-process buffer
+instead of committing them; a background task writes them in multi-row INSERTs
+(plus the matching `activity_daily` increments) once WRITE_BEHIND_BATCH rows
+are waiting or every WRITE_BEHIND_FLUSH_MS, in one commit per flush.
+
+- Backpressure: when WRITE_BEHIND_MAX_ROWS are buffered, writers wait for a
+  flush (up to WRITE_BEHIND_BLOCK_S, then WriteBehindFull -> HTTP 503).
+- Shutdown: the lifespan stops the flusher and writes whatever is left.
+  Rows still buffered when the process is killed outright are lost.
+- Read-your-writes: `with_pending` runs a read together with the caller's
+  buffered rows, serialized against flushes, so a row is seen exactly once.
+  This holds per process; multi-worker deployments need sticky routing by
+  user (or WRITE_BEHIND=0).
+
+When the buffer is not running (WRITE_BEHIND=0, scripts without the app
+lifespan) `append_turns` / `append_activity` write through the caller's session.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from collections import Counter as Tally, defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple, TypeVar
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..env import env_float, env_int
+from ..metrics import Counter, Gauge, Histogram, span
+from .models import ActivityLog, ChatTurn, UserProfile
+from .rollups import add_to_rollup, local_day, record_activity, zone
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+INSERT_BATCH = 2000  # rows per multi-row INSERT statement
+
+WB_FLUSHES = Counter("write_behind_flushes_total", "Write-behind flushes by result.", ("result",))
+WB_FLUSH_ROWS = Histogram("write_behind_flush_rows", "Rows written per write-behind flush.",
+                          buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+WB_BLOCKED = Counter("write_behind_blocked_total", "Writes that waited for a flush because the buffer was full.")
+WB_BUFFERED = Gauge("write_behind_buffered_rows", "Rows waiting to be written.", fn=lambda: _buffer.size if _buffer else 0)
+
+class WriteBehindFull(Exception):
+    """The buffer stayed full for WRITE_BEHIND_BLOCK_S (the database is not keeping up)."""
+
+def enabled() -> bool:
+    return os.getenv("WRITE_BEHIND", "1").strip().lower() not in ("0", "false", "no")
+
+class WriteBehind:
+    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession]):
+        self.sessionmaker = sessionmaker
+        self.max_rows = max(1, env_int("WRITE_BEHIND_MAX_ROWS", 10000))
+        self.batch_rows = max(1, min(self.max_rows, env_int("WRITE_BEHIND_BATCH", 500)))
+        self.interval = max(0.001, env_float("WRITE_BEHIND_FLUSH_MS", 200) / 1000.0)
+        self.block_timeout = env_float("WRITE_BEHIND_BLOCK_S", 5.0)
+        self._rows: Dict[type, List[Dict[str, Any]]] = {ChatTurn: [], ActivityLog: []}
+        self._flushing: Dict[type, List[Dict[str, Any]]] = {ChatTurn: [], ActivityLog: []}
+        self._users: Tally = Tally()  # user_id -> rows buffered or being flushed
+        self._size = 0
+        self._lock = asyncio.Lock()  # held by flushes and by reads that merge pending rows
+        self._space = asyncio.Condition()
+        self._kick = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    async def append(self, model: type, rows: List[Dict[str, Any]]):
+        """Buffer rows for `model` (ChatTurn or ActivityLog), waiting while the buffer is full."""
+        if self._size + len(rows) > self.max_rows and self._size:
+            WB_BLOCKED.inc()
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: not self._size or self._size + len(rows) <= self.max_rows),
+                        self.block_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    raise WriteBehindFull(f"{self._size} rows waiting to be written") from None
+        self._rows[model].extend(rows)
+        self._users.update(r["user_id"] for r in rows)
+        self._size += len(rows)
+        if self._size >= self.batch_rows:
+            self._kick.set()
+
+    def pending(self, user_id: str, model: type) -> List[Dict[str, Any]]:
+        """Rows for `user_id` not yet visible in the database, oldest first."""
+        if not self._users[user_id]:
+            return []
+        return [r for rows in (self._flushing[model], self._rows[model]) for r in rows if r["user_id"] == user_id]
+
+    async def with_pending(self, user_id: str, model: type, read: Callable[[], Awaitable[T]]) -> Tuple[T, List[Dict[str, Any]]]:
+        """`read()` plus the user's pending `model` rows, as one consistent snapshot."""
+        if not self._users[user_id]:
+            return await read(), []
+        async with self._lock:  # no flush can commit between the read and the snapshot
+            return await read(), self.pending(user_id, model)
+
+    async def discard(self, user_id: str, model: type):
+        """Drop the user's buffered rows (e.g. the history is being cleared)."""
+        async with self._lock:
+            rows = self._rows[model]
+            kept = [r for r in rows if r["user_id"] != user_id]
+            self._release([r for r in rows if r["user_id"] == user_id])
+            self._rows[model] = kept
+        async with self._space:
+            self._space.notify_all()
+
+    def _release(self, rows: Iterable[Dict[str, Any]]):
+        for r in rows:
+            self._size -= 1
+            self._users[r["user_id"]] -= 1
+            if not self._users[r["user_id"]]:
+                del self._users[r["user_id"]]
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in one transaction; returns the row count."""
+        async with self._lock:
+            batch = {model: rows for model, rows in self._rows.items() if rows}
+            if not batch:
+                return 0
+            for model in batch:
+                self._rows[model], self._flushing[model] = [], batch[model]
+            n = sum(len(rows) for rows in batch.values())
+            try:
+                with span("db.write_behind"):
+                    async with self.sessionmaker() as db:
+                        for model, rows in batch.items():
+                            for i in range(0, len(rows), INSERT_BATCH):
+                                await db.execute(insert(model).values(rows[i:i + INSERT_BATCH]))
+                        if ActivityLog in batch:
+                            await add_to_rollup(db, await _rollup_rows(db, batch[ActivityLog]))
+                        await db.commit()
+            except BaseException as e:
+                for model, rows in batch.items():  # put them back in front, keeping order
+                    self._rows[model] = rows + self._rows[model]
+                if not isinstance(e, Exception):
+                    raise  # cancelled: the rows stay buffered
+                WB_FLUSHES.inc(result="error")
+                log.exception("write-behind flush of %d rows failed; will retry", n)
+                return 0
+            finally:
+                for model in batch:
+                    self._flushing[model] = []
+            self._release(r for rows in batch.values() for r in rows)
+        WB_FLUSHES.inc(result="ok")
+        WB_FLUSH_ROWS.observe(n)
+        async with self._space:
+            self._space.notify_all()
+        return n
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._kick.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            if self._size and not await self.flush():
+                await asyncio.sleep(self.interval)  # flush failed: back off before retrying
+
+    async def aclose(self):
+        """Stop the background task and write out the remaining rows."""
+        if self._task is not None:
+            # let an in-progress flush finish rather than cancelling it mid-commit
+            self._closing = True
+            self._kick.set()
+            await self._task
+            self._task = None
+        for _ in range(3):
+            if not self._size:
+                return
+            await self.flush()
+        if self._size:
+            log.error("write-behind: %d rows could not be written at shutdown", self._size)
+
+async def _rollup_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """activity_daily increments for a batch of activity rows (one timezone lookup per batch)."""
+    users = {r["user_id"] for r in rows}
+    zones = dict((await db.execute(
+        select(UserProfile.user_id, UserProfile.timezone).where(UserProfile.user_id.in_(users))
+    )).all())
+    agg: Dict[Tuple[str, Any, str], list] = defaultdict(lambda: [0, 0, None])
+    for r in rows:
+        a = agg[(r["user_id"], local_day(r["ts"], zone(zones.get(r["user_id"]))), r["context"])]
+        a[0] += r["minutes"]
+        a[1] += r["turns"]
+        a[2] = r["ts"] if a[2] is None or r["ts"] > a[2] else a[2]
+    return [dict(user_id=u, day=day, context=ctx, minutes=m, turns=n, last_ts=ts)
+            for (u, day, ctx), (m, n, ts) in agg.items()]
+
+_buffer: WriteBehind | None = None
+
+def get_write_behind() -> WriteBehind | None:
+    """The running buffer, or None when rows are written through."""
+    return _buffer
+
+def start_write_behind(sessionmaker: async_sessionmaker[AsyncSession]) -> WriteBehind | None:
+    global _buffer
+    if _buffer is None and enabled():
+        _buffer = WriteBehind(sessionmaker)
+        _buffer.start()
+    return _buffer
+
+async def stop_write_behind():
+    global _buffer
+    if _buffer is not None:
+        buf, _buffer = _buffer, None  # later writes go straight to the database
+        await buf.aclose()
+
+async def append_turns(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """Queue ChatTurn rows (dicts of user_id, role, content, ts), or add them to `db` if not buffering."""
+    if _buffer is None:
+        db.add_all(ChatTurn(**r) for r in rows)
+    else:
+        await _buffer.append(ChatTurn, rows)
+
+async def append_activity(db: AsyncSession, user_id: str, context: str, minutes: int, turns: int, ts: datetime):
+    """Queue an activity row (rolled up when flushed), or record it through `db` if not buffering."""
+    if _buffer is None:
+        await record_activity(db, user_id, context, minutes=minutes, turns=turns, ts=ts)
+    else:
+        await _buffer.append(ActivityLog, [dict(user_id=user_id, context=context, minutes=minutes, turns=turns, ts=ts)])
+
+async def with_pending(user_id: str, model: type, read: Callable[[], Awaitable[T]]) -> Tuple[T, List[Dict[str, Any]]]:
+    """Run `read()` and return it with the user's not-yet-written `model` rows."""
+    if _buffer is None:
+        return await read(), []
+    return await _buffer.with_pending(user_id, model, read)
+
+async def flush_pending() -> int:
+    """Write out whatever is buffered now; returns the row count (0 when not buffering)."""
+    return await _buffer.flush() if _buffer is not None else 0
+
+async def discard_pending(user_id: str, model: type):
+    if _buffer is not None:
+        await _buffer.discard(user_id, model)
@@ -0,0 +1,15 @@
+"""Numeric settings from environment variables; an unset or malformed value falls back to the default."""
+from __future__ import annotations
+import os
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
@@ -0,0 +1,30 @@
+"""ETag / If-None-Match for GET routes the frontend polls.
+
+The tag is a hash of the JSON body, so it is identical across workers and
+changes exactly when the response does. A matching If-None-Match gets an
+empty 304; `Cache-Control: no-cache` makes browsers revalidate every time.
+"""
+from __future__ import annotations
+import hashlib
+from typing import Any, Dict
+
+from fastapi import Request, Response
+
+from .responses import dumps
+
+def _matches(header: str | None, tag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison (RFC 9110 13.1.2): W/ prefixes do not matter
+    return tag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in header.split(",")}
+
+def etag_response(request: Request, payload: Any, headers: Dict[str, str] | None = None) -> Response:
+    """`payload` as a JSON response with an ETag, or a 304 if the client already has it."""
+    body = dumps(payload)
+    tag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {**(headers or {}), "ETag": tag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
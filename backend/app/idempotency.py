@@ -0,0 +1,128 @@
+"""Per-user turn serialization and Idempotency-Key replay for the chat routes.
+
+A user's chat turns run one at a time: each takes the user's lock before
+reading history and releases it after the turn is persisted, so a double
+submit cannot build both replies from the same history or race on the skill
+rows. Locks are reference-counted and dropped when nobody holds or waits on
+them, so the map only grows with concurrently active users.
+
+With an `Idempotency-Key` header, the finished response is kept for
+IDEMPOTENCY_TTL_S. A duplicate that arrives while the first request is
+running waits on the user's lock and then gets the stored response, so
+duplicates share one LLM call. Reusing a key with a different body is
+rejected. Both are in process: with several workers, route each user to one
+worker.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+
+from .env import env_float, env_int
+from .metrics import Counter, Gauge, Histogram
+
+TURN_LOCK_WAIT = Histogram("chat_turn_lock_wait_seconds", "Time a chat turn waited for the same user's previous turn.")
+TURN_LOCKS = Gauge("chat_turn_locks", "Users with a chat turn running or waiting.", fn=lambda: len(_locks) if _locks is not None else 0)
+IDEMPOTENCY_LOOKUPS = Counter("idempotency_lookups_total", "Idempotency-Key lookups by result (replay, miss, mismatch).", ("result",))
+
+class TurnBusy(Exception):
+    """The user's previous turn did not finish within CHAT_TURN_LOCK_TIMEOUT_S."""
+
+class IdempotencyMismatch(Exception):
+    """An Idempotency-Key was reused for a different request body."""
+
+class UserLocks:
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout if timeout is not None else env_float("CHAT_TURN_LOCK_TIMEOUT_S", 60.0)
+        self._locks: Dict[str, List[Any]] = {}  # user_id -> [lock, holders + waiters]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, user_id: str) -> AsyncIterator[None]:
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            with TURN_LOCK_WAIT.time():
+                try:
+                    await asyncio.wait_for(entry[0].acquire(), self.timeout)
+                except asyncio.TimeoutError:
+                    raise TurnBusy(f"another turn for {user_id!r} is still running") from None
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]  # evict: nobody holds or waits on it
+
+class IdempotencyStore:
+    def __init__(self):
+        self.ttl = env_float("IDEMPOTENCY_TTL_S", 600.0)
+        self.max_keys = max(1, env_int("IDEMPOTENCY_MAX_KEYS", 10000))
+        self._done: "OrderedDict[Tuple[str, str], Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._running: Dict[Tuple[str, str], int] = {}  # (user, key) -> requests waiting for or holding the turn
+
+    def get(self, user_id: str, key: str, fingerprint: str) -> Dict[str, Any] | None:
+        """Stored response for (user, key), or None; raises IdempotencyMismatch for a different body."""
+        hit = self._done.get((user_id, key))
+        if hit is None or hit[0] <= time.monotonic():
+            self._done.pop((user_id, key), None)
+            IDEMPOTENCY_LOOKUPS.inc(result="miss")
+            return None
+        if hit[1] != fingerprint:
+            IDEMPOTENCY_LOOKUPS.inc(result="mismatch")
+            raise IdempotencyMismatch("Idempotency-Key was already used with a different request")
+        IDEMPOTENCY_LOOKUPS.inc(result="replay")
+        return hit[2]
+
+    def has(self, user_id: str, key: str) -> bool:
+        """Whether (user, key) has a stored response or a turn in flight (no metrics, no body check: `get` does both)."""
+        if (user_id, key) in self._running:
+            return True
+        hit = self._done.get((user_id, key))
+        return hit is not None and hit[0] > time.monotonic()
+
+    @contextmanager
+    def running(self, user_id: str, key: str) -> Iterator[None]:
+        """Mark a turn with this key as in flight until it leaves the block."""
+        k = (user_id, key)
+        self._running[k] = self._running.get(k, 0) + 1
+        try:
+            yield
+        finally:
+            left = self._running.pop(k) - 1
+            if left:
+                self._running[k] = left
+
+    def put(self, user_id: str, key: str, fingerprint: str, response: Dict[str, Any]):
+        self._done[(user_id, key)] = (time.monotonic() + self.ttl, fingerprint, response)
+        self._done.move_to_end((user_id, key))
+        while len(self._done) > self.max_keys:
+            self._done.popitem(last=False)
+
+def fingerprint(body: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+_locks: UserLocks | None = None
+_store: IdempotencyStore | None = None
+
+def get_user_locks() -> UserLocks:
+    global _locks
+    if _locks is None:
+        _locks = UserLocks()
+    return _locks
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _store
+    if _store is None:
+        _store = IdempotencyStore()
+    return _store
@@ -1,19 +1,58 @@
 from __future__ import annotations
+import math
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 
+# before the app modules, so settings read at import time (and everything after) see backend/.env
+load_dotenv()
+
 from .db.init_db import init_db
+from .db.skill_catalog import get_skill_interner
+from .db.session import init_engine, dispose_engine, get_sessionmaker
+from .db.retention import start_retention, stop_retention
+from .db.write_behind import WriteBehindFull, start_write_behind, stop_write_behind
+from .tutor.admission import RateLimited
+from .tutor.clients import get_clients, close_clients
+from .tutor.response_cache import close_response_cache
+from .tutor.tagger import get_tagger
+from .practice_plans import start_plan_refresher, stop_plan_refresher
+from .metrics import MetricsMiddleware, render as render_metrics
+from .idempotency import IdempotencyMismatch, TurnBusy
+from .pagination import NEXT_CURSOR, InvalidCursor
 from .routes.chat import router as chat_router
-from .routes.practice import router as practice_router
+from .routes.practice import build_plan, router as practice_router
 from .routes.skills import router as skills_router
 from .routes.session import router as session_router
 from .routes.profile import router as profile_router
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ensure data dir exists for sqlite file
+    os.makedirs("data", exist_ok=True)
+    engine = init_engine()
+    await init_db(engine)
+    await get_skill_interner().load()
+    get_clients()
+    get_tagger()  # compile the local tutor's lexicon now rather than on the first offline turn
+    start_write_behind(get_sessionmaker())
+    start_retention(get_sessionmaker())
+    start_plan_refresher(get_sessionmaker(), build_plan)
+    try:
+        yield
+    finally:
+        await stop_plan_refresher()
+        await stop_retention()
+        # drain buffered transcript/activity rows while the engine is still up
+        await stop_write_behind()
+        await close_clients()
+        await close_response_cache()
+        await dispose_engine()
 
-app = FastAPI(title="AI Tutor", version="0.1.0")
+app = FastAPI(title="AI Tutor", version="0.1.0", lifespan=lifespan)
 
 origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
 app.add_middleware(
@@ -22,7 +61,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR],
 )
+# outermost, so the timings include CORS handling
+if os.getenv("METRICS_ENABLED", "1") != "0":
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(chat_router)
 app.include_router(practice_router)
@@ -30,12 +73,31 @@ app.include_router(skills_router)
 app.include_router(session_router)
 app.include_router(profile_router)
 
-@app.on_event("startup")
-async def _startup():
-    # ensure data dir exists for sqlite file
-    os.makedirs("data", exist_ok=True)
-    await init_db()
+@app.exception_handler(WriteBehindFull)
+async def write_behind_full(_request, exc: WriteBehindFull):
+    return JSONResponse({"detail": f"busy: {exc}"}, status_code=503, headers={"Retry-After": "1"})
+
+@app.exception_handler(TurnBusy)
+async def turn_busy(_request, exc: TurnBusy):
+    return JSONResponse({"detail": str(exc)}, status_code=409, headers={"Retry-After": "1"})
+
+@app.exception_handler(RateLimited)
+async def rate_limited(_request, exc: RateLimited):
+    return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+@app.exception_handler(IdempotencyMismatch)
+async def idempotency_mismatch(_request, exc: IdempotencyMismatch):
+    return JSONResponse({"detail": str(exc)}, status_code=422)
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor(_request, exc: InvalidCursor):
+    return JSONResponse({"detail": str(exc)}, status_code=400)
 
 @app.get("/")
 async def root():
     return {"ok": True, "service": "ai-tutor-backend"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,188 @@
+"""In-process metrics with Prometheus text exposition (served at GET /metrics).
+
+Deliberately tiny: counters, gauges and fixed-bucket histograms keyed by label
+tuples, updated from the event loop without locks. Recording a value is a dict
+lookup plus a bisect, cheap enough to leave on in production.
+"""
+from __future__ import annotations
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _quote(v) -> str:
+    return '"' + _escape(str(v)) + '"'
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f"{n}={_quote(v)}" for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_num(x: float) -> str:
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.values: Dict[Tuple[str, ...], float] = {} if self.labels else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        k = self._key(labels)
+        self.values[k] = self.values.get(k, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, *a, fn: Callable[[], float] | None = None, **kw):
+        super().__init__(*a, **kw)
+        self.fn = fn  # sampled at render time (label-less gauges only)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        if self.fn is not None:
+            self.set(self.fn())
+        return super().render()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *a, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kw):
+        super().__init__(*a, **kw)
+        self.buckets = tuple(buckets)
+        # per label set: [bucket counts..., +Inf count], sum
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        k = self._key(labels)
+        v = self.values.get(k)
+        if v is None:
+            v = self.values[k] = [[0] * (len(self.buckets) + 1), 0.0]
+        v[0][bisect_left(self.buckets, value)] += 1
+        v[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        out = self.header()
+        for k, (counts, total) in self.values.items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, 'le=%s' % _quote(le))} {acc}")
+            acc += counts[-1]
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, 'le=%s' % _quote('+Inf'))} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {acc}")
+        return out
+
+REGISTRY: List[_Metric] = []
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template, method and status.", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("route", "method"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+PHASE_LATENCY = Histogram("phase_duration_seconds", "Latency of named phases inside a request.", ("phase",))
+LLM_REQUESTS = Counter("llm_requests_total", "LLM calls by provider, model and outcome.", ("provider", "model", "outcome"))
+LLM_LATENCY = Histogram("llm_request_duration_seconds", "LLM call latency by provider and model.", ("provider", "model"))
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens reported by the provider.", ("provider", "model", "kind"))
+LLM_CACHED_RATIO = Histogram("llm_prompt_cached_ratio", "Per-call share of prompt tokens served from the provider's prefix cache.",
+                             ("provider", "model"), buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0))
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection.")
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    """Time a named phase (e.g. "chat.llm") into phase_duration_seconds."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_LATENCY.observe(time.perf_counter() - t0, phase=phase)
+
+@contextmanager
+def llm_call(provider: str, model: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - t0, provider=provider, model=model)
+        LLM_REQUESTS.inc(provider=provider, model=model, outcome=outcome)
+
+def record_tokens(provider: str, model: str, prompt: int | None, completion: int | None, cached: int | None = None):
+    """`cached` is the part of `prompt` the provider served from its prefix cache."""
+    if prompt:
+        LLM_TOKENS.inc(prompt, provider=provider, model=model, kind="prompt")
+        cached = min(cached or 0, prompt)
+        LLM_TOKENS.inc(cached, provider=provider, model=model, kind="prompt_cached")
+        LLM_TOKENS.inc(prompt - cached, provider=provider, model=model, kind="prompt_uncached")
+        LLM_CACHED_RATIO.observe(cached / prompt, provider=provider, model=model)
+    if completion:
+        LLM_TOKENS.inc(completion, provider=provider, model=model, kind="completion")
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency/status and in-flight gauge."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # the router stores the matched route on the (shared) scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.observe(time.perf_counter() - t0, route=route, method=scope["method"])
+            HTTP_REQUESTS.inc(route=route, method=scope["method"], status=str(status[0]))
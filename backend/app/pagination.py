@@ -0,0 +1,43 @@
+"""Opaque keyset cursors for the paged list endpoints.
+
+A cursor is the sort key of the last row a page returned, so the next page is
+an index range scan (`WHERE key > cursor ORDER BY key LIMIT n`) whose cost
+does not grow with how deep the client has paged. Clients get it from the
+`X-Next-Cursor` response header and pass it back as `?cursor=`; no header
+means there is nothing further. Cursors are client input: each key element is
+parsed by a field function, and anything malformed is InvalidCursor (400).
+"""
+from __future__ import annotations
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Callable, List
+
+import orjson
+
+NEXT_CURSOR = "X-Next-Cursor"
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(*key: Any) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode().rstrip("=")
+
+def key_int(value: Any) -> int:
+    if type(value) is not int:  # not bool, float or str
+        raise ValueError(f"not an integer: {value!r}")
+    return value
+
+def key_datetime(value: Any) -> datetime | None:
+    """An isoformat() timestamp, or None."""
+    return None if value is None else datetime.fromisoformat(value)
+
+def decode_cursor(cursor: str, *fields: Callable[[Any], Any]) -> List[Any]:
+    """The key `encode_cursor` packed, one field function per element (key_int, key_datetime)."""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != len(fields):
+            raise ValueError("wrong cursor shape")
+        return [parse(value) for parse, value in zip(fields, key)]
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise InvalidCursor("invalid cursor") from e
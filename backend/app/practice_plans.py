@@ -0,0 +1,209 @@
+"""Stored /api/practice/next responses (PRACTICE_PLANS=0 computes every request instead).
+
+A plan only changes when the user's skills are written or when time crosses
+one of their `next_due`s (a skill moves from "weak" to "due"). So each
+(user, context, limit) plan is stored in `practice_plans` with `valid_until` =
+the earliest future next_due, and kept in the user cache next to the skills:
+
+- memory hit, or one read of `uq_practice_plans_user_ctx_limit`: the stored
+  JSON body is returned as is.
+- expired (time passed `valid_until`, or invalidated) / missing: computed
+  inline and returned; the background refresher stores it.
+- Skill writes (chat turns, `adaptive/replay.py`) expire the user's stored
+  plans in the same transaction; after the turn commits, `schedule_refresh`
+  queues them for the refresher, which recomputes them off the request path.
+
+The request path never writes: the refresher stores plans in batches, one
+upsert statement each, so they hold SQLite's single writer lock only briefly. A plan is only stored if its skill read started after the last
+invalidation and after the stored plan's, so a computation racing a chat turn
+cannot overwrite a newer plan with an older one. The refresher queue is per
+process and dropped at shutdown; anything it did not get to is recomputed
+lazily.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .db.models import StoredPracticePlan
+from .db.session import dialect_insert
+from .env import env_int
+from .metrics import Counter, Gauge, span
+from .responses import dumps
+from .user_cache import get_user_cache
+
+log = logging.getLogger(__name__)
+
+PlanKey = Tuple[str, int]  # (context, limit)
+# routes/practice.build_plan: (db, user_id, context, limit, now) -> (plan, valid_until)
+Build = Callable[[AsyncSession, str, str, int, datetime], Awaitable[Tuple[Any, datetime | None]]]
+
+PLAN_LOOKUPS = Counter("practice_plan_lookups_total", "Stored practice plan lookups by result.", ("result",))
+PLAN_REFRESHES = Counter("practice_plan_refreshes_total", "Practice plans stored or recomputed by the background task, by result.", ("result",))
+PLAN_QUEUED = Gauge("practice_plan_refresh_queued", "Practice plans waiting for the background refresher.",
+                    fn=lambda: len(_refresher._queue) if _refresher else 0)
+
+def enabled() -> bool:
+    return os.getenv("PRACTICE_PLANS", "1").strip().lower() not in ("0", "false", "no")
+
+def _aware(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+async def load_plan(db: AsyncSession, user_id: str, context: str, limit: int,
+                    now: datetime) -> Tuple[bytes, datetime | None] | None:
+    """The stored response body and its valid_until, if it is still valid at `now`."""
+    row = (await db.execute(
+        select(StoredPracticePlan.body, StoredPracticePlan.valid_until).where(
+            StoredPracticePlan.user_id == user_id, StoredPracticePlan.context == context,
+            StoredPracticePlan.plan_limit == limit)
+    )).first()
+    if row is None:
+        PLAN_LOOKUPS.inc(result="miss")
+        return None
+    valid_until = _aware(row.valid_until) if row.valid_until is not None else None
+    if valid_until is not None and valid_until <= now:
+        PLAN_LOOKUPS.inc(result="expired")
+        return None
+    PLAN_LOOKUPS.inc(result="hit")
+    return row.body.encode(), valid_until
+
+def plan_row(user_id: str, context: str, limit: int, body: bytes, valid_until: datetime | None,
+             computed_at: datetime) -> Dict[str, Any]:
+    return {"user_id": user_id, "context": context, "plan_limit": limit, "body": body.decode(),
+            "valid_until": valid_until, "computed_at": computed_at}
+
+async def store_plans(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """Upsert plans (`plan_row`s) in one statement; a row is skipped where a plan read later, or an invalidation
+    after its `computed_at`, is already stored."""
+    t = StoredPracticePlan.__table__
+    stmt = dialect_insert(db, StoredPracticePlan).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StoredPracticePlan.user_id, StoredPracticePlan.context, StoredPracticePlan.plan_limit],
+        set_={"body": stmt.excluded.body, "valid_until": stmt.excluded.valid_until, "computed_at": stmt.excluded.computed_at},
+        where=and_(t.c.computed_at < stmt.excluded.computed_at,
+                   or_(t.c.invalidated_at.is_(None), t.c.invalidated_at < stmt.excluded.computed_at)),
+    )
+    await db.execute(stmt)
+
+async def invalidate_plans(db: AsyncSession, user_id: str | None = None) -> List[PlanKey]:
+    """Expire the user's stored plans (everyone's with user_id=None); returns their (context, limit) keys."""
+    if not enabled():
+        return []
+    now = datetime.now(tz=timezone.utc)
+    stmt = update(StoredPracticePlan).values(valid_until=now, invalidated_at=now)
+    if user_id is not None:
+        stmt = stmt.where(StoredPracticePlan.user_id == user_id)
+    rows = await db.execute(stmt.returning(StoredPracticePlan.context, StoredPracticePlan.plan_limit))
+    return [(r.context, r.plan_limit) for r in rows]
+
+Saved = Tuple[bytes, datetime | None, datetime]  # (body, valid_until, computed_at)
+
+class PlanRefresher:
+    """Background task that stores computed plans and recomputes invalidated ones, in batched transactions."""
+
+    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession], build: Build):
+        self.sessionmaker, self.build = sessionmaker, build
+        self.max_queued = max(1, env_int("PRACTICE_PLAN_QUEUE_MAX", 10000))
+        self.batch = max(1, env_int("PRACTICE_PLAN_BATCH", 100))
+        # (user_id, context, limit) -> plan to store, or None to recompute; also dedupes repeat requests
+        self._queue: "OrderedDict[Tuple[str, str, int], Saved | None]" = OrderedDict()
+        self._kick = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="practice-plans")
+
+    def _put(self, key: Tuple[str, str, int], saved: Saved | None):
+        if key not in self._queue and len(self._queue) >= self.max_queued:
+            PLAN_REFRESHES.inc(result="dropped")  # left expired: the next request computes it
+            return
+        if saved is not None and key in self._queue and self._queue[key] is None:
+            return  # a recompute is already due; it reads newer skills than this plan did
+        self._queue[key] = saved
+        self._kick.set()
+
+    def schedule(self, user_id: str, keys: Iterable[PlanKey]):
+        for context, limit in keys:
+            self._put((user_id, context, limit), None)
+
+    def save(self, user_id: str, context: str, limit: int, body: bytes, valid_until: datetime | None, computed_at: datetime):
+        self._put((user_id, context, limit), (body, valid_until, computed_at))
+
+    async def run_once(self) -> int:
+        """Store / recompute up to `batch` queued plans; returns how many were written."""
+        batch = [self._queue.popitem(last=False) for _ in range(min(self.batch, len(self._queue)))]
+        if not batch:
+            return 0
+        cache = get_user_cache()
+        rows = []
+        try:
+            with span("practice.refresh"):
+                async with self.sessionmaker() as db:
+                    for (user_id, context, limit), saved in batch:
+                        if saved is None:
+                            started, now = cache.clock(), datetime.now(tz=timezone.utc)
+                            plan, valid_until = await self.build(db, user_id, context, limit, now)
+                            saved = (dumps(plan), valid_until, now)
+                            cache.fill_plan(user_id, context, limit, saved[0], valid_until, started)
+                            await asyncio.sleep(0)  # a build from cached skills never yields; let requests run in between
+                        rows.append(plan_row(user_id, context, limit, *saved))
+                    await db.commit()  # end the read transaction: SQLite cannot upgrade it once another writer committed
+                    await store_plans(db, rows)  # one statement, so the write lock is held for one round trip
+                    await db.commit()
+        except Exception:
+            PLAN_REFRESHES.inc(len(batch), result="error")
+            log.exception("practice plan refresh of %d plans failed", len(batch))
+            return 0
+        for _, saved in batch:
+            PLAN_REFRESHES.inc(result="stored" if saved is not None else "recomputed")
+        return len(rows)
+
+    async def _run(self):
+        while not self._closing:
+            await self._kick.wait()
+            self._kick.clear()
+            while self._queue and not self._closing:
+                await self.run_once()
+
+    async def aclose(self):
+        if self._task is not None:
+            self._closing = True  # a batch in progress finishes; the rest stay expired
+            self._kick.set()
+            await self._task
+            self._task = None
+
+_refresher: PlanRefresher | None = None
+
+def start_plan_refresher(sessionmaker: async_sessionmaker[AsyncSession], build: Build) -> PlanRefresher | None:
+    global _refresher
+    if _refresher is None and enabled():
+        _refresher = PlanRefresher(sessionmaker, build)
+        _refresher.start()
+    return _refresher
+
+async def stop_plan_refresher():
+    global _refresher
+    if _refresher is not None:
+        job, _refresher = _refresher, None
+        await job.aclose()
+
+def schedule_refresh(user_id: str, keys: Iterable[PlanKey]):
+    """Queue recomputation of plans expired by a committed skill write (no-op without the refresher)."""
+    if _refresher is not None:
+        _refresher.schedule(user_id, keys)
+
+def save_plan(user_id: str, context: str, limit: int, body: bytes, valid_until: datetime | None,
+              computed_at: datetime) -> bool:
+    """Hand a plan computed on the request path to the refresher to store; False if it is not running."""
+    if _refresher is None:
+        return False
+    _refresher.save(user_id, context, limit, body, valid_until, computed_at)
+    return True
@@ -0,0 +1,25 @@
+"""orjson-backed JSON bodies for the list endpoints.
+
+Rows go straight from the Core result to orjson, skipping FastAPI's
+jsonable_encoder walk and response_model validation. Datetimes come out as
+`isoformat()` does; pydantic models (and anything else orjson does not know)
+are encoded the way FastAPI would, so the bytes match the default path.
+"""
+from __future__ import annotations
+from typing import Any, Dict
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    return jsonable_encoder(obj)
+
+def dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload, default=_default)
+
+def json_response(payload: Any, headers: Dict[str, str] | None = None) -> Response:
+    return Response(dumps(payload), media_type="application/json", headers=headers)
@@ -1,23 +1,31 @@
 from __future__ import annotations
+import json
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import asdict, fields as dataclass_fields
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..schemas import ChatRequest, ChatResponse, SkillUpdate
-from ..db.session import make_sessionmaker
-from ..db.models import Skill, ChatTurn, ActivityLog
+from ..db.session import get_db, get_sessionmaker, dialect_insert
+from ..db.models import Skill, SkillReview
+from ..db.skill_catalog import get_skill_interner
+from ..db.write_behind import append_activity, append_turns
 from ..adaptive.scheduler import SkillState, update_skill
-from ..tutor.chat import call_llm
+from ..adaptive.skill_model import new_state
+from ..tutor.admission import RateLimited, admit, refund
+from ..tutor.chat import call_llm, stream_llm, provider_name, SkillTagParser
+from ..tutor.memory import get_memory, token_budget
+from ..user_cache import as_stored, get_user_cache
+from ..practice_plans import invalidate_plans, schedule_refresh
+from ..idempotency import IdempotencyMismatch, TurnBusy, fingerprint, get_idempotency_store, get_user_locks
+from ..metrics import span
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
-_engine, SessionLocal = make_sessionmaker()
-
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
-
 def to_state(s: Skill) -> SkillState:
     return SkillState(
         strength=s.strength,
@@ -29,48 +37,199 @@ def to_state(s: Skill) -> SkillState:
         mistakes=s.mistakes,
     )
 
-def apply_state(s: Skill, st: SkillState):
-    s.strength = st.strength
-    s.ease = st.ease
-    s.interval_days = st.interval_days
-    s.last_seen = st.last_seen
-    s.next_due = st.next_due
-    s.streak = st.streak
-    s.mistakes = st.mistakes
+async def _load_history(db: AsyncSession, req: ChatRequest) -> List[Dict[str, str]]:
+    """Prior turns for the LLM (the current message is not stored yet).
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest, db: AsyncSession = Depends(get_db)):
-    # Save user message
-    t = datetime.now(tz=timezone.utc)
-    db.add(ChatTurn(user_id=req.user_id, role="user", content=req.message, ts=t))
-    # Log activity: count this turn as 1 minute by default (simple heuristic)
-    db.add(ActivityLog(user_id=req.user_id, context=req.context, minutes=1, turns=1, ts=t))
-    await db.commit()
+    Rolling summary + recent turns, sized to the provider's token budget.
+    """
+    history = await get_memory().history(db, req.user_id, token_budget(provider_name()))
+    # end the read transaction so no pooled connection is held across the LLM call
+    await db.rollback()
+    return history
+
+async def _apply_skills(db: AsyncSession, user_id: str, extracted: List[SkillUpdate], ids: Dict[str, int]) -> List[Dict[str, Any]]:
+    """One IN query, update_skill in memory, one INSERT .. ON CONFLICT write; returns the written rows.
 
-    # Pull last few turns (server-side) to maintain continuity
-    q = select(ChatTurn).where(ChatTurn.user_id == req.user_id).order_by(ChatTurn.id.desc()).limit(12)
-    turns = list(reversed((await db.execute(q)).scalars().all()))
-    history = [{"role": x.role, "content": x.content} for x in turns if x.role in ("user","assistant")]
+    `ids` maps each (canonical) skill name in `extracted` to its skill_catalog id.
+    """
+    if not extracted:
+        return []
+    cols = [Skill.skill_int_id, Skill.strength, Skill.ease, Skill.interval_days, Skill.last_seen, Skill.next_due, Skill.streak, Skill.mistakes]
+    rows = (await db.execute(
+        select(*cols).where(Skill.user_id == user_id, Skill.skill_int_id.in_({ids[su.skill_id] for su in extracted}))
+    )).all()
+    states = {r.skill_int_id: to_state(r) for r in rows}
+    t = datetime.now(tz=timezone.utc)
+    for su in extracted:
+        sid = ids[su.skill_id]
+        states[sid] = update_skill(states.get(sid) or new_state(), quality=su.quality, now=t)
+    # append-only history: lets adaptive/replay.py recompute states with new parameters
+    await db.execute(insert(SkillReview).values([
+        {"user_id": user_id, "skill_int_id": ids[su.skill_id], "quality": su.quality, "ts": t} for su in extracted
+    ]))
 
-    llm = await call_llm(req.context, req.level, req.message, history=history[:-1])  # exclude current user msg already added
-    reply = llm["reply"]
-    extracted = [SkillUpdate(**s) for s in llm.get("skills", []) if "skill_id" in s and "quality" in s]
+    stmt = dialect_insert(db, Skill).values([{"user_id": user_id, "skill_int_id": sid, **asdict(st)} for sid, st in states.items()])
+    fields = [f.name for f in dataclass_fields(SkillState)]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Skill.user_id, Skill.skill_int_id],
+        set_={f: stmt.excluded[f] for f in fields},
+    )
+    await db.execute(stmt)
+    naive = db.get_bind().dialect.name == "sqlite"
+    names = get_skill_interner().name
+    return [{"skill_id": names(sid), **asdict(st), "last_seen": as_stored(st.last_seen, naive), "next_due": as_stored(st.next_due, naive)}
+            for sid, st in states.items()]
 
-    # Save assistant reply
-    db.add(ChatTurn(user_id=req.user_id, role="assistant", content=reply, ts=datetime.now(tz=timezone.utc)))
+async def _finish_turn(db: AsyncSession, req: ChatRequest, started_at: datetime, reply: str, skills: List[Dict[str, Any]]) -> ChatResponse:
+    """Persist the turn: transcript + activity go to the write-behind buffer, skills commit here."""
+    tags = [s for s in skills if isinstance(s.get("skill_id"), str) and "quality" in s]
+    # intern the tag names first: new catalog rows commit on their own, before this turn writes anything
+    interner = get_skill_interner()
+    ids = await interner.resolve([s["skill_id"] for s in tags])
+    extracted, by_name = [], {}
+    for s in tags:
+        if s["skill_id"] in ids:
+            name = interner.name(ids[s["skill_id"]])
+            by_name[name] = ids[s["skill_id"]]
+            extracted.append(SkillUpdate(**{**s, "skill_id": name}))
 
-    # Upsert/update skills based on extracted data
-    for su in extracted:
-        row = (await db.execute(
-            select(Skill).where(Skill.user_id == req.user_id, Skill.skill_id == su.skill_id)
-        )).scalars().first()
-        if row is None:
-            row = Skill(user_id=req.user_id, skill_id=su.skill_id)
-            db.add(row)
-            await db.flush()
-
-        st = update_skill(to_state(row), quality=su.quality)
-        apply_state(row, st)
-
-    await db.commit()
+    with span("chat.persist"):
+        await append_turns(db, [
+            dict(user_id=req.user_id, role="user", content=req.message, ts=started_at),
+            dict(user_id=req.user_id, role="assistant", content=reply, ts=datetime.now(tz=timezone.utc)),
+        ])
+        # Log activity: count this turn as 1 minute by default (simple heuristic)
+        await append_activity(db, req.user_id, req.context, minutes=1, turns=1, ts=started_at)
+    with span("chat.skills"):
+        written = await _apply_skills(db, req.user_id, extracted, by_name)
+    await get_memory().persist(db, req.user_id)
+    # last before the commit: a plan computed from the old skills after this point is never stored over it
+    plans = await invalidate_plans(db, req.user_id) if written else []
+    with span("chat.commit"):
+        await db.commit()
+    if written:
+        get_user_cache().write_skills(req.user_id, written)
+        schedule_refresh(req.user_id, plans)
     return ChatResponse(reply=reply, extracted_skills=extracted, turn_logged=True)
+
+def _replay(req: ChatRequest, key: str | None) -> Dict[str, Any] | None:
+    """Stored response for a repeated Idempotency-Key (call with the user's turn lock held)."""
+    return get_idempotency_store().get(req.user_id, key, fingerprint(req.model_dump())) if key else None
+
+def _admit(req: ChatRequest, key: str | None) -> bool:
+    """Charge the turn to the user's LLM budget (429 right away, without queueing on the turn lock); returns
+    whether it was charged. A repeated Idempotency-Key, stored or still in flight, is a replay: not charged.
+    """
+    charged = not (key and get_idempotency_store().has(req.user_id, key))
+    admit(req.user_id, req.level, charge=charged)
+    return charged
+
+def _remember(req: ChatRequest, key: str | None, resp: ChatResponse):
+    if key:
+        get_idempotency_store().put(req.user_id, key, fingerprint(req.model_dump()), resp.model_dump())
+
+@asynccontextmanager
+async def _turn(req: ChatRequest, key: str | None, charged: bool) -> AsyncIterator[None]:
+    """Hold the user's turn lock (one turn per user at a time); a keyed turn counts as in flight meanwhile."""
+    with get_idempotency_store().running(req.user_id, key) if key else nullcontext():
+        try:
+            async with get_user_locks().hold(req.user_id):
+                yield
+        except TurnBusy:
+            if charged:
+                refund(req.user_id, req.level)  # 409 before the lock: no LLM call was made
+            raise
+
+def _settle(req: ChatRequest, charged: bool, hit: Dict[str, Any] | None):
+    """Square the LLM budget once the turn lock shows whether this request is a replay."""
+    if hit is not None and charged:
+        refund(req.user_id, req.level)  # the first request was still running when this one arrived
+    elif hit is None and not charged:
+        admit(req.user_id, req.level)  # the request it repeated failed: this one is a real turn after all
+
+async def _before_llm(req: ChatRequest, key: str | None, charged: bool,
+                      load_history: Callable[[], Awaitable[List[Dict[str, str]]]]):
+    """Everything between the turn lock and the LLM call: (stored response, None) for a replay, else
+    (None, history). A turn that fails here never reaches the LLM, so its token goes back.
+    """
+    holds = charged
+    try:
+        hit = _replay(req, key)
+        _settle(req, charged, hit)
+        if hit is not None:
+            return hit, None
+        holds = True  # charged before the lock, or by _settle just now
+        return None, await load_history()
+    except BaseException:
+        if holds:
+            refund(req.user_id, req.level)
+        raise
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, response: Response, db: AsyncSession = Depends(get_db),
+               idempotency_key: str | None = Header(None, max_length=255)):
+    charged = _admit(req, idempotency_key)
+    # one turn per user at a time; a duplicate waits here, then replays the stored response
+    async with _turn(req, idempotency_key, charged):
+        t = datetime.now(tz=timezone.utc)
+        with span("chat.history"):
+            hit, history = await _before_llm(req, idempotency_key, charged, lambda: _load_history(db, req))
+        if hit is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return hit
+        with span("chat.llm"):
+            llm = await call_llm(req.context, req.level, req.message, history=history)
+        resp = await _finish_turn(db, req, t, llm["reply"], llm.get("skills", []))
+        _remember(req, idempotency_key, resp)
+    return resp
+
+async def _stream_history(req: ChatRequest) -> List[Dict[str, str]]:
+    async with get_sessionmaker()() as session:
+        return await _load_history(session, req)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, idempotency_key: str | None = Header(None, max_length=255)):
+    """Server-Sent Events variant of /chat.
+
+    Emits `token` events ({"text": ...}) as the LLM produces them, then a single
+    `done` event carrying the ChatResponse. The trailing skills JSON is never
+    forwarded as tokens. A replayed Idempotency-Key sends the stored reply as
+    one `token` event. Over the user's LLM budget it answers 429 before streaming.
+    """
+    charged = _admit(req, idempotency_key)
+
+    async def events():
+        parser = SkillTagParser()
+        # The whole turn runs inside the stream (and the user's turn lock), with its own sessions
+        try:
+            async with _turn(req, idempotency_key, charged):
+                t = datetime.now(tz=timezone.utc)
+                with span("chat.history"):
+                    hit, history = await _before_llm(req, idempotency_key, charged, lambda: _stream_history(req))
+                if hit is not None:
+                    yield _sse("token", {"text": hit["reply"]})
+                    yield _sse("done", hit)
+                    return
+                try:
+                    async for chunk in stream_llm(req.context, req.level, req.message, history=history):
+                        text = parser.feed(chunk)
+                        if text:
+                            yield _sse("token", {"text": text})
+                    text = parser.close()
+                    if text:
+                        yield _sse("token", {"text": text})
+                except Exception as e:
+                    yield _sse("error", {"detail": str(e) or e.__class__.__name__})
+                    return
+                async with get_sessionmaker()() as session:
+                    resp = await _finish_turn(session, req, t, parser.reply, parser.skills)
+                _remember(req, idempotency_key, resp)
+        except (TurnBusy, IdempotencyMismatch, RateLimited) as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", resp.model_dump())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
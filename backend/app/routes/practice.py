@@ -1,25 +1,25 @@
 from __future__ import annotations
 
+import heapq
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from typing import Tuple
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..schemas import PracticeNextRequest, PracticePlan, SkillOut
-from ..db.session import make_sessionmaker
-from ..db.models import Skill
-from ..adaptive.scheduler import score_candidate
-from ..context.scenarios import pick_scenario
+from ..db.session import get_db
+from ..db.models import Skill, SkillCatalog
+from ..db.skill_catalog import get_skill_interner
+from ..adaptive.scheduler import score_candidates
+from ..context.scenarios import SUGGESTED_SKILLS, known_context, pick_scenario
+from ..practice_plans import enabled as plans_enabled, load_plan, plan_row, save_plan, store_plans
+from ..responses import dumps
+from ..user_cache import get_user_cache
+from .skills import cached_skills
 
 router = APIRouter(prefix="/api", tags=["practice"])
 
-_engine, SessionLocal = make_sessionmaker()
-
-
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
-
 
 def as_utc(dt: datetime | None) -> datetime | None:
     """
@@ -35,57 +35,103 @@ def as_utc(dt: datetime | None) -> datetime | None:
     return dt.astimezone(timezone.utc)
 
 
-@router.post("/practice/next", response_model=PracticePlan)
-async def practice_next(req: PracticeNextRequest, db: AsyncSession = Depends(get_db)):
-    # fetch all skills for user
-    skills = (await db.execute(select(Skill).where(Skill.user_id == req.user_id))).scalars().all()
-
-    now = datetime.now(tz=timezone.utc)
-
-    # rank candidates
-    candidates = []
-    for s in skills:
-        next_due = as_utc(s.next_due)
-        due = (next_due is None) or (next_due <= now)
-        sc = score_candidate(due=due, strength=s.strength, next_due=next_due)
-        candidates.append((sc, due, s, next_due))
-
-    candidates.sort(key=lambda x: x[0])
-
-    due_list = []
-    weak_list = []
-
-    # pick due first, then weak
-    for _, due, s, next_due in candidates[: max(req.limit, 10)]:
-        out = SkillOut(
-            skill_id=s.skill_id,
-            strength=s.strength,
+async def build_plan(db: AsyncSession, user_id: str, context: str, limit: int, now: datetime) -> Tuple[PracticePlan, datetime | None]:
+    """The plan at `now`, and the earliest future next_due (when the due/weak split next changes)."""
+    window = max(limit, 10)
+    cols = (SkillCatalog.name.label("skill_id"), Skill.strength, Skill.next_due, Skill.streak, Skill.mistakes)
+    cached = await cached_skills(db, user_id)
+
+    if cached is not None:
+        # same selection as the queries below, from the cached rows (already in next_due order)
+        n_due = next((i for i, r in enumerate(cached) if r["next_due"] is not None and as_utc(r["next_due"]) > now), len(cached))
+        due_rows = cached[:min(n_due, limit)]
+        weak_rows = heapq.nsmallest(window, cached[n_due:], key=lambda r: r["strength"]) if len(due_rows) < limit else []
+        valid_until = as_utc(cached[n_due]["next_due"]) if n_due < len(cached) else None
+    else:
+        # Due queue: most overdue first (ix_skills_user_next_due; NULL = never scheduled sorts first)
+        due_rows = [r._mapping for r in (await db.execute(
+            select(*cols)
+            .join(SkillCatalog, SkillCatalog.id == Skill.skill_int_id)
+            .where(Skill.user_id == user_id, or_(Skill.next_due.is_(None), Skill.next_due <= now))
+            .order_by(Skill.next_due.asc().nullsfirst())
+            .limit(limit)
+        )).all()]
+        # Weakest not-yet-due skills (ix_skills_user_strength)
+        weak_rows = []
+        if len(due_rows) < limit:
+            weak_rows = [r._mapping for r in (await db.execute(
+                select(*cols)
+                .join(SkillCatalog, SkillCatalog.id == Skill.skill_int_id)
+                .where(Skill.user_id == user_id, Skill.next_due > now)
+                .order_by(Skill.strength.asc())
+                .limit(window)
+            )).all()]
+        valid_until = as_utc((await db.execute(
+            select(func.min(Skill.next_due)).where(Skill.user_id == user_id, Skill.next_due > now)
+        )).scalar())
+
+    def rank(rows):
+        rows = [(r, as_utc(r["next_due"])) for r in rows]
+        scores = score_candidates([(r["strength"], nd) for r, nd in rows], now)
+        return [x for _, x in sorted(zip(scores, rows), key=lambda x: x[0])]
+
+    def out(r, next_due):
+        return SkillOut(
+            skill_id=r["skill_id"],
+            strength=r["strength"],
             next_due=next_due,  # normalized
-            streak=s.streak,
-            mistakes=s.mistakes,
+            streak=r["streak"],
+            mistakes=r["mistakes"],
         )
-        if due and len(due_list) < req.limit:
-            due_list.append(out)
-        elif (not due) and len(weak_list) < max(0, req.limit - len(due_list)):
-            weak_list.append(out)
+
+    # pick due first, then weak
+    due_list = [out(r, nd) for r, nd in rank(due_rows)]
+    weak_list = [out(r, nd) for r, nd in rank(weak_rows)][: max(0, limit - len(due_list))]
 
     # Suggest a few new skills based on context
-    new_map = {
-        "Airport": ["phrase:check_in", "vocab:overweight_bag", "phrase:rebook_flight"],
-        "Restaurant": ["phrase:table_for_two", "vocab:allergy", "phrase:order_modification"],
-        "Classroom": ["phrase:ask_clarification", "phrase:request_extension", "vocab:assignment"],
-        "Office": ["phrase:status_update", "phrase:disagree_politely", "phrase:schedule_meeting"],
-        "Shopping": ["phrase:return_item", "vocab:refund", "phrase:ask_alternative"],
-    }
-    suggested = new_map.get(req.context, new_map["Airport"])
-    existing = {s.skill_id for s in skills}
+    suggested = SUGGESTED_SKILLS.get(context, SUGGESTED_SKILLS["Airport"])
+    if cached is not None:
+        existing = {r["skill_id"] for r in cached}
+    else:
+        # suggestions missing from the catalog cannot be in the user's skills yet
+        interner = get_skill_interner()
+        ids = {sid: x for x in suggested if (sid := interner.lookup(x)) is not None}
+        existing = {ids[sid] for sid in (await db.execute(
+            select(Skill.skill_int_id).where(Skill.user_id == user_id, Skill.skill_int_id.in_(ids))
+        )).scalars()} if ids else set()
     new_skills = [x for x in suggested if x not in existing][:3]
 
-    scenario = pick_scenario(req.context)
+    scenario = pick_scenario(context)
 
-    return PracticePlan(
+    plan = PracticePlan(
         due=due_list,
         weak=weak_list,
         new=new_skills,
         scenario_prompt=scenario,
-    )
\ No newline at end of file
+    )
+    return plan, valid_until
+
+
+@router.post("/practice/next", response_model=PracticePlan)
+async def practice_next(req: PracticeNextRequest, db: AsyncSession = Depends(get_db)):
+    """The stored plan when still valid (see practice_plans.py), else computed and stored."""
+    now = datetime.now(tz=timezone.utc)
+    # plans are stored per known context: a free-form one gets (and shares) the default context's plan
+    context = known_context(req.context)
+    if not plans_enabled():
+        return (await build_plan(db, req.user_id, context, req.limit, now))[0]
+    cache = get_user_cache()
+    body = cache.plan(req.user_id, context, req.limit, now)
+    if body is None:
+        started = cache.clock()
+        stored = await load_plan(db, req.user_id, context, req.limit, now)
+        if stored is not None:
+            body, valid_until = stored
+        else:
+            plan, valid_until = await build_plan(db, req.user_id, context, req.limit, now)
+            body = dumps(plan)
+            if not save_plan(req.user_id, context, req.limit, body, valid_until, now):
+                await store_plans(db, [plan_row(req.user_id, context, req.limit, body, valid_until, now)])
+                await db.commit()
+        cache.fill_plan(req.user_id, context, req.limit, body, valid_until, started)
+    return Response(body, media_type="application/json")
@@ -1,30 +1,53 @@
 from __future__ import annotations
 from datetime import datetime, timezone, timedelta
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..schemas import ProfileIn, ProfileOut, LogActivityIn, ProgressOut
-from ..db.session import make_sessionmaker
-from ..db.models import UserProfile, ActivityLog
+from ..db.session import get_db, dialect_insert
+from ..db.models import UserProfile, ActivityDaily, ActivityLog
+from ..db.rollups import local_day, rebuild_user, zone
+from ..db.write_behind import append_activity, with_pending
+from ..etag import etag_response
+from ..user_cache import get_user_cache
 
 router = APIRouter(prefix="/api", tags=["profile"])
 
-_engine, SessionLocal = make_sessionmaker()
-
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
-
 def _utcnow():
     return datetime.now(tz=timezone.utc)
 
-@router.get("/profile/{user_id}", response_model=ProfileOut)
-async def get_profile(user_id: str, db: AsyncSession = Depends(get_db)):
-    row = (await db.execute(select(UserProfile).where(UserProfile.user_id == user_id))).scalars().first()
+def _aware(ts: datetime) -> datetime:
+    # SQLite hands back naive UTC datetimes; buffered rows are tz-aware
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def _profile_out(row: UserProfile) -> ProfileOut:
+    return ProfileOut(
+        user_id=row.user_id,
+        native_language=row.native_language,
+        target_language=row.target_language,
+        level=row.level,
+        daily_minutes_goal=row.daily_minutes_goal,
+        weekly_minutes_goal=row.weekly_minutes_goal,
+        focus_contexts=[c.strip() for c in (row.focus_contexts or "").split(",") if c.strip()],
+        timezone=row.timezone or "UTC",
+        created_at=row.created_at,
+        updated_at=row.updated_at,
+    )
+
+async def load_profile(db: AsyncSession, user_id: str) -> ProfileOut:
+    """The user's profile via the user cache; a default one is created on first access."""
+    cache = get_user_cache()
+    profile = cache.profile(user_id)
+    if profile is not None:
+        return profile
+    started = cache.clock()
+    q = select(UserProfile).where(UserProfile.user_id == user_id)
+    row = (await db.execute(q)).scalars().first()
     if row is None:
         now = _utcnow()
-        row = UserProfile(
+        # concurrent first reads: the loser's insert is a no-op and both read the winner's row
+        await db.execute(dialect_insert(db, UserProfile).values(
             user_id=user_id,
             native_language="English",
             target_language="English",
@@ -34,22 +57,16 @@ async def get_profile(user_id: str, db: AsyncSession = Depends(get_db)):
             focus_contexts="Airport,Restaurant",
             created_at=now,
             updated_at=now,
-        )
-        db.add(row)
+        ).on_conflict_do_nothing(index_elements=[UserProfile.user_id]))
         await db.commit()
-        await db.refresh(row)
+        row = (await db.execute(q)).scalars().first()
+    profile = _profile_out(row)
+    cache.fill_profile(user_id, profile, started)
+    return profile
 
-    return ProfileOut(
-        user_id=row.user_id,
-        native_language=row.native_language,
-        target_language=row.target_language,
-        level=row.level,
-        daily_minutes_goal=row.daily_minutes_goal,
-        weekly_minutes_goal=row.weekly_minutes_goal,
-        focus_contexts=[c.strip() for c in (row.focus_contexts or "").split(",") if c.strip()],
-        created_at=row.created_at,
-        updated_at=row.updated_at,
-    )
+@router.get("/profile/{user_id}", response_model=ProfileOut)
+async def get_profile(user_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    return etag_response(request, await load_profile(db, user_id))
 
 @router.put("/profile/{user_id}", response_model=ProfileOut)
 async def upsert_profile(user_id: str, body: ProfileIn, db: AsyncSession = Depends(get_db)):
@@ -70,50 +87,59 @@ async def upsert_profile(user_id: str, body: ProfileIn, db: AsyncSession = Depen
     row.daily_minutes_goal = body.daily_minutes_goal
     row.weekly_minutes_goal = body.weekly_minutes_goal
     row.focus_contexts = ",".join(body.focus_contexts)
+    old_tz = row.timezone or "UTC"
+    moved = bool(body.timezone) and body.timezone != old_tz
+    if body.timezone:
+        row.timezone = body.timezone  # validated by ProfileIn
     row.updated_at = now
+    if moved:
+        # rollups are keyed by local day: re-bucket what the raw log still has by the new timezone
+        await rebuild_user(db, user_id, zone(body.timezone), zone(old_tz))
 
     await db.commit()
     await db.refresh(row)
-    return await get_profile(user_id, db)
+    profile = _profile_out(row)
+    get_user_cache().write_profile(user_id, profile)
+    return profile
 
 @router.post("/activity/log")
 async def log_activity(body: LogActivityIn, db: AsyncSession = Depends(get_db)):
-    db.add(ActivityLog(
-        user_id=body.user_id,
-        context=body.context,
-        minutes=body.minutes,
-        turns=body.turns,
-        ts=_utcnow(),
-    ))
+    await append_activity(db, body.user_id, body.context, minutes=body.minutes, turns=body.turns, ts=_utcnow())
     await db.commit()
     return {"ok": True}
 
 @router.get("/progress/{user_id}", response_model=ProgressOut)
-async def get_progress(user_id: str, db: AsyncSession = Depends(get_db)):
-    profile = await get_profile(user_id, db)
-    now = _utcnow()
-    # Start of today (UTC) and start of week (last 7 days)
-    start_today = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
-    start_week = start_today - timedelta(days=6)
-
-    today_minutes = (await db.execute(
-        select(func.coalesce(func.sum(ActivityLog.minutes), 0))
-        .where(ActivityLog.user_id == user_id, ActivityLog.ts >= start_today)
-    )).scalar_one()
-
-    week_minutes = (await db.execute(
-        select(func.coalesce(func.sum(ActivityLog.minutes), 0))
-        .where(ActivityLog.user_id == user_id, ActivityLog.ts >= start_week)
-    )).scalar_one()
-
-    last_ts = (await db.execute(
-        select(func.max(ActivityLog.ts)).where(ActivityLog.user_id == user_id)
-    )).scalar_one()
+async def get_progress(user_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    profile = await load_profile(db, user_id)
+    # Day boundaries follow the user's timezone; rollups are keyed by local day
+    tz = zone(profile.timezone)
+    today = _utcnow().astimezone(tz).date()
+    start_week = today - timedelta(days=6)
+
+    async def read():
+        return (await db.execute(
+            select(ActivityDaily.day, func.sum(ActivityDaily.minutes), func.max(ActivityDaily.last_ts))
+            .where(ActivityDaily.user_id == user_id, ActivityDaily.day >= start_week)
+            .group_by(ActivityDaily.day)
+        )).all()
+
+    rows, pending = await with_pending(user_id, ActivityLog, read)
+    # activity still in the write-behind buffer counts too
+    rows = list(rows) + [(local_day(a["ts"], tz), a["minutes"], a["ts"]) for a in pending]
+    rows = [(day, m, ts) for day, m, ts in rows if day >= start_week]
+    today_minutes = sum(m for day, m, _ in rows if day == today)
+    week_minutes = sum(m for _, m, _ in rows)
+    last_ts = max((ts for _, _, ts in rows), key=_aware, default=None)
+    if last_ts is None:
+        # nothing this week: the latest activity of any earlier day (and context)
+        last_ts = (await db.execute(
+            select(func.max(ActivityDaily.last_ts)).where(ActivityDaily.user_id == user_id)
+        )).scalar()
 
     daily_pct = min(1.0, (today_minutes / profile.daily_minutes_goal) if profile.daily_minutes_goal else 0.0)
     weekly_pct = min(1.0, (week_minutes / profile.weekly_minutes_goal) if profile.weekly_minutes_goal else 0.0)
 
-    return ProgressOut(
+    return etag_response(request, ProgressOut(
         user_id=user_id,
         today_minutes=int(today_minutes),
         week_minutes=int(week_minutes),
@@ -122,4 +148,4 @@ async def get_progress(user_id: str, db: AsyncSession = Depends(get_db)):
         daily_pct=float(daily_pct),
         weekly_pct=float(weekly_pct),
         last_activity=last_ts,
-    )
+    ))
@@ -1,33 +1,67 @@
 from __future__ import annotations
+import asyncio
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db.session import make_sessionmaker
+from ..db.session import get_db
 from ..db.models import ChatTurn
+from ..db.archive import has_archive, read_before
+from ..db.retention import clear_user_turns
+from ..db.write_behind import discard_pending, flush_pending, with_pending
+from ..pagination import NEXT_CURSOR, decode_cursor, encode_cursor, key_int
+from ..responses import json_response
+from ..tutor.memory import get_memory
 
 router = APIRouter(prefix="/api", tags=["session"])
 
-_engine, SessionLocal = make_sessionmaker()
+@router.get("/history/{user_id}")
+async def get_history(user_id: str, limit: int = Query(30, ge=1, le=1000), cursor: str | None = None,
+                      db: AsyncSession = Depends(get_db)):
+    """A page of turns, oldest first: the newest `limit`, or the `limit` before `cursor` (X-Next-Cursor)."""
+    q = select(ChatTurn.id, ChatTurn.role, ChatTurn.content, ChatTurn.ts).where(ChatTurn.user_id == user_id)
+    before = None
+    if cursor is not None:
+        (before,) = decode_cursor(cursor, key_int)
+        q = q.where(ChatTurn.id < before)
+    q = q.order_by(ChatTurn.id.desc()).limit(limit + 1)  # one extra row says whether there is an older page
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+    async def read():
+        return (await db.execute(q)).mappings().all()
 
-@router.get("/history/{user_id}")
-async def get_history(user_id: str, limit: int = 30, db: AsyncSession = Depends(get_db)):
-    q = select(ChatTurn).where(ChatTurn.user_id == user_id).order_by(ChatTurn.id.desc()).limit(limit)
-    rows = (await db.execute(q)).scalars().all()
-    rows = list(reversed(rows))
-    return [{"role": r.role, "content": r.content, "ts": r.ts} for r in rows]
+    if cursor is None:
+        rows, pending = await with_pending(user_id, ChatTurn, read)
+        if len(pending) > limit:
+            # the page would stop inside the buffer, and a cursor needs ids: write the buffer out first
+            await flush_pending()
+            await db.rollback()  # end the read transaction so the re-read sees the flushed rows
+            rows, pending = await with_pending(user_id, ChatTurn, read)
+    else:  # unflushed turns are the newest, so they only ever belong on the first page
+        rows, pending = await read(), []
+    pending = pending[max(len(pending) - limit, 0):]
+    room = limit - len(pending)
+    if len(rows) <= room and has_archive(user_id):
+        # nothing older in the database: continue into the segments retention archived
+        last = rows[-1]["id"] if rows else before
+        rows = [*rows, *await asyncio.to_thread(read_before, user_id, last, room + 1 - len(rows))]
+    page = rows[:room]
+    headers = None
+    if len(rows) > len(page):
+        # next page: everything older than this page's oldest turn
+        headers = {NEXT_CURSOR: encode_cursor(page[-1]["id"] if page else rows[0]["id"] + 1)}
+    out = [{"role": r["role"], "content": r["content"], "ts": r["ts"]} for r in reversed(page)]
+    # turns still in the write-behind buffer; match SQLite's naive UTC timestamps
+    naive = db.get_bind().dialect.name == "sqlite"
+    out += [{"role": r["role"], "content": r["content"],
+             "ts": r["ts"].astimezone(timezone.utc).replace(tzinfo=None) if naive else r["ts"]} for r in pending]
+    return json_response(out, headers)
 
 @router.post("/history/{user_id}/clear")
 async def clear_history(user_id: str, db: AsyncSession = Depends(get_db)):
-    # simple delete all
-    await db.execute(select(ChatTurn).where(ChatTurn.user_id == user_id))  # warm up
-    await db.execute(
-        ChatTurn.__table__.delete().where(ChatTurn.user_id == user_id)
-    )
+    # everything: turns not yet flushed, stored and archived
+    await discard_pending(user_id, ChatTurn)
+    await clear_user_turns(db, user_id)
+    await get_memory().forget(db, user_id)
     await db.commit()
     return {"ok": True}
@@ -1,32 +1,68 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from datetime import datetime
+from typing import Any, Dict, List
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import and_, or_, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db.session import make_sessionmaker
-from ..db.models import Skill
+from ..db.session import get_db
+from ..db.models import Skill, SkillCatalog
+from ..etag import etag_response
+from ..pagination import NEXT_CURSOR, decode_cursor, encode_cursor, key_datetime, key_int
+from ..user_cache import LARGE, get_user_cache
 
 router = APIRouter(prefix="/api", tags=["skills"])
 
-_engine, SessionLocal = make_sessionmaker()
+# the API keeps string skill ids: the catalog name, joined on the primary key
+SKILL_COLS = (SkillCatalog.name.label("skill_id"), Skill.strength, Skill.ease, Skill.interval_days, Skill.last_seen, Skill.next_due,
+              Skill.streak, Skill.mistakes)
 
-async def get_db():
-    async with SessionLocal() as session:
-        yield session
+async def _select_skills(db: AsyncSession, user_id: str, limit: int | None = None) -> List[Dict[str, Any]]:
+    q = select(*SKILL_COLS).join(SkillCatalog, SkillCatalog.id == Skill.skill_int_id).where(Skill.user_id == user_id)
+    q = q.order_by(Skill.next_due.asc().nullsfirst(), Skill.id).limit(limit)
+    return [dict(r._mapping) for r in (await db.execute(q)).all()]
+
+async def cached_skills(db: AsyncSession, user_id: str) -> List[Dict[str, Any]] | None:
+    """The user's skill rows in next_due order via the user cache; None if the set is too large to cache."""
+    cache = get_user_cache()
+    rows = cache.skills(user_id)
+    if rows is None and cache.enabled:
+        started = cache.clock()
+        rows = await _select_skills(db, user_id, limit=cache.max_skills + 1)
+        cache.fill_skills(user_id, rows, started)
+        rows = rows if len(rows) <= cache.max_skills else LARGE
+    return rows if isinstance(rows, list) else None
+
+def _after(next_due: datetime | None, row_id: int):
+    """Rows strictly after (next_due, id) in `next_due ASC NULLS FIRST, id` order."""
+    if next_due is None:
+        return or_(Skill.next_due.is_not(None), and_(Skill.next_due.is_(None), Skill.id > row_id))
+    return tuple_(Skill.next_due, Skill.id) > tuple_(next_due, row_id)
+
+async def _skills_page(db: AsyncSession, user_id: str, limit: int, cursor: str | None):
+    q = select(Skill.id, *SKILL_COLS).join(SkillCatalog, SkillCatalog.id == Skill.skill_int_id).where(Skill.user_id == user_id)
+    if cursor is not None:
+        next_due, row_id = decode_cursor(cursor, key_datetime, key_int)
+        q = q.where(_after(next_due, row_id))
+    q = q.order_by(Skill.next_due.asc().nullsfirst(), Skill.id).limit(limit + 1)
+    rows = (await db.execute(q)).all()
+    headers = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        headers = {NEXT_CURSOR: encode_cursor(last.next_due.isoformat() if last.next_due else None, last.id)}
+    page = [dict(r._mapping) for r in rows[:limit]]
+    for r in page:
+        del r["id"]
+    return page, headers
 
 @router.get("/skills/{user_id}")
-async def list_skills(user_id: str, db: AsyncSession = Depends(get_db)):
-    rows = (await db.execute(select(Skill).where(Skill.user_id == user_id).order_by(Skill.next_due.asc().nullsfirst()))).scalars().all()
-    return [
-        {
-            "skill_id": r.skill_id,
-            "strength": r.strength,
-            "ease": r.ease,
-            "interval_days": r.interval_days,
-            "last_seen": r.last_seen,
-            "next_due": r.next_due,
-            "streak": r.streak,
-            "mistakes": r.mistakes,
-        }
-        for r in rows
-    ]
+async def list_skills(user_id: str, request: Request, limit: int | None = Query(None, ge=1, le=1000),
+                      cursor: str | None = None, db: AsyncSession = Depends(get_db)):
+    """All skills in next_due order, or keyset pages of `limit` when asked (X-Next-Cursor)."""
+    if limit is None and cursor is None:
+        rows = await cached_skills(db, user_id)
+        if rows is None:
+            rows = await _select_skills(db, user_id)
+        return etag_response(request, rows)
+    rows, headers = await _skills_page(db, user_id, limit or 100, cursor)
+    return etag_response(request, rows, headers)
@@ -1,7 +1,8 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
 from typing import List, Optional, Dict
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 class ChatRequest(BaseModel):
     user_id: str = "demo"
@@ -47,8 +48,21 @@ class ProfileIn(BaseModel):
     daily_minutes_goal: int = Field(default=10, ge=1, le=240)
     weekly_minutes_goal: int = Field(default=70, ge=1, le=2000)
     focus_contexts: List[str] = Field(default_factory=lambda: ["Airport", "Restaurant"])
+    # IANA timezone for day boundaries; left unchanged when omitted
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def known_timezone(cls, name: Optional[str]) -> Optional[str]:
+        if not name:
+            return name
+        try:
+            return ZoneInfo(name).key
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown timezone: {name!r}") from None
 
 class ProfileOut(ProfileIn):
+    timezone: str = "UTC"
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,182 @@
+"""Fair sharing of LLM capacity between users: weighted fair queuing per provider, per-user token buckets.
+
+Each provider has LLM_MAX_CONCURRENCY slots (`ProviderClients.slot`). Waiting
+calls are not served first come, first served but in weighted fair order
+(start-time fair queuing): a call starts at max(virtual time, where the user's
+previous call finished), finishes 1/weight later, the earliest start gets the
+next free slot, and the virtual time advances to the start of the call last
+granted. A user whose calls keep coming has starts far ahead of the virtual
+time, so a light user's call goes first and waits for about one slot to free
+up, not behind the whole queue. A user also
+holds at most LLM_USER_MAX_CONCURRENCY slots of a provider at once.
+
+With LLM_USER_RATE_PER_MIN set, each user also has a token bucket of
+LLM_USER_BURST turns, refilled at that rate; both scale with the weight. A turn
+that finds the bucket empty is rejected (429 + Retry-After) before it waits for
+the user's turn lock. Idempotent replays are never charged.
+
+Weights come from the turn's level (LLM_WEIGHTS="Advanced=2,Pro=4", default 1).
+The chat routes name the caller with `admit()`, a context variable for the rest
+of the request, so provider calls keep their signature; calls without a caller
+(scripts, benches) share one queue key and no per-user cap. All of this is per process, like the turn locks.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from ..env import env_float, env_int
+from ..metrics import Counter, Gauge, Histogram
+
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Time an LLM call waited for a provider slot.", ("provider",))
+LLM_QUEUED = Gauge("llm_queued", "LLM calls waiting for a provider slot.", ("provider",))
+LLM_RATE_LIMITED = Counter("llm_rate_limited_total", "Chat turns rejected because the user's token bucket was empty.")
+
+# (user_id, weight) of the chat turn this task is running
+_CALLER: ContextVar[Tuple[str, float]] = ContextVar("llm_caller", default=("", 1.0))
+
+class RateLimited(Exception):
+    """The user's LLM token bucket is empty; `retry_after` is when the next turn fits."""
+
+    def __init__(self, user_id: str, retry_after: float):
+        super().__init__(f"too many chat turns for {user_id!r}; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """LLM_WEIGHTS: "Advanced=2, pro=4" -> {"advanced": 2.0, "pro": 4.0}; malformed or non-positive entries are ignored."""
+    out = {}
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        try:
+            w = float(value)
+        except ValueError:
+            continue
+        if sep and name.strip() and w > 0:
+            out[name.strip().lower()] = w
+    return out
+
+class Admission:
+    """Weights and token buckets (the per-provider queues live in ProviderClients)."""
+
+    def __init__(self):
+        self.weights = parse_weights(os.getenv("LLM_WEIGHTS", ""))
+        self.rate = max(0.0, env_float("LLM_USER_RATE_PER_MIN", 0.0)) / 60.0  # 0: no per-user limit
+        self.burst = max(1.0, env_float("LLM_USER_BURST", 10.0))
+        self.max_users = max(1, env_int("LLM_USER_BUCKETS_MAX", 100000))
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()  # user_id -> [tokens, refilled at]
+
+    def weight(self, level: str) -> float:
+        return self.weights.get(level.strip().lower(), 1.0)
+
+    def take(self, user_id: str, weight: float):
+        """Spend one token of the user's bucket, or raise RateLimited."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        rate, cap = self.rate * weight, self.burst * weight
+        b = self._buckets.pop(user_id, None)
+        tokens = cap if b is None else min(cap, b[0] + (now - b[1]) * rate)
+        ok = tokens >= 1.0
+        self._buckets[user_id] = [tokens - 1.0 if ok else tokens, now]
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)  # least recently active; comes back with a full bucket
+        if not ok:
+            LLM_RATE_LIMITED.inc()
+            raise RateLimited(user_id, (1.0 - tokens) / rate)
+
+    def refund(self, user_id: str, weight: float):
+        """Give back the token of a turn that turned out not to need the LLM (an idempotent replay)."""
+        b = self._buckets.get(user_id)
+        if b is not None:
+            b[0] = min(self.burst * weight, b[0] + 1.0)
+
+class FairSlots:
+    """One provider's slots, granted in weighted fair order with at most `per_user` per user (uncapped without a caller)."""
+
+    def __init__(self, provider: str, slots: int, per_user: int):
+        self.provider, self.free, self.per_user = provider, slots, per_user
+        self._vtime = 0.0
+        self._finish: Dict[str, float] = {}  # user -> virtual finish of their latest call
+        self._active: Dict[str, int] = {}    # user -> slots held
+        self._waiting: List[List[Any]] = []  # [start, seq, user, future]
+        self._seq = 0
+
+    def _dispatch(self):
+        while self.free and self._waiting:
+            nxt = min((w for w in self._waiting if not w[2] or self._active.get(w[2], 0) < self.per_user), default=None)
+            if nxt is None:
+                break  # everyone waiting is at their per-user cap
+            self._waiting.remove(nxt)
+            start, _, user, fut = nxt
+            self.free -= 1
+            self._active[user] = self._active.get(user, 0) + 1
+            self._vtime = max(self._vtime, start)
+            fut.set_result(None)
+        LLM_QUEUED.set(len(self._waiting), provider=self.provider)
+
+    def _release(self, user: str):
+        self.free += 1
+        held = self._active.pop(user) - 1
+        if held:
+            self._active[user] = held
+        elif self._finish.get(user, 0.0) <= self._vtime:
+            self._finish.pop(user, None)  # a new call would start at the virtual time anyway
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        user, weight = _CALLER.get()
+        start = max(self._vtime, self._finish.get(user, 0.0))
+        self._finish[user] = start + 1.0 / weight
+        fut = asyncio.get_running_loop().create_future()
+        entry = [start, self._seq, user, fut]
+        self._seq += 1
+        self._waiting.append(entry)
+        self._dispatch()
+        t0 = time.perf_counter()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                self._waiting.remove(entry)
+                self._dispatch()
+            else:
+                self._release(user)  # granted just as we were cancelled
+            raise
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - t0, provider=self.provider)
+        try:
+            yield
+        finally:
+            self._release(user)
+
+def per_user_concurrency() -> int:
+    return max(1, env_int("LLM_USER_MAX_CONCURRENCY", 2))
+
+def admit(user_id: str, level: str, charge: bool = True):
+    """Charge a chat turn to the user's bucket (RateLimited if empty) and make them the caller of this request's LLM calls."""
+    adm = get_admission()
+    weight = adm.weight(level)
+    if charge:
+        adm.take(user_id, weight)
+    _CALLER.set((user_id, weight))  # scoped to the current task, i.e. this request
+
+def refund(user_id: str, level: str):
+    adm = get_admission()
+    adm.refund(user_id, adm.weight(level))
+
+_admission: Admission | None = None
+
+def get_admission() -> Admission:
+    global _admission
+    if _admission is None:
+        _admission = Admission()
+    return _admission
+
+def reset_admission():
+    """Drop the token buckets and re-read the LLM_WEIGHTS / LLM_USER_* settings."""
+    global _admission
+    _admission = None
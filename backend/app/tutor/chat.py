@@ -1,9 +1,14 @@
 from __future__ import annotations
-import json, os, re
-from typing import Any, Dict, List
+import asyncio, functools, json, os, re
+from typing import Any, AsyncIterator, Dict, List
 
-import httpx
-from .prompts import system_prompt
+from .clients import get_clients
+from ..metrics import LLM_REQUESTS, llm_call, record_tokens, span
+from . import gemini_cache
+from .dispatch import get_dispatcher
+from .response_cache import get_response_cache
+from .prompts import PROMPT_VERSION, session_prompt, system_prompt
+from .tagger import get_tagger
 
 JSON_RE = re.compile(r"\{\s*\"skills\"\s*:\s*\[.*\]\s*\}\s*$", re.DOTALL)
 
@@ -23,15 +28,77 @@ def _extract_reply_and_skills(content: str) -> Dict[str, Any]:
         reply = content
     return {"reply": reply, "skills": skills}
 
-async def _call_openai_compat(context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
-    api_key = os.getenv("LLM_API_KEY", "").strip()
-    base_url = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1").strip()
-    model = os.getenv("LLM_MODEL", "gpt-4o-mini").strip()
+_SKILLS_KEY = '"skills"'
+_OPENER_RE = re.compile(r'\{\s*"skills"\s*:')
 
-    if not api_key:
-        return _fallback_local(message)
+class SkillTagParser:
+    """Incremental counterpart of `_extract_reply_and_skills` for streamed replies.
+
+    `feed()` returns the text that is safe to forward right away; anything that
+    could be the start of the trailing {"skills":[...]} block (and trailing
+    whitespace before it) is held back, so each character is scanned once.
+    `close()` returns whatever is left to forward and fills in `reply`/`skills`.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._emitted = 0     # buf[:_emitted] has been forwarded (or was leading whitespace)
+        self._started = False
+        self._scan = 0        # next index to look for "{"
+        self._block: int | None = None  # start of the skills block, once seen
+        self.reply = ""
+        self.skills: List[Dict[str, Any]] = []
 
-    payload = {
+    @staticmethod
+    def _maybe_opener(tail: str) -> bool:
+        rest = tail[1:].lstrip()
+        if len(rest) < len(_SKILLS_KEY):
+            return _SKILLS_KEY.startswith(rest)
+        return rest.startswith(_SKILLS_KEY) and not rest[len(_SKILLS_KEY):].strip()
+
+    def _emit(self, end: int) -> str:
+        piece = self._buf[self._emitted:end]
+        if not self._started:
+            lead = len(piece) - len(piece.lstrip())
+            self._emitted, piece = self._emitted + lead, piece[lead:]
+            self._started = bool(piece)
+        # trailing whitespace is only forwarded once more text follows it
+        piece = piece.rstrip()
+        self._emitted += len(piece)
+        return piece
+
+    def feed(self, text: str) -> str:
+        self._buf += text
+        if self._block is not None:
+            return ""
+        while True:
+            j = self._buf.find("{", self._scan)
+            if j < 0:
+                self._scan = len(self._buf)
+                return self._emit(len(self._buf))
+            if _OPENER_RE.match(self._buf, j):
+                self._block = j
+                return self._emit(j)
+            if self._maybe_opener(self._buf[j:]):
+                self._scan = j  # wait for more text to decide
+                return self._emit(j)
+            self._scan = j + 1
+
+    def close(self) -> str:
+        end = len(self._buf)
+        if self._block is not None:
+            try:
+                obj = json.loads(self._buf[self._block:])
+                self.skills = obj.get("skills", []) if isinstance(obj, dict) else []
+                end = self._block
+            except ValueError:
+                pass
+        tail = self._emit(end)
+        self.reply = self._buf[:end].strip()
+        return tail
+
+def openai_payload(model: str, context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {
         "model": model,
         "messages": [
             {"role": "system", "content": system_prompt(context, level)},
@@ -39,63 +106,172 @@ async def _call_openai_compat(context: str, level: str, message: str, history: L
             {"role": "user", "content": message},
         ],
         "temperature": 0.4,
+        # routes requests that share the static prefix to the same cache (OpenAI; opt-in for compat servers)
+        **({"prompt_cache_key": f"tutor-{PROMPT_VERSION}"} if os.getenv("LLM_PROMPT_CACHE_KEY", "0") == "1" else {}),
     }
 
+async def _call_openai_compat(context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
+    api_key = os.getenv("LLM_API_KEY", "").strip()
+    base_url = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1").strip()
+    model = os.getenv("LLM_MODEL", "gpt-4o-mini").strip()
+
+    if not api_key:
+        return _fallback_local(message)
+
+    payload = openai_payload(model, context, level, message, history)
     headers = {"Authorization": f"Bearer {api_key}"}
-    async with httpx.AsyncClient(base_url=base_url, timeout=40) as client:
-        r = await client.post("/chat/completions", headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
-        content = data["choices"][0]["message"]["content"]
+    clients = get_clients()
+    async with clients.slot("openai_compat"):
+        with llm_call("openai_compat", model):
+            r = await clients.http(base_url).post("/chat/completions", headers=headers, json=payload)
+            r.raise_for_status()
+    data = r.json()
+    usage = data.get("usage") or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    record_tokens("openai_compat", model, usage.get("prompt_tokens"), usage.get("completion_tokens"), cached)
+    content = data["choices"][0]["message"]["content"]
 
-    return _extract_reply_and_skills(content)
+    with span("llm.extract"):
+        return _extract_reply_and_skills(content)
 
-async def _call_gemini(context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
-    api_key = os.getenv("GEMINI_API_KEY", "").strip()
-    model = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
+async def _stream_openai_compat(context: str, level: str, message: str, history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    api_key = os.getenv("LLM_API_KEY", "").strip()
+    base_url = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1").strip()
+    model = os.getenv("LLM_MODEL", "gpt-4o-mini").strip()
 
     if not api_key:
-        return _fallback_local(message, hint="Set GEMINI_API_KEY in backend/.env to use Gemini.")
+        yield _fallback_text(message)
+        return
+
+    payload = {**openai_payload(model, context, level, message, history), "stream": True}
+    headers = {"Authorization": f"Bearer {api_key}"}
+    clients = get_clients()
+    async with clients.slot("openai_compat"):
+        with llm_call("openai_compat", model):
+            async with clients.http(base_url).stream("POST", "/chat/completions", headers=headers, json=payload) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        choices = json.loads(data).get("choices") or []
+                    except ValueError:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        yield delta
 
-    # Lazy import so project can still run without Gemini installed (though requirements include it)
-    from google import genai
+async def _gemini_generate(client, **kwargs):
+    """Never block the event loop: prefer the SDK's async API, else a bounded executor."""
+    aio = getattr(client, "aio", None)
+    if aio is not None:
+        return await aio.models.generate_content(**kwargs)
+    loop = asyncio.get_running_loop()
+    fn = functools.partial(client.models.generate_content, **kwargs)
+    return await loop.run_in_executor(get_clients().executor(), fn)
 
-    client = genai.Client(api_key=api_key)
+def _gemini_tokens(model: str, resp):
+    usage = getattr(resp, "usage_metadata", None)
+    record_tokens("gemini", model, getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None),
+                  getattr(usage, "cached_content_token_count", None))
 
-    # Convert history into a compact transcript (reliable with Gemini)
+def _gemini_prompt(context: str, level: str, message: str, history: List[Dict[str, str]], static: bool = True) -> str:
+    # Convert history into a compact transcript (reliable with Gemini);
+    # its length is already bounded by the memory token budget
     transcript = []
-    for turn in history[-10:]:
+    for turn in history:
         role = turn.get("role", "user")
         content = turn.get("content", "")
+        if role == "system":  # rolling summary of older turns
+            transcript.append(content)
+            continue
         transcript.append(("User: " if role == "user" else "Tutor: ") + content)
 
-    prompt = (
-        system_prompt(context, level)
+    # with a context cache the static instructions are already on the server
+    head = system_prompt(context, level) if static else session_prompt(context, level).lstrip()
+    return (
+        head
         + "\n\nConversation so far:\n"
         + "\n".join(transcript)
         + "\n\nUser: " + message
         + "\nTutor:"
     )
 
-    resp = client.models.generate_content(
-        model=model,
-        contents=prompt,
-        config={"temperature": 0.4},
-    )
+async def _gemini_request(client, model: str, context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
+    cache = await gemini_cache.cached_content(client, model)
+    config: Dict[str, Any] = {"temperature": 0.4}
+    if cache:
+        config["cached_content"] = cache
+    return dict(model=model, contents=_gemini_prompt(context, level, message, history, static=cache is None), config=config)
+
+async def _call_gemini(context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
+    api_key = os.getenv("GEMINI_API_KEY", "").strip()
+    model = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
+
+    if not api_key:
+        return _fallback_local(message, hint="Set GEMINI_API_KEY in backend/.env to use Gemini.")
+
+    clients = get_clients()
+    client = clients.gemini(api_key)
+
+    kwargs = await _gemini_request(client, model, context, level, message, history)
+
+    async with clients.slot("gemini"):
+        with llm_call("gemini", model):
+            try:
+                resp = await _gemini_generate(client, **kwargs)
+            except Exception:
+                if "cached_content" not in kwargs["config"]:
+                    raise
+                # cache expired or was deleted server-side: retry once with the full prompt
+                gemini_cache.invalidate(model)
+                kwargs = dict(model=model, contents=_gemini_prompt(context, level, message, history), config={"temperature": 0.4})
+                resp = await _gemini_generate(client, **kwargs)
+    _gemini_tokens(model, resp)
 
     content = (resp.text or "").strip()
-    return _extract_reply_and_skills(content)
+    with span("llm.extract"):
+        return _extract_reply_and_skills(content)
+
+async def _stream_gemini(context: str, level: str, message: str, history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    api_key = os.getenv("GEMINI_API_KEY", "").strip()
+    model = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
+
+    if not api_key:
+        yield _fallback_text(message, hint="Set GEMINI_API_KEY in backend/.env to use Gemini.")
+        return
+
+    clients = get_clients()
+    client = clients.gemini(api_key)
+    kwargs = await _gemini_request(client, model, context, level, message, history)
+
+    async with clients.slot("gemini"):
+        with llm_call("gemini", model):
+            aio = getattr(client, "aio", None)
+            if aio is None:
+                # No async streaming API: degrade to a single chunk from the executor
+                resp = await _gemini_generate(client, **kwargs)
+                _gemini_tokens(model, resp)
+                yield resp.text or ""
+                return
+            try:
+                resp = None
+                async for resp in await aio.models.generate_content_stream(**kwargs):
+                    if resp.text:
+                        yield resp.text
+            except Exception:
+                if "cached_content" in kwargs["config"]:
+                    gemini_cache.invalidate(model)  # in case the cache went stale; recreated next turn
+                raise
+            _gemini_tokens(model, resp)  # usage arrives on the final chunk
 
 def _fallback_local(message: str, hint: str | None = None) -> Dict[str, Any]:
-    # Simple local response + naive skill tags (keeps adaptive engine working)
-    skills = []
-    low = message.lower()
-    if "bag" in low or "overweight" in low:
-        skills.append({"skill_id": "vocab:overweight_bag", "quality": 4})
-    if "please" not in low:
-        skills.append({"skill_id": "phrase:polite_request", "quality": 2})
-    if not skills:
-        skills.append({"skill_id": "phrase:basic_response", "quality": 3})
+    # Simple local response + lexicon skill tags (keeps adaptive engine working)
+    LLM_REQUESTS.inc(provider="local", model="fallback", outcome="ok")
+    skills = get_tagger().tag(message)
 
     reply = (
         ("(" + hint + ")\n\n" if hint else "")
@@ -103,14 +279,84 @@ def _fallback_local(message: str, hint: str | None = None) -> Dict[str, Any]:
         + "Try: ‘Hi, I’m checking in for my flight. My bag might be overweight — what are my options?’\n"
         + "Now you: ask if you can move items to a carry-on."
     )
-    return {"reply": reply, "skills": skills}
+    return {"reply": reply, "skills": skills, "source": "local"}
+
+def _fallback_text(message: str, hint: str | None = None) -> str:
+    """Local reply rendered the way an LLM would stream it (reply + skills JSON)."""
+    out = _fallback_local(message, hint=hint)
+    return out["reply"] + "\n" + json.dumps({"skills": out["skills"]})
+
+def provider_name() -> str:
+    """Configured provider: "gemini" or "openai_compat" (anything else)."""
+    return "gemini" if os.getenv("LLM_PROVIDER", "openai_compat").strip().lower() == "gemini" else "openai_compat"
+
+def model_name(provider: str) -> str:
+    if provider == "gemini":
+        return os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
+    return os.getenv("LLM_MODEL", "gpt-4o-mini").strip()
+
+def _has_api_key(provider: str) -> bool:
+    return bool(os.getenv("GEMINI_API_KEY" if provider == "gemini" else "LLM_API_KEY", "").strip())
+
+def _local_reply(provider: str, message: str) -> Dict[str, Any]:
+    hint = "Set GEMINI_API_KEY in backend/.env to use Gemini." if provider == "gemini" and not _has_api_key(provider) else None
+    return _fallback_local(message, hint=hint)
+
+# provider name -> call / stream; the dispatcher only sees these (swap in fakes to test it)
+PROVIDER_CALLS = {"gemini": _call_gemini, "openai_compat": _call_openai_compat}
+PROVIDER_STREAMS = {"gemini": _stream_gemini, "openai_compat": _stream_openai_compat}
 
 async def call_llm(context: str, level: str, message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
     """LLM router.
     Set LLM_PROVIDER=gemini to use Gemini (recommended).
     Or LLM_PROVIDER=openai_compat to use OpenAI-compatible endpoints.
+    Failures are retried / failed over by the dispatcher (tutor/dispatch.py),
+    ending at the local tutor. Short-history turns may be answered from the
+    response cache (RESPONSE_CACHE=1).
     """
-    provider = os.getenv("LLM_PROVIDER", "openai_compat").strip().lower()
-    if provider == "gemini":
-        return await _call_gemini(context, level, message, history)
-    return await _call_openai_compat(context, level, message, history)
+    provider = provider_name()
+    cache = get_response_cache()
+    key = cache.key(provider, model_name(provider), context, level, history, message)
+
+    async def invoke(name: str) -> Dict[str, Any]:
+        return {**await PROVIDER_CALLS[name](context, level, message, history), "source": name}
+
+    async def call():
+        return await get_dispatcher().call(provider, _has_api_key, invoke, lambda: _local_reply(provider, message))
+
+    with span(f"llm.{provider}"):
+        return await cache.get_or_call(key, call)
+
+def _stream_provider(provider: str, context: str, level: str, message: str, history: List[Dict[str, str]],
+                     served: List[str] | None = None) -> AsyncIterator[str]:
+    def fallback() -> str:
+        out = _local_reply(provider, message)
+        return out["reply"] + "\n" + json.dumps({"skills": out["skills"]})
+
+    return get_dispatcher().stream(
+        provider, _has_api_key,
+        lambda name: PROVIDER_STREAMS[name](context, level, message, history),
+        fallback,
+        served,
+    )
+
+async def _stream_cached(key: str, provider: str, context: str, level: str, message: str, history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    cache = get_response_cache()
+    hit = await cache.get(key)
+    if hit is not None:
+        yield hit["reply"] + "\n" + json.dumps({"skills": hit["skills"]})
+        return
+    parts, served = [], []
+    async for chunk in _stream_provider(provider, context, level, message, history, served):
+        parts.append(chunk)
+        yield chunk
+    if served and served[-1] != "local":  # never pin the offline fallback
+        await cache.put(key, _extract_reply_and_skills("".join(parts)))
+
+def stream_llm(context: str, level: str, message: str, history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """Streaming variant of `call_llm`: yields raw text chunks (feed them to SkillTagParser)."""
+    provider = provider_name()
+    key = get_response_cache().key(provider, model_name(provider), context, level, history, message)
+    if key is not None:
+        return _stream_cached(key, provider, context, level, message, history)
+    return _stream_provider(provider, context, level, message, history)
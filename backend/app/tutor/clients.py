@@ -0,0 +1,118 @@
+from __future__ import annotations
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, AsyncContextManager, Dict
+
+from ..env import env_float, env_int
+from .admission import FairSlots, per_user_concurrency
+
+if TYPE_CHECKING:
+    import httpx
+
+def http2_enabled() -> bool:
+    """HTTP/2 is opt-in (LLM_HTTP2=1) and needs the optional `h2` package."""
+    if os.getenv("LLM_HTTP2", "0").strip().lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def http_timeout() -> httpx.Timeout:
+    import httpx
+
+    read = env_float("LLM_READ_TIMEOUT", 40.0)
+    connect = env_float("LLM_CONNECT_TIMEOUT", 5.0)
+    return httpx.Timeout(read, connect=connect, pool=env_float("LLM_POOL_TIMEOUT", 10.0))
+
+def http_limits() -> httpx.Limits:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=env_int("LLM_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=env_int("LLM_MAX_KEEPALIVE", 20),
+        keepalive_expiry=env_float("LLM_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+def max_concurrency(provider: str) -> int:
+    """Per-provider cap on in-flight LLM calls, e.g. LLM_MAX_CONCURRENCY_GEMINI=8."""
+    return max(1, env_int(f"LLM_MAX_CONCURRENCY_{provider.upper()}", env_int("LLM_MAX_CONCURRENCY", 16)))
+
+class ProviderClients:
+    """Long-lived LLM clients, one per upstream, owned by the app lifespan.
+
+    Reusing them keeps TCP/TLS connections alive between chat turns instead of
+    paying a fresh handshake on every request.
+    """
+
+    def __init__(self):
+        self._http: Dict[str, httpx.AsyncClient] = {}
+        self._gemini: Dict[str, Any] = {}
+        self._slots: Dict[str, FairSlots] = {}
+        self._executor: ThreadPoolExecutor | None = None
+
+    def slot(self, provider: str) -> AsyncContextManager[None]:
+        """One of the provider's LLM_MAX_CONCURRENCY slots, shared fairly between users (tutor/admission.py)."""
+        slots = self._slots.get(provider)
+        if slots is None:
+            slots = self._slots[provider] = FairSlots(provider, max_concurrency(provider), per_user_concurrency())
+        return slots.slot()
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Dedicated, bounded pool for SDK calls that only have a blocking API."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max_concurrency("gemini"), thread_name_prefix="llm-sync")
+        return self._executor
+
+    def http(self, base_url: str) -> httpx.AsyncClient:
+        client = self._http.get(base_url)
+        if client is None or client.is_closed:
+            # imported on first use, like google.genai below: startup does not pay for it
+            import httpx
+
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=http_timeout(),
+                limits=http_limits(),
+                http2=http2_enabled(),
+            )
+            self._http[base_url] = client
+        return client
+
+    def gemini(self, api_key: str):
+        client = self._gemini.get(api_key)
+        if client is None:
+            # Lazy import so project can still run without Gemini installed
+            from google import genai
+
+            http_options: Dict[str, Any] = {"timeout": int(env_float("LLM_READ_TIMEOUT", 40.0) * 1000)}
+            base_url = os.getenv("GEMINI_BASE_URL", "").strip()
+            if base_url:  # a proxy/gateway, or the stub server in bench/fake_llm.py
+                http_options["base_url"] = base_url
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            self._gemini[api_key] = client
+        return client
+
+    async def aclose(self):
+        for client in self._http.values():
+            await client.aclose()
+        self._http.clear()
+        self._gemini.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_clients: ProviderClients | None = None
+
+def get_clients() -> ProviderClients:
+    global _clients
+    if _clients is None:
+        _clients = ProviderClients()
+    return _clients
+
+async def close_clients():
+    global _clients
+    if _clients is not None:
+        await _clients.aclose()
+    _clients = None
@@ -0,0 +1,307 @@
+"""Resilient LLM dispatch: queue limits, jittered retries, hedging, circuit breaking and failover.
+
+For each turn the dispatcher walks the failover order (LLM_FAILOVER, default:
+the configured provider, then the other one if it has an API key) and finally
+the local tutor. A provider is skipped while its circuit breaker is open or
+its queue (callers beyond LLM_MAX_CONCURRENCY waiting for a slot) is full, so
+overload degrades to the local reply instead of piling up. 429/5xx/transport
+errors are retried with full-jitter backoff inside an overall LLM_DEADLINE_S.
+With LLM_HEDGE=1 a second attempt is fired once the first runs past the
+provider's recent p95, and whichever finishes first wins.
+
+Provider calls are plain `async (provider) -> result` callables, so everything
+here runs against local fakes (see bench/dispatcher.py).
+"""
+from __future__ import annotations
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List
+
+from ..env import env_float, env_int
+from ..metrics import Counter, Gauge
+from .clients import max_concurrency
+
+LLM_DISPATCH = Counter("llm_dispatch_total", "Dispatcher events (retry, hedge, hedge_win, failover, shed, open_skip, fallback).",
+                       ("provider", "event"))
+LLM_CIRCUIT_OPEN = Gauge("llm_circuit_open", "1 while a provider's circuit breaker is open.", ("provider",))
+
+PROVIDERS = ("gemini", "openai_compat")
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def status_of(e: BaseException) -> int | None:
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    if code is None:
+        code = getattr(e, "code", None)  # google.genai.errors.APIError
+    return code if isinstance(code, int) else None
+
+def retryable(e: BaseException) -> bool:
+    code = status_of(e)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    # httpx is imported on the first openai_compat call; until then none of its errors can occur
+    httpx = sys.modules.get("httpx")
+    transport = (httpx.TransportError,) if httpx is not None else ()
+    return isinstance(e, transport + (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+def retry_after(e: BaseException) -> float | None:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """Opens when at least `ratio` of the last `window` calls failed; after `cooldown` one probe call is let through.
+
+    A probe that never reports back (cancelled, or stuck past `probe_timeout`) does not keep the breaker half-open
+    forever: `abandon()` frees it right away, the timeout lets the next call probe anyway.
+    """
+
+    def __init__(self, provider: str, window: int, ratio: float, min_calls: int, cooldown: float, probe_timeout: float):
+        self.provider, self.ratio, self.min_calls, self.cooldown = provider, ratio, min_calls, cooldown
+        self.probe_timeout = probe_timeout
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True = failure
+        self.opened_at: float | None = None
+        self.probe_at: float | None = None  # when the current half-open probe was let through
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.cooldown and (self.probe_at is None or now - self.probe_at >= self.probe_timeout):
+            self.probe_at = now  # half-open
+            return True
+        return False
+
+    def abandon(self, probe_at: float | None):
+        """The call let through at `probe_at` ended without an outcome (cancelled): let the next call probe."""
+        if probe_at is not None and self.probe_at == probe_at:
+            self.probe_at = None
+
+    def _close(self):
+        self.opened_at, self.probe_at = None, None
+        self.outcomes.clear()
+        LLM_CIRCUIT_OPEN.set(0, provider=self.provider)
+
+    def _open(self):
+        self.opened_at, self.probe_at = time.monotonic(), None
+        self.outcomes.clear()
+        LLM_CIRCUIT_OPEN.set(1, provider=self.provider)
+
+    def success(self):
+        if self.opened_at is not None:
+            self._close()  # probe succeeded
+        else:
+            self.outcomes.append(False)
+
+    def failure(self):
+        if self.opened_at is not None:
+            self._open()  # probe failed: another cooldown
+            return
+        self.outcomes.append(True)
+        if len(self.outcomes) >= self.min_calls and sum(self.outcomes) >= self.ratio * len(self.outcomes):
+            self._open()
+
+class Dispatcher:
+    def __init__(self):
+        self.retries = max(0, env_int("LLM_RETRIES", 2))
+        self.backoff_base = env_float("LLM_RETRY_BASE_MS", 200) / 1000.0
+        self.backoff_max = env_float("LLM_RETRY_MAX_MS", 2000) / 1000.0
+        self.deadline = env_float("LLM_DEADLINE_S", 45.0)
+        self.hedge = os.getenv("LLM_HEDGE", "0").strip().lower() in ("1", "true", "yes")
+        self.hedge_min = env_float("LLM_HEDGE_MIN_MS", 50) / 1000.0
+        self.breaker_window = max(1, env_int("LLM_BREAKER_WINDOW", 20))
+        self.breaker_ratio = env_float("LLM_BREAKER_RATIO", 0.8)
+        self.breaker_min_calls = max(1, env_int("LLM_BREAKER_MIN_CALLS", 10))
+        self.breaker_cooldown = env_float("LLM_BREAKER_COOLDOWN_S", 30.0)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=200))
+        self._inflight: Dict[str, int] = defaultdict(int)
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        br = self._breakers.get(provider)
+        if br is None:
+            br = self._breakers[provider] = CircuitBreaker(
+                provider, self.breaker_window, self.breaker_ratio, self.breaker_min_calls, self.breaker_cooldown,
+                self.deadline)
+        return br
+
+    def max_queue(self, provider: str) -> int:
+        return max(0, env_int(f"LLM_MAX_QUEUE_{provider.upper()}", env_int("LLM_MAX_QUEUE", 64)))
+
+    def order(self, primary: str, has_key: Callable[[str], bool]) -> List[str]:
+        names = [p.strip() for p in os.getenv("LLM_FAILOVER", "").split(",") if p.strip() in PROVIDERS]
+        names = names or [primary] + [p for p in PROVIDERS if p != primary]
+        return [p for p in dict.fromkeys(names) if has_key(p)]
+
+    def _admit(self, provider: str) -> bool:
+        if self._inflight[provider] >= max_concurrency(provider) + self.max_queue(provider):
+            LLM_DISPATCH.inc(provider=provider, event="shed")
+            return False
+        if not self.breaker(provider).allow():
+            LLM_DISPATCH.inc(provider=provider, event="open_skip")
+            return False
+        return True
+
+    def hedge_delay(self, provider: str) -> float | None:
+        samples = self._latency[provider]
+        if not self.hedge or len(samples) < 20 or self._inflight[provider] >= max_concurrency(provider):
+            return None  # no estimate yet, or already saturated: a hedge would only add load
+        return max(self.hedge_min, sorted(samples)[int(0.95 * (len(samples) - 1))])
+
+    def _backoff(self, attempt: int, e: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        hint = retry_after(e)
+        return max(delay, min(hint, self.backoff_max)) if hint is not None else delay
+
+    async def _hedged(self, provider: str, invoke: Callable[[str], Awaitable[Any]], delay: float):
+        tasks = [asyncio.ensure_future(invoke(provider))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                LLM_DISPATCH.inc(provider=provider, event="hedge")
+                tasks.append(asyncio.ensure_future(invoke(provider)))
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not tasks[0]:
+                            LLM_DISPATCH.inc(provider=provider, event="hedge_win")
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def _attempt(self, provider: str, invoke: Callable[[str], Awaitable[Any]], deadline: float):
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise asyncio.TimeoutError("LLM deadline exceeded")
+        hedge_after = self.hedge_delay(provider)
+        t0 = time.monotonic()
+        self._inflight[provider] += 1
+        try:
+            if hedge_after is None:
+                result = await asyncio.wait_for(invoke(provider), timeout)
+            else:
+                result = await asyncio.wait_for(self._hedged(provider, invoke, hedge_after), timeout)
+        finally:
+            self._inflight[provider] -= 1
+        self._latency[provider].append(time.monotonic() - t0)
+        return result
+
+    async def call(self, primary: str, has_key: Callable[[str], bool], invoke: Callable[[str], Awaitable[Dict[str, Any]]],
+                   fallback: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """First successful `invoke(provider)` in failover order, else `fallback()`."""
+        deadline = time.monotonic() + self.deadline
+        for provider in self.order(primary, has_key):
+            if time.monotonic() >= deadline:
+                break
+            if not self._admit(provider):
+                continue
+            br = self.breaker(provider)
+            probe = br.probe_at
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        result = await self._attempt(provider, invoke, deadline)
+                        br.success()
+                        return result
+                    except Exception as e:
+                        if not retryable(e):
+                            br.success()  # the provider answered; this request is the problem
+                            break  # e.g. 400/401: another provider may still work
+                        br.failure()
+                        delay = self._backoff(attempt, e)
+                        if attempt == self.retries or not br.allow() or time.monotonic() + delay >= deadline:
+                            break
+                        probe = br.probe_at
+                        LLM_DISPATCH.inc(provider=provider, event="retry")
+                        await asyncio.sleep(delay)
+            except BaseException:
+                br.abandon(probe)  # cancelled (e.g. the client went away): do not leave the breaker half-open
+                raise
+            LLM_DISPATCH.inc(provider=provider, event="failover")
+        LLM_DISPATCH.inc(provider="local", event="fallback")
+        return fallback()
+
+    async def stream(self, primary: str, has_key: Callable[[str], bool], open_stream: Callable[[str], AsyncIterator[str]],
+                     fallback: Callable[[], str], served: List[str] | None = None) -> AsyncIterator[str]:
+        """Streaming variant: retries and failover only happen before the first chunk is forwarded.
+
+        LLM_DEADLINE_S bounds the wait for the first chunk, as it bounds `call`; once it has passed the client
+        gets `fallback()`. `served`, if given, gets the name of whoever produced the output ("local" for the
+        fallback), like the "source" key of `call`'s result.
+        """
+        deadline = time.monotonic() + self.deadline
+        for provider in self.order(primary, has_key):
+            if time.monotonic() >= deadline:
+                break
+            if not self._admit(provider):
+                continue
+            br = self.breaker(provider)
+            probe = br.probe_at
+            try:
+                for attempt in range(self.retries + 1):
+                    started = False
+                    self._inflight[provider] += 1
+                    chunks = open_stream(provider).__aiter__()
+                    try:
+                        try:
+                            first = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                        except StopAsyncIteration:
+                            br.success()
+                            return
+                        if served is not None:
+                            served.append(provider)
+                        started = True
+                        yield first
+                        async for chunk in chunks:  # the rest streams at the provider's pace
+                            yield chunk
+                        br.success()
+                        return
+                    except Exception as e:
+                        if started:
+                            br.failure() if retryable(e) else br.success()
+                            raise  # the client already has part of this reply
+                        if not retryable(e):
+                            br.success()
+                            break
+                        br.failure()
+                        delay = self._backoff(attempt, e)
+                        if attempt == self.retries or not br.allow() or time.monotonic() + delay >= deadline:
+                            break
+                        probe = br.probe_at
+                        LLM_DISPATCH.inc(provider=provider, event="retry")
+                        await asyncio.sleep(delay)
+                    finally:
+                        self._inflight[provider] -= 1
+            except BaseException:
+                br.abandon(probe)  # cancelled, or GeneratorExit when a stream client disconnects
+                raise
+            LLM_DISPATCH.inc(provider=provider, event="failover")
+        LLM_DISPATCH.inc(provider="local", event="fallback")
+        if served is not None:
+            served.append("local")
+        yield fallback()
+
+_dispatcher: Dispatcher | None = None
+
+def get_dispatcher() -> Dispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = Dispatcher()
+    return _dispatcher
+
+def reset_dispatcher():
+    """Drop breaker/latency state and re-read the LLM_* settings."""
+    global _dispatcher
+    _dispatcher = None
@@ -0,0 +1,58 @@
+"""Explicit Gemini context caching of STATIC_INSTRUCTIONS (opt-in: GEMINI_CONTEXT_CACHE=1).
+
+One CachedContent per model holds the static instruction block; turns then send
+only the per-session part and transcript with `cached_content` set. Models that
+refuse the cache (e.g. the block is under their minimum cacheable size) are
+remembered for a TTL and served uncached; newer models still get implicit
+caching from the stable prefix.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+from ..env import env_int
+from .prompts import PROMPT_VERSION, STATIC_INSTRUCTIONS
+
+log = logging.getLogger(__name__)
+
+_caches: Dict[str, Tuple[str | None, float]] = {}  # model -> (cache name or None, valid until)
+_lock = asyncio.Lock()
+
+def enabled() -> bool:
+    return os.getenv("GEMINI_CONTEXT_CACHE", "0").strip().lower() in ("1", "true", "yes")
+
+def ttl_seconds() -> int:
+    return max(120, env_int("GEMINI_CACHE_TTL_S", 3600))
+
+async def cached_content(client, model: str) -> str | None:
+    """Name of the CachedContent holding the static prefix for `model`, or None."""
+    aio = getattr(client, "aio", None)
+    if not enabled() or aio is None:
+        return None
+    name, until = _caches.get(model, (None, 0.0))
+    if time.monotonic() < until:
+        return name
+    async with _lock:
+        name, until = _caches.get(model, (None, 0.0))
+        if time.monotonic() < until:
+            return name
+        ttl = ttl_seconds()
+        try:
+            cache = await aio.caches.create(model=model, config={
+                "system_instruction": STATIC_INSTRUCTIONS,
+                "display_name": f"tutor-{PROMPT_VERSION}",
+                "ttl": f"{ttl}s",
+            })
+            name = cache.name
+        except Exception as e:
+            log.warning("Gemini context cache unavailable for %s: %s", model, e)
+            name = None
+        # refresh a minute early so requests never reference an expired cache
+        _caches[model] = (name, time.monotonic() + ttl - 60)
+        return name
+
+def invalidate(model: str):
+    _caches.pop(model, None)
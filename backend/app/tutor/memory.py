@@ -0,0 +1,171 @@
+"""Token-budgeted conversation memory.
+
+Each user gets a window of recent turns plus a rolling summary of the turns
+that fell out of it, sized to fit a per-provider token budget. Windows live
+in process (LRU) and are caught up from `chat_turns` with an `id > last_id`
+range read, so a turn never rebuilds the history from scratch. The summary is
+stored in `chat_memory` and written in the same commit as the turn's skills.
+
+Summaries are extractive (a one-line gist per evicted turn), so keeping them
+costs no extra LLM call.
+"""
+from __future__ import annotations
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.models import ChatMemory, ChatTurn
+from ..db.session import dialect_insert
+from ..db.write_behind import with_pending
+from ..env import env_int
+
+SUMMARY_HEADER = "Earlier in this conversation:"
+GIST_CHARS = 160
+LOAD_TURNS = 64      # turns read when a window is (re)built
+MIN_TURNS = 2        # always keep the last exchange verbatim
+
+_SENTENCE_RE = re.compile(r".+?[.!?](?=\s|$)")
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token; close enough for budgeting English chat."""
+    return (len(text) + 3) // 4
+
+def token_budget(provider: str) -> int:
+    """History budget per provider, e.g. MEMORY_TOKEN_BUDGET_GEMINI=2000."""
+    return max(64, env_int(f"MEMORY_TOKEN_BUDGET_{provider.upper()}", env_int("MEMORY_TOKEN_BUDGET", 800)))
+
+def gist(role: str, content: str) -> str:
+    text = " ".join(content.split())
+    m = _SENTENCE_RE.match(text)
+    first = m.group(0) if m else text
+    if len(first) > GIST_CHARS:
+        first = first[:GIST_CHARS - 1].rstrip() + "…"
+    return ("User: " if role == "user" else "Tutor: ") + first
+
+@dataclass
+class Window:
+    covered_id: int = 0  # last ChatTurn.id folded into the summary
+    summary: Deque[str] = field(default_factory=deque)
+    summary_tokens: int = 0
+    turns: Deque[Tuple[int, str, str, int]] = field(default_factory=deque)  # id, role, content, tokens
+    turn_tokens: int = 0
+    dirty: bool = False
+
+    @property
+    def last_id(self) -> int:
+        return self.turns[-1][0] if self.turns else self.covered_id
+
+    def add(self, turn_id: int, role: str, content: str):
+        n = estimate_tokens(content)
+        self.turns.append((turn_id, role, content, n))
+        self.turn_tokens += n
+
+    def fit(self, budget: int):
+        """Fold the oldest turns into the summary until the window fits `budget`."""
+        while len(self.turns) > MIN_TURNS and self.turn_tokens + self.summary_tokens > budget:
+            turn_id, role, content, n = self.turns.popleft()
+            self.turn_tokens -= n
+            line = gist(role, content)
+            self.summary.append(line)
+            self.summary_tokens += estimate_tokens(line) + 1
+            self.covered_id = turn_id
+            self.dirty = True
+            self._trim_summary(budget // 4)
+        self._trim_summary(budget // 4)
+
+    def _trim_summary(self, cap: int):
+        # the summary gets at most a quarter of the budget; oldest gists go first
+        while self.summary and self.summary_tokens > cap:
+            self.summary_tokens -= estimate_tokens(self.summary.popleft()) + 1
+            self.dirty = True
+
+    def history(self) -> List[Dict[str, str]]:
+        out = []
+        if self.summary:
+            out.append({"role": "system", "content": SUMMARY_HEADER + "\n" + "\n".join(self.summary)})
+        out.extend({"role": role, "content": content} for _, role, content, _ in self.turns)
+        return out
+
+class ConversationMemory:
+    def __init__(self, max_users: int | None = None):
+        self.max_users = max_users or env_int("MEMORY_CACHE_USERS", 10000)
+        self._windows: "OrderedDict[str, Window]" = OrderedDict()
+
+    async def _turns_after(self, db: AsyncSession, user_id: str, after_id: int, limit: int):
+        q = (
+            select(ChatTurn.id, ChatTurn.role, ChatTurn.content)
+            .where(ChatTurn.user_id == user_id, ChatTurn.id > after_id, ChatTurn.role.in_(("user", "assistant")))
+            .order_by(ChatTurn.id.desc()).limit(limit)
+        )
+        return list(reversed((await db.execute(q)).all()))
+
+    async def _load(self, db: AsyncSession, user_id: str) -> Window:
+        row = (await db.execute(
+            select(ChatMemory.summary, ChatMemory.covered_turn_id).where(ChatMemory.user_id == user_id)
+        )).first()
+        w = Window()
+        if row is not None:
+            w.covered_id = row.covered_turn_id
+            for line in filter(None, row.summary.split("\n")):
+                w.summary.append(line)
+                w.summary_tokens += estimate_tokens(line) + 1
+        for r in await self._turns_after(db, user_id, w.covered_id, LOAD_TURNS):
+            w.add(r.id, r.role, r.content)
+        return w
+
+    async def history(self, db: AsyncSession, user_id: str, budget: int) -> List[Dict[str, str]]:
+        """Summary message (if any) followed by the recent turns, within `budget` tokens.
+
+        Turns still in the write-behind buffer have no id yet; they are appended
+        verbatim after the window and picked up by id once flushed.
+        """
+        w, pending = await with_pending(user_id, ChatTurn, lambda: self._catch_up(db, user_id))
+        w.fit(max(0, budget - sum(estimate_tokens(r["content"]) for r in pending)))
+        self._windows[user_id] = w
+        while len(self._windows) > self.max_users:
+            self._windows.popitem(last=False)
+        return w.history() + [{"role": r["role"], "content": r["content"]} for r in pending]
+
+    async def _catch_up(self, db: AsyncSession, user_id: str) -> Window:
+        w = self._windows.get(user_id)
+        if w is None:
+            w = await self._load(db, user_id)
+        else:
+            self._windows.move_to_end(user_id)
+            new = await self._turns_after(db, user_id, w.last_id, LOAD_TURNS)
+            if len(new) == LOAD_TURNS:  # fell far behind (other workers): rebuild
+                w = await self._load(db, user_id)
+            else:
+                for r in new:
+                    w.add(r.id, r.role, r.content)
+        return w
+
+    async def persist(self, db: AsyncSession, user_id: str):
+        """Stage the summary upsert if it changed (caller commits)."""
+        w = self._windows.get(user_id)
+        if w is None or not w.dirty:
+            return
+        values = dict(user_id=user_id, summary="\n".join(w.summary), covered_turn_id=w.covered_id,
+                      updated_at=datetime.now(tz=timezone.utc))
+        stmt = dialect_insert(db, ChatMemory).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[ChatMemory.user_id], set_=values)
+        await db.execute(stmt)
+        w.dirty = False
+
+    async def forget(self, db: AsyncSession, user_id: str):
+        """Drop the window and stored summary (caller commits)."""
+        self._windows.pop(user_id, None)
+        await db.execute(delete(ChatMemory).where(ChatMemory.user_id == user_id))
+
+_memory: ConversationMemory | None = None
+
+def get_memory() -> ConversationMemory:
+    global _memory
+    if _memory is None:
+        _memory = ConversationMemory()
+    return _memory
@@ -1,8 +1,11 @@
-def system_prompt(context: str, level: str) -> str:
-    return f"""You are an AI language tutor.
+from __future__ import annotations
+import hashlib
+from functools import lru_cache
+
+# Byte-identical for every user, context and level, and always sent first, so
+# providers can reuse their cached prefix. Keep per-turn values out of it.
+STATIC_INSTRUCTIONS = """You are an AI language tutor.
 Conversation-first: teach through realistic dialogue, not lectures.
-Context: {context}
-Level: {level}
 
 Rules:
 - Keep turns short and natural.
@@ -12,7 +15,7 @@ Rules:
 - If user is stuck, offer 2-3 options they can choose from.
 - At the end of your message, output a JSON block on a new line:
 
-{{"skills":[{{"skill_id":"...","quality":0-5}}...]}}
+{"skills":[{"skill_id":"...","quality":0-5}...]}
 
 Where 'skill_id' are concise labels like:
 - phrase:check_in
@@ -21,3 +24,14 @@ Where 'skill_id' are concise labels like:
 Quality meaning:
 5 perfect, 4 good, 3 okay, 2 weak, 1 wrong, 0 no attempt.
 """
+
+# changes whenever the static block does; used to key provider-side caches
+PROMPT_VERSION = hashlib.sha256(STATIC_INSTRUCTIONS.encode()).hexdigest()[:12]
+
+def session_prompt(context: str, level: str) -> str:
+    """The variable part of the system prompt, sent after STATIC_INSTRUCTIONS."""
+    return f"\nContext: {context}\nLevel: {level}\n"
+
+@lru_cache(maxsize=512)
+def system_prompt(context: str, level: str) -> str:
+    return STATIC_INSTRUCTIONS + session_prompt(context, level)
@@ -0,0 +1,185 @@
+"""Exact-match response cache for short-history tutor turns (opt-in: RESPONSE_CACHE=1).
+
+Key: normalized (provider, model, prompt version, context, level, history
+hash, message). Only turns with at most RESPONSE_CACHE_MAX_HISTORY prior turns
+are eligible -- openers like "Hi, I'm checking in for my flight" -- since a
+reply that depends on a longer conversation is not safe to share.
+
+Tiers: an in-process LRU, plus an optional SQLite file (RESPONSE_CACHE_SQLITE)
+shared by workers and kept apart from the main database so cache writes never
+contend with turn commits. Cached results keep their `skills`, so the caller
+still runs update_skill on a hit. Concurrent misses for one key share a call.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from ..env import env_int
+from ..metrics import Counter
+from .prompts import PROMPT_VERSION
+
+log = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = Counter("response_cache_lookups_total", "Response cache lookups by result.", ("result",))
+CACHE_EVICTIONS = Counter("response_cache_evictions_total", "Response cache entries evicted (size bound).", ("tier",))
+
+_WS_RE = re.compile(r"\s+")
+_TRAIL_RE = re.compile(r"[\s.!?,;:]+$")
+
+def normalize(text: str) -> str:
+    """Case, whitespace, curly quotes and trailing punctuation do not change the key."""
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return _TRAIL_RE.sub("", _WS_RE.sub(" ", text).strip().lower())
+
+class ResponseCache:
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE", "0").strip().lower() in ("1", "true", "yes")
+        self.ttl = env_int("RESPONSE_CACHE_TTL_S", 6 * 3600)
+        self.max_entries = max(1, env_int("RESPONSE_CACHE_SIZE", 5000))
+        self.max_history = env_int("RESPONSE_CACHE_MAX_HISTORY", 2)
+        self.sqlite_path = os.getenv("RESPONSE_CACHE_SQLITE", "").strip() or None
+        self.sqlite_rows = max(1, env_int("RESPONSE_CACHE_SQLITE_ROWS", 100_000))
+        self._lru: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db = None
+        self._puts = 0
+
+    def key(self, provider: str, model: str, context: str, level: str,
+            history: List[Dict[str, str]], message: str) -> str | None:
+        """Cache key, or None when the turn is not eligible."""
+        if not self.enabled or len(history) > self.max_history:
+            return None
+        hist = [(h.get("role", ""), normalize(h.get("content", ""))) for h in history]
+        raw = json.dumps([provider, model, PROMPT_VERSION, normalize(context), normalize(level), hist, normalize(message)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def _sqlite(self):
+        if self._db is None:
+            import aiosqlite
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.sqlite_path)), exist_ok=True)
+            self._db = await aiosqlite.connect(self.sqlite_path)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            await self._db.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires ON response_cache (expires_at)")
+            await self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self._lru[key] = (expires_at, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            CACHE_EVICTIONS.inc(tier="memory")
+
+    async def get(self, key: str) -> Dict[str, Any] | None:
+        now = time.time()
+        hit = self._lru.get(key)
+        if hit is not None:
+            if hit[0] > now:
+                self._lru.move_to_end(key)
+                CACHE_LOOKUPS.inc(result="hit_memory")
+                return hit[1]
+            del self._lru[key]
+        if self.sqlite_path:
+            try:
+                db = await self._sqlite()
+                async with db.execute("SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)) as cur:
+                    row = await cur.fetchone()
+            except Exception as e:  # a broken cache tier must not fail the turn
+                log.warning("response cache read failed: %s", e)
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                CACHE_LOOKUPS.inc(result="hit_sqlite")
+                return value
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        expires_at = time.time() + self.ttl
+        value = {"reply": value["reply"], "skills": value.get("skills", [])}
+        self._remember(key, expires_at, value)
+        if self.sqlite_path:
+            try:
+                db = await self._sqlite()
+                await db.execute("INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                 (key, json.dumps(value), expires_at))
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    await self._prune(db)
+                await db.commit()
+            except Exception as e:
+                log.warning("response cache write failed: %s", e)
+
+    async def _prune(self, db):
+        await db.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        # size bound: drop the entries closest to expiry (i.e. the oldest writes)
+        cur = await db.execute(
+            "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.sqlite_rows,),
+        )
+        if cur.rowcount > 0:
+            CACHE_EVICTIONS.inc(cur.rowcount, tier="sqlite")
+
+    async def get_or_call(self, key: str | None, call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Serve `key` from the cache or run `call()` once (concurrent misses share it)."""
+        if key is None:
+            return await call()
+        hit = await self.get(key)
+        if hit is not None:
+            return {**hit, "source": "cache"}
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # this request was cancelled, not the shared call
+            return await call()
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+        fut.set_result(result)
+        if result.get("source") != "local":  # never pin the offline fallback
+            await self.put(key, result)
+        return result
+
+    async def aclose(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+_cache: ResponseCache | None = None
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+async def close_response_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.aclose()
+    _cache = None
@@ -0,0 +1,132 @@
+"""Local skill tagger for the offline tutor (no API key, or every provider failed).
+
+The lexicon is built once per process from:
+- the context skills in `context/scenarios.SUGGESTED_SKILLS` (their ids double as phrases: `phrase:check_in` -> "check in"),
+- vocabulary from the `SCENARIOS` texts (`vocab:<word>`),
+- the phrases, politeness markers and grammar patterns in `skill_lexicon.json` (SKILL_LEXICON_PATH overrides it).
+
+Literal phrases compile into trie-shaped regexes (skills, and politeness
+markers, which may sit inside a skill phrase), so a message costs one pass per
+regex however many phrases there are. Grammar patterns are tried only at word
+starts, as one alternation with a named group each.
+
+Quality: using a phrase or word scores the lexicon's quality (4); an error
+pattern scores low and wins over a correct use of the same skill in the
+message; requests score 4 when asked politely and 2 when not.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from ..context.scenarios import SCENARIOS, SUGGESTED_SKILLS
+
+MAX_SKILLS = 5
+DEFAULT_SKILL = {"skill_id": "phrase:basic_response", "quality": 3}
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().replace("’", "'").replace("‘", "'").split())
+
+def _singular(word: str) -> str:
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    return word[:-1] if word.endswith("s") and not word.endswith("ss") else word
+
+def _trie_regex(phrases: List[str]) -> str:
+    """One regex matching any of `phrases`, shaped as a trie so matching does not try them one by one."""
+    trie: Dict[str, Any] = {}
+    for p in phrases:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body  # greedy: the longest phrase wins
+
+    return emit(trie)
+
+class SkillTagger:
+    def __init__(self, lexicon: Dict[str, Any]):
+        phrases: Dict[str, List[Tuple[str, int]]] = {}
+
+        def add(phrase: str, skill: str, quality: int):
+            phrases.setdefault(_normalize(phrase), []).append((skill, quality))
+
+        phrase_q, vocab_q = lexicon.get("phrase_quality", 4), lexicon.get("vocab_quality", 4)
+        for skill, items in lexicon.get("phrases", {}).items():
+            for p in items:
+                add(p, skill, vocab_q if skill.startswith("vocab:") else phrase_q)
+        for skill in {s for skills in SUGGESTED_SKILLS.values() for s in skills}:
+            name = skill.partition(":")[2].replace("_", " ")
+            if name not in phrases:
+                add(name, skill, vocab_q if skill.startswith("vocab:") else phrase_q)
+        # scenario vocabulary not already part of a phrase (those words are tagged through their phrase skill)
+        covered = {w for p in phrases for w in p.split()} | set(lexicon.get("scenario_stopwords", []))
+        for texts in SCENARIOS.values():
+            for word in re.findall(r"[a-z]+", " ".join(texts).lower()):
+                if len(word) >= 6 and word not in covered and _singular(word) not in covered:
+                    for form in {word, _singular(word)}:
+                        phrases.setdefault(form, [(f"vocab:{_singular(word)}", vocab_q)])
+        polite = lexicon.get("politeness", {})
+        self.polite_skill = polite.get("skill", "phrase:polite_request")
+        self.polite_q, self.blunt_q = polite.get("polite_quality", 4), polite.get("blunt_quality", 2)
+        self.markers = {**{_normalize(p): False for p in polite.get("requests", [])},
+                        **{_normalize(p): True for p in polite.get("polite", [])}}  # phrase -> polite?
+
+        self.phrases = phrases
+        # an empty trie would compile to an empty pattern, which matches "" everywhere
+        self.phrase_re = re.compile(r"(?<!\w)" + _trie_regex(sorted(phrases)) + r"(?!\w)") if phrases else None
+        self.marker_re = re.compile(r"(?<!\w)" + _trie_regex(sorted(self.markers)) + r"(?!\w)") if self.markers else None
+        patterns = lexicon.get("patterns", [])
+        self.patterns = [(p["skill"], int(p["quality"])) for p in patterns]
+        # a shared word-start check in front of the alternation is several times faster than one per pattern
+        self.pattern_re = re.compile(r"(?<!\w)(?:" + "|".join(f"(?P<p{i}>{p['regex']})" for i, p in enumerate(patterns)) + ")")
+
+    @property
+    def skills(self) -> List[str]:
+        out = {s for hits in self.phrases.values() for s, _ in hits}
+        return sorted(out | {s for s, _ in self.patterns} | {self.polite_skill})
+
+    def tag(self, message: str) -> List[Dict[str, Any]]:
+        """Skill ids with SM-2 qualities (0-5) for one learner message, in order of first appearance."""
+        text = _normalize(message)
+        good: Dict[str, int] = {}
+        bad: Dict[str, int] = {}
+        if self.phrase_re:
+            for m in self.phrase_re.finditer(text):
+                for skill, q in self.phrases[m.group(0)]:
+                    good[skill] = max(good.get(skill, 0), q)
+        if self.patterns:
+            for m in self.pattern_re.finditer(text):
+                skill, q = self.patterns[int(m.lastgroup[1:])]
+                if q >= 3:
+                    good[skill] = max(good.get(skill, 0), q)
+                else:
+                    bad[skill] = min(bad.get(skill, 5), q)
+        markers = {self.markers[m.group(0)] for m in self.marker_re.finditer(text)} if self.marker_re else set()
+        if markers:  # a request (or a polite marker): was it asked politely?
+            good[self.polite_skill] = self.polite_q if True in markers else self.blunt_q
+        skills = [{"skill_id": s, "quality": bad.get(s, q)} for s, q in good.items()]
+        skills += [{"skill_id": s, "quality": q} for s, q in bad.items() if s not in good]
+        return skills[:MAX_SKILLS] or [dict(DEFAULT_SKILL)]
+
+def load_lexicon(path: str | None = None) -> Dict[str, Any]:
+    path = path or os.getenv("SKILL_LEXICON_PATH") or str(Path(__file__).with_name("skill_lexicon.json"))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+_tagger: SkillTagger | None = None
+
+def get_tagger() -> SkillTagger:
+    """The process-wide tagger; compiled on first use (the app lifespan does it at startup)."""
+    global _tagger
+    if _tagger is None:
+        _tagger = SkillTagger(load_lexicon())
+    return _tagger
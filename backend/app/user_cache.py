@@ -0,0 +1,160 @@
+"""Per-process cache of user profiles, skill sets and practice plans (USER_CACHE=0 disables it).
+
+Entries are filled on read and updated in place by this process's writes
+(profile PUT, the chat turn's skill upsert, which also drops the user's
+plans), so a worker never serves its own stale data. Writes made elsewhere (other workers, `adaptive/replay.py`) show up
+once an entry is older than USER_CACHE_TTL_S. Skill sets larger than
+USER_CACHE_MAX_SKILLS are not cached; those users keep the indexed queries.
+"""
+from __future__ import annotations
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .env import env_float, env_int
+from .metrics import Counter
+
+LARGE = "large"  # cached marker: this user's skill set is over USER_CACHE_MAX_SKILLS
+
+USER_CACHE_LOOKUPS = Counter("user_cache_lookups_total", "Profile/skill cache lookups by kind and result.", ("kind", "result"))
+
+def skill_order(row: Dict[str, Any]):
+    """Same order as `ORDER BY next_due ASC NULLS FIRST`."""
+    nd = row["next_due"]
+    if nd is None:
+        return (0, 0.0)
+    return (1, (nd if nd.tzinfo else nd.replace(tzinfo=timezone.utc)).timestamp())
+
+class _LRU:
+    def __init__(self, kind: str, max_entries: int, ttl: float):
+        self.kind, self.max_entries, self.ttl = kind, max_entries, ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._written: "OrderedDict[str, float]" = OrderedDict()  # key -> time of the last write-through
+
+    def get(self, key: str):
+        hit = self._data.get(key)
+        if hit is None or hit[0] <= time.monotonic():
+            self._data.pop(key, None)
+            USER_CACHE_LOOKUPS.inc(kind=self.kind, result="miss")
+            return None
+        self._data.move_to_end(key)
+        USER_CACHE_LOOKUPS.inc(kind=self.kind, result="hit")
+        return hit[1]
+
+    def peek(self, key: str):
+        hit = self._data.get(key)
+        return hit[1] if hit is not None and hit[0] > time.monotonic() else None
+
+    def put(self, key: str, value: Any, keep_expiry: bool = False):
+        old = self._data.get(key)
+        expires = old[0] if keep_expiry and old is not None else time.monotonic() + self.ttl
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def fill(self, key: str, value: Any, started: float):
+        """Cache what a read that began at `started` loaded, unless a write-through happened since."""
+        if self._written.get(key, -1.0) < started:
+            self.put(key, value)
+
+    def wrote(self, key: str):
+        self._written[key] = time.monotonic()
+        self._written.move_to_end(key)
+        while len(self._written) > self.max_entries:
+            self._written.popitem(last=False)
+
+    def pop(self, key: str):
+        self._data.pop(key, None)
+
+class UserCache:
+    def __init__(self):
+        self.enabled = os.getenv("USER_CACHE", "1").strip().lower() not in ("0", "false", "no")
+        size, ttl = max(1, env_int("USER_CACHE_USERS", 10000)), env_float("USER_CACHE_TTL_S", 30.0)
+        self.max_skills = env_int("USER_CACHE_MAX_SKILLS", 500)
+        self._profiles = _LRU("profile", size, ttl)
+        self._skills = _LRU("skills", size, ttl)
+        self._plans = _LRU("plans", size, ttl)  # user_id -> {(context, limit): (body, valid_until)}
+
+    @staticmethod
+    def clock() -> float:
+        """Take this before a loading read; pass it to fill_*."""
+        return time.monotonic()
+
+    def profile(self, user_id: str):
+        return self._profiles.get(user_id) if self.enabled else None
+
+    def fill_profile(self, user_id: str, profile, started: float):
+        if self.enabled:
+            self._profiles.fill(user_id, profile, started)
+
+    def write_profile(self, user_id: str, profile):
+        """Write-through after a committed profile update."""
+        if self.enabled:
+            self._profiles.wrote(user_id)
+            self._profiles.put(user_id, profile)
+
+    def skills(self, user_id: str) -> List[Dict[str, Any]] | str | None:
+        """The user's skill rows in next_due order (treat as read-only), LARGE, or None on a miss."""
+        return self._skills.get(user_id) if self.enabled else None
+
+    def fill_skills(self, user_id: str, rows: List[Dict[str, Any]], started: float):
+        if self.enabled:
+            self._skills.fill(user_id, rows if len(rows) <= self.max_skills else LARGE, started)
+
+    def plan(self, user_id: str, context: str, limit: int, now: datetime) -> bytes | None:
+        """A stored practice plan body still valid at `now` (see practice_plans.py), or None."""
+        if not self.enabled:
+            return None
+        plans = self._plans.peek(user_id)
+        hit = plans.get((context, limit)) if plans else None
+        if hit is not None and (hit[1] is None or hit[1] > now):
+            self._plans.get(user_id)  # counts the hit, keeps the entry recent
+            return hit[0]
+        USER_CACHE_LOOKUPS.inc(kind="plans", result="miss")
+        return None
+
+    def fill_plan(self, user_id: str, context: str, limit: int, body: bytes, valid_until: datetime | None, started: float):
+        if self.enabled:
+            plans = dict(self._plans.peek(user_id) or {})
+            plans[(context, limit)] = (body, valid_until)
+            self._plans.fill(user_id, plans, started)
+
+    def write_skills(self, user_id: str, rows: Iterable[Dict[str, Any]]):
+        """Write-through after a committed skill upsert; rows carry the full skill state."""
+        if not self.enabled:
+            return
+        self._plans.wrote(user_id)
+        self._plans.pop(user_id)
+        self._skills.wrote(user_id)
+        cached = self._skills.peek(user_id)
+        if not isinstance(cached, list):
+            return
+        merged = {r["skill_id"]: r for r in cached}
+        merged.update((r["skill_id"], r) for r in rows)
+        if len(merged) > self.max_skills:
+            self._skills.put(user_id, LARGE, keep_expiry=True)
+            return
+        # a fresh list, so readers holding the old one never see it change; the TTL still runs from the load
+        self._skills.put(user_id, sorted(merged.values(), key=skill_order), keep_expiry=True)
+
+    def invalidate(self, user_id: str):
+        self._profiles.pop(user_id)
+        self._skills.pop(user_id)
+        self._plans.pop(user_id)
+
+def as_stored(dt: datetime | None, naive: bool) -> datetime | None:
+    """A datetime as the database hands it back (SQLite: naive UTC), for write-through values."""
+    if dt is None or not naive or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+_cache: UserCache | None = None
+
+def get_user_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        _cache = UserCache()
+    return _cache
@@ -0,0 +1,156 @@
+"""Cold start: import time of app.main and time to the first served request, single and multi-worker.
+
+    cd backend && python -m bench.cold_start --runs 5 --workers 4
+
+- `import`: median wall time of `import app.main` in a fresh interpreter, which
+  optional heavy modules that pulled in, and the slowest top-level imports
+  (from `python -X importtime`).
+- `uvicorn`: spawns `uvicorn app.main:app` and polls GET / until it answers, on a
+  fresh SQLite file (schema created + migrated) and on an already-migrated one.
+  `first_db_request_ms` is the first GET /api/skills after that.
+- `workers`: N workers started together on a fresh file: time to the first
+  answer, how many workers finished startup, startup errors (e.g. racing
+  create_all / "database is locked"), and whether `schema_version` ended up
+  with each migration exactly once.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import re
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("httpx", "google.genai", "h2", "orjson", "uvicorn")
+PROBE = (
+    "import json, sys, time\n"
+    "t0 = time.perf_counter()\n"
+    "import app.main\n"
+    "print(json.dumps({'import_ms': (time.perf_counter() - t0) * 1000, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+) % (HEAVY,)
+
+def _env(db_path: str) -> dict:
+    return {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}", "RETENTION": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+
+def import_profile(runs: int) -> dict:
+    db = os.path.join(tempfile.mkdtemp(), "app.db")
+    samples, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND, env=_env(db), capture_output=True, text=True, check=True)
+        row = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(row["import_ms"])
+        loaded = row["loaded"]
+    prof = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND, env=_env(db),
+                          capture_output=True, text=True, check=True)
+    top, pending = [], []
+    for line in prof.stderr.splitlines():  # children are listed before their parent
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)", line)
+        if m and len(m.group(2)) == 3:
+            pending.append((int(m.group(1)) / 1000, m.group(3)))
+        elif m and len(m.group(2)) == 1:
+            top, pending = (pending if m.group(3) == "app.main" else top), []
+    top.sort(reverse=True)
+    return {"import_ms_median": round(statistics.median(samples), 1), "import_ms_min": round(min(samples), 1),
+            "heavy_modules_loaded": loaded, "slowest_imports_ms": {name: round(ms, 1) for ms, name in top[:8]}}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _get(url: str) -> int | None:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as r:
+            return r.status
+    except OSError:
+        return None
+
+def _spawn(db_path: str, port: int, workers: int = 1) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "info"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=BACKEND, env=_env(db_path), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+def _stop(proc: subprocess.Popen) -> str:
+    proc.terminate()
+    try:
+        _, err = proc.communicate(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        _, err = proc.communicate()
+    return err
+
+def first_request(db_path: str, timeout: float = 60.0) -> dict:
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = _spawn(db_path, port)
+    try:
+        while _get(f"http://127.0.0.1:{port}/") != 200:
+            if proc.poll() is not None or time.perf_counter() - t0 > timeout:
+                raise RuntimeError("server did not start:\n" + _stop(proc)[-2000:])
+            time.sleep(0.01)
+        ready = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        status = _get(f"http://127.0.0.1:{port}/api/skills/cold")
+        first_db = time.perf_counter() - t1
+    finally:
+        _stop(proc)
+    return {"time_to_first_request_ms": round(ready * 1000, 1), "first_db_request_ms": round(first_db * 1000, 1),
+            "first_db_status": status}
+
+def multi_worker(workers: int, timeout: float = 90.0) -> dict:
+    from app.db.migrations import MIGRATIONS
+
+    db_path = os.path.join(tempfile.mkdtemp(), "app.db")
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = _spawn(db_path, port, workers)
+    ready_s = None
+    while time.perf_counter() - t0 < timeout and proc.poll() is None:
+        if _get(f"http://127.0.0.1:{port}/") == 200 and ready_s is None:
+            ready_s = time.perf_counter() - t0
+        time.sleep(0.05)
+        if ready_s is not None and time.perf_counter() - t0 > ready_s + 3:  # give the slower workers time to finish startup
+            break
+    err = _stop(proc)
+    started = err.count("Application startup complete")
+    errors = len(re.findall(r"Traceback|Application startup failed|database is locked|already exists", err))
+    conn = sqlite3.connect(db_path)
+    try:
+        versions = [v for (v,) in conn.execute("SELECT version FROM schema_version")]
+    except sqlite3.Error:
+        versions = []
+    conn.close()
+    return {"workers": workers, "time_to_first_request_ms": round(ready_s * 1000, 1) if ready_s else None,
+            "workers_started": started, "startup_errors": errors,
+            "migrations_once": sorted(versions) == [v for v, _, _ in MIGRATIONS]}
+
+def main(args):
+    results = {"import": import_profile(args.runs)}
+    fresh, warm = [], []
+    for _ in range(args.runs):
+        db = os.path.join(tempfile.mkdtemp(), "app.db")
+        fresh.append(first_request(db))
+        warm.append(first_request(db))  # same file, schema already current
+
+    def median(rows, key):
+        return round(statistics.median(r[key] for r in rows), 1)
+
+    results["uvicorn"] = {name: {k: median(rows, k) for k in ("time_to_first_request_ms", "first_db_request_ms")}
+                          for name, rows in (("fresh_db", fresh), ("migrated_db", warm))}
+    if args.workers > 1:
+        results["workers"] = multi_worker(args.workers)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=4, help="also start this many uvicorn workers on one fresh file (1 = skip)")
+    main(ap.parse_args())
@@ -0,0 +1,47 @@
+"""Shared helpers for the benchmark scripts (run them with `python -m bench.<name>` from backend/)."""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    xs = sorted(samples)
+    k = min(len(xs) - 1, max(0, int(round(pct / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+def summarize(samples_s: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    ms = [x * 1000.0 for x in samples_s]
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+async def run_concurrent(fn: Callable[[int], Awaitable[None]], total: int, concurrency: int) -> List[float]:
+    """Call fn(i) `total` times with at most `concurrency` in flight; returns per-call latencies."""
+    latencies: List[float] = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            t0 = time.perf_counter()
+            await fn(i)
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+def catalog_ids(conn: sqlite3.Connection, names: Iterable[str]) -> Dict[str, int]:
+    """skill_catalog ids for canonical skill names, adding the missing ones (for seeds written with sqlite3)."""
+    from app.db.skill_catalog import spelling_key
+
+    names = list(names)
+    conn.executemany("INSERT OR IGNORE INTO skill_catalog (name, key) VALUES (?, ?)", [(n, spelling_key(n)) for n in names])
+    wanted = set(names)
+    return {n: i for n, i in conn.execute("SELECT name, id FROM skill_catalog") if n in wanted}
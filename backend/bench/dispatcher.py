@@ -0,0 +1,115 @@
+"""LLM dispatcher under injected faults: retries, failover + circuit breaker, hedging and load shedding.
+
+    cd backend && python -m bench.dispatcher
+
+Two stub servers stand in for the providers: "openai_compat" (primary) and a
+"gemini" stand-in swapped into PROVIDER_CALLS. Each scenario reports which
+provider answered, the latency summary and how many requests hit each stub.
+Exits non-zero unless retries answer more flaky-primary turns from the primary
+than no retries, failover serves the turns of a downed primary from the
+secondary, every turn with both down gets the local reply (no exception), and
+load shedding keeps p95 under `--max-shed-p95-ms` and below the unbounded queue's.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+BASE_ENV = {
+    "LLM_PROVIDER": "openai_compat", "LLM_API_KEY": "stub", "LLM_MODEL": "stub", "GEMINI_API_KEY": "stub",
+    "LLM_RETRIES": "2", "LLM_RETRY_BASE_MS": "20", "LLM_RETRY_MAX_MS": "200", "LLM_HEDGE": "0",
+    "LLM_BREAKER_WINDOW": "20", "LLM_BREAKER_RATIO": "0.8", "LLM_BREAKER_MIN_CALLS": "10",
+    "LLM_BREAKER_COOLDOWN_S": "30", "LLM_MAX_CONCURRENCY": "16", "LLM_MAX_QUEUE": "64",
+    "LLM_FAILOVER": "openai_compat,gemini",
+}
+
+# name, env overrides, stub faults (primary; "secondary_fail_rate" downs the other), requests, concurrency
+SCENARIOS = [
+    ("flaky_no_retry", {"LLM_RETRIES": "0", "LLM_FAILOVER": "openai_compat"}, {"fail_rate": 0.3}, 300, 8),
+    ("flaky_retry", {"LLM_FAILOVER": "openai_compat"}, {"fail_rate": 0.3}, 300, 8),
+    ("flaky_429_retry", {"LLM_FAILOVER": "openai_compat"}, {"fail_rate": 0.3, "fail_status": 429}, 300, 8),
+    ("primary_down_failover", {}, {"fail_rate": 1.0, "fail_status": 500}, 300, 8),
+    ("both_down", {}, {"fail_rate": 1.0, "fail_status": 500, "secondary_fail_rate": 1.0}, 100, 8),
+    ("tail_no_hedge", {}, {"slow_rate": 0.05, "slow_ms": 400}, 400, 4),
+    ("tail_hedge", {"LLM_HEDGE": "1"}, {"slow_rate": 0.05, "slow_ms": 400}, 400, 4),
+    ("overload_unbounded", {"LLM_MAX_CONCURRENCY": "4", "LLM_MAX_QUEUE": "10000", "LLM_FAILOVER": "openai_compat"},
+     {"extra_latency_ms": 100}, 256, 64),
+    ("overload_shed", {"LLM_MAX_CONCURRENCY": "4", "LLM_MAX_QUEUE": "8", "LLM_FAILOVER": "openai_compat"},
+     {"extra_latency_ms": 100}, 256, 64),
+]
+
+async def run(args):
+    from app.tutor import chat as tutor
+    from app.tutor.clients import close_clients, get_clients
+    from app.tutor.dispatch import reset_dispatcher
+
+    primary = FakeLLMServer(latency_ms=args.latency_ms).start()
+    secondary = FakeLLMServer(latency_ms=args.latency_ms).start()
+
+    async def fake_gemini(context, level, message, history):
+        payload = tutor.openai_payload("stub", context, level, message, history)
+        async with get_clients().slot("gemini"):
+            r = await get_clients().http(secondary.base_url).post("/chat/completions", json=payload)
+        r.raise_for_status()
+        return tutor._extract_reply_and_skills(r.json()["choices"][0]["message"]["content"])
+
+    tutor.PROVIDER_CALLS["gemini"] = fake_gemini
+    results = {}
+    try:
+        for name, env, faults, total, concurrency in SCENARIOS:
+            os.environ.update({**BASE_ENV, "LLM_BASE_URL": primary.base_url, **env})
+            await close_clients()
+            reset_dispatcher()
+            state = primary.app.state
+            state.fail_rate, state.fail_status = faults.get("fail_rate", 0.0), faults.get("fail_status", 503)
+            state.slow_rate, state.slow_ms = faults.get("slow_rate", 0.0), faults.get("slow_ms", 0.0)
+            secondary.app.state.fail_rate = faults.get("secondary_fail_rate", 0.0)
+            secondary.app.state.fail_status = 500
+            extra = faults.get("extra_latency_ms", 0.0)
+            if extra:
+                state.slow_rate, state.slow_ms = 1.0, extra
+            before = (primary.app.state.requests, secondary.app.state.requests)
+            sources = Counter()
+
+            async def turn(i: int):
+                try:
+                    out = await tutor.call_llm("Airport", "Beginner", f"Hi, I need to check in ({i})", [])
+                except Exception as e:  # the route would answer 500
+                    sources[f"error:{e.__class__.__name__}"] += 1
+                    return
+                sources[out.get("source", "?")] += 1
+
+            await common.run_concurrent(turn, 20, 4) if name.startswith("tail") else None  # latency samples for hedging
+            sources.clear()
+            res = common.summarize(await common.run_concurrent(turn, total, concurrency))
+            res["answered_by"] = dict(sources)
+            res["primary_requests"] = primary.app.state.requests - before[0]
+            res["secondary_requests"] = secondary.app.state.requests - before[1]
+            results[name] = res
+    finally:
+        await close_clients()
+        primary.stop()
+        secondary.stop()
+    by = {name: r["answered_by"] for name, r in results.items()}
+    down, both = results["primary_down_failover"], results["both_down"]
+    checks = {
+        "retries_answer_more": by["flaky_retry"].get("openai_compat", 0) > by["flaky_no_retry"].get("openai_compat", 0),
+        "failover_serves": by["primary_down_failover"].get("gemini", 0) >= 0.9 * down["n"],
+        "both_down_local": by["both_down"] == {"local": both["n"]},
+        "shed_p95_bounded": results["overload_shed"]["p95_ms"] <= min(args.max_shed_p95_ms,
+                                                                      results["overload_unbounded"]["p95_ms"]),
+    }
+    print(json.dumps({**results, "checks": checks}, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--latency-ms", type=float, default=10.0)
+    ap.add_argument("--max-shed-p95-ms", type=float, default=1000.0, help="p95 allowed under overload with shedding")
+    asyncio.run(run(ap.parse_args()))
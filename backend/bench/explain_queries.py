@@ -0,0 +1,72 @@
+"""Assert that every SELECT issued by the API routes is served from an index.
+
+    cd backend && python -m bench.explain_queries
+
+Drives each route against a temp SQLite DB, captures the statements the app
+sends, and runs EXPLAIN QUERY PLAN on each. A plain `SCAN <table>` (full table
+scan) on any of them is a failure; exits non-zero and prints the offending plans.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+SCAN_RE = re.compile(r"^SCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    db_path = f"{tmp}/app.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.pop("LLM_API_KEY", None)
+    os.environ.pop("GEMINI_API_KEY", None)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.main import app
+    from app.db.session import init_engine
+    from app.user_cache import get_user_cache
+
+    captured = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    with TestClient(app) as c:
+        for i in range(3):
+            c.post("/api/chat", json={"user_id": "u1", "message": f"my bag is overweight {i}"})
+        event.listen(init_engine().sync_engine, "before_cursor_execute", capture)
+        # first with the user cache (its fill queries), then without it (the uncached paths)
+        for cached in (True, False):
+            get_user_cache().enabled = cached
+            c.post("/api/chat", json={"user_id": "u1", "message": "please help"})
+            c.post("/api/practice/next", json={"user_id": "u1"})
+            c.get("/api/skills/u1")
+            c.get("/api/history/u1")
+            for path in ("/api/skills/u1?limit=1", "/api/history/u1?limit=2"):  # and a second keyset page
+                c.get(path + "&cursor=" + c.get(path).headers["x-next-cursor"])
+            c.get("/api/profile/u1")
+            c.post("/api/activity/log", json={"user_id": "u1", "minutes": 3})
+            c.get("/api/progress/u1")
+
+    conn = sqlite3.connect(db_path)
+    report, failures = [], 0
+    seen = set()
+    for statement, params in captured:
+        if statement in seen:
+            continue
+        seen.add(statement)
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, params)]
+        scans = [p for p in plan if SCAN_RE.match(p)]
+        failures += bool(scans)
+        report.append({"sql": " ".join(statement.split()), "plan": plan, "ok": not scans})
+    print(json.dumps(report, indent=2))
+    print(f"{len(report)} queries checked, {failures} full table scans", file=sys.stderr)
+    sys.exit(1 if failures or not report else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""LLM fair sharing: light-user chat latency next to heavy users, FIFO slots vs weighted fair queuing (+ token buckets).
+
+    cd backend && python -m bench.fair_share --duration 15
+
+Drives /api/chat (in process, temp SQLite DB) against the stub LLM, which
+answers after `--latency-ms` (a right and a wrong use of a skill, as in
+bench/load.py), with `--slots` provider slots. `--heavy` users
+each send turns back to back (a scripted client: the turn lock keeps each of
+them to one turn at a time, so the pressure comes from many of them); `--light`
+users each send a turn every `--light-gap-ms` on average (Poisson). Scenarios:
+
+- `fifo`: the previous asyncio.Semaphore slot: first come, first served.
+- `fair`: ProviderClients.slot (tutor/admission.py), weighted fair queuing.
+- `fair_buckets`: plus LLM_USER_RATE_PER_MIN; heavy users that get a 429 wait
+  for its Retry-After (plus jitter).
+- `weighted`: `fair` with half the heavy users on a weight-4 level
+  (LLM_WEIGHTS): reports each group's share of the heavy turns served
+  (4:1 -> 0.8 / 0.2).
+
+Latency is per turn, as the client sees it, for turns started after the
+`--warmup` seconds of each scenario (the first round of the fair queue serves
+everyone once, whatever their weight). With one turn per user in flight, the
+fair order alone lets a light user skip the heavy users already served this
+round, not the whole queue; keeping heavy users from crowding light ones out is
+the token buckets' job. Exits non-zero unless fair queuing beats FIFO on the
+light users' mean latency, their p99 with buckets stays under
+`--max-light-p99-ms`, and the weight-4 share is within `--share-tolerance` of 0.8.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+from bench import common
+from bench.fake_llm import REPLY, FakeLLMServer
+from bench.load import MISTAKE_REPLY
+
+BASE_ENV = {"LLM_USER_RATE_PER_MIN": "0", "LLM_WEIGHTS": "Advanced=4"}
+
+# name, env overrides, FIFO semaphore instead of the fair slots, weight-4 heavy users
+SCENARIOS = [
+    ("fifo", {}, True, False),
+    ("fair", {}, False, False),
+    ("fair_buckets", {"LLM_USER_RATE_PER_MIN": "12", "LLM_USER_BURST": "3"}, False, False),
+    ("weighted", {}, False, True),
+]
+
+class FifoSlots:
+    """The slot before fair queuing: one semaphore, callers served in arrival order."""
+
+    def __init__(self, slots: int):
+        self._sem = asyncio.Semaphore(slots)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._sem:
+            yield
+
+async def scenario(c, args, env: Dict[str, str], fifo: bool, weighted: bool) -> dict:
+    from app.tutor.admission import reset_admission
+    from app.tutor.clients import get_clients
+
+    os.environ.update({**BASE_ENV, **env})
+    reset_admission()
+    clients = get_clients()
+    clients._slots.clear()  # re-created from the environment on the next call
+    if fifo:
+        clients._slots["openai_compat"] = FifoSlots(args.slots)
+    rng = random.Random(args.seed)
+    latency: Dict[str, List[float]] = {"light": [], "heavy": []}
+    served, limited, errors = Counter(), Counter(), Counter()
+    measure_from = time.monotonic() + args.warmup
+    stop = measure_from + args.duration
+    run = time.time_ns()  # fresh users per scenario
+
+    async def turn(kind: str, user: str, level: str) -> float:
+        """One chat turn; returns how long to back off (a 429's Retry-After)."""
+        measured, t0 = time.monotonic() >= measure_from, time.perf_counter()
+        r = await c.post("/api/chat", json={"user_id": user, "level": level, "context": "Airport",
+                                            "message": f"Hi, I'm checking in for my flight ({rng.random():.6f})"})
+        if r.status_code == 429:
+            limited[kind] += measured
+            return float(r.headers.get("retry-after", 1))
+        if r.status_code != 200:
+            errors[f"{kind}_{r.status_code}"] += 1
+            return 0.0
+        if not measured:
+            return 0.0
+        latency[kind].append(time.perf_counter() - t0)
+        served[level if kind == "heavy" else kind] += 1
+        return 0.0
+
+    async def heavy(user: str, level: str):
+        await asyncio.sleep(rng.uniform(0.0, 1.0))
+        while time.monotonic() < stop:
+            wait = await turn("heavy", user, level)
+            if wait:  # with jitter, or every user whose bucket ran dry at once comes back at once
+                await asyncio.sleep(min(wait * rng.uniform(1.0, 1.5), max(0.0, stop - time.monotonic())))
+
+    async def light(user: str):
+        while True:
+            await asyncio.sleep(rng.expovariate(1000.0 / args.light_gap_ms))
+            if time.monotonic() >= stop:
+                return
+            await turn("light", user, "Beginner")
+
+    tasks = [heavy(f"fs{run}-heavy-{h}", "Advanced" if weighted and h % 2 else "Beginner") for h in range(args.heavy)]
+    tasks += [light(f"fs{run}-light-{u}") for u in range(args.light)]
+    await asyncio.gather(*tasks)
+    out = {kind: common.summarize(samples) for kind, samples in latency.items()}
+    out["turns_per_s"] = round(sum(served.values()) / args.duration, 1)
+    if limited:
+        out["rate_limited"] = dict(limited)
+    if errors:
+        out["errors"] = dict(errors)
+    if weighted:
+        total = served["Advanced"] + served["Beginner"]
+        out["heavy_share"] = {"weight_4": round(served["Advanced"] / total, 3) if total else 0.0,
+                              "weight_1": round(served["Beginner"] / total, 3) if total else 0.0}
+    return out
+
+async def main(args):
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/app.db", RETENTION="0",
+                      LLM_MAX_CONCURRENCY=str(args.slots), LLM_MAX_QUEUE="1000")
+    results = {}
+    with FakeLLMServer(latency_ms=args.latency_ms, reply=[REPLY, MISTAKE_REPLY]) as srv:
+        os.environ.update(LLM_PROVIDER="openai_compat", LLM_API_KEY="stub", LLM_BASE_URL=srv.base_url, LLM_MODEL="stub")
+        from app.main import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as c:
+                for name, env, fifo, weighted in SCENARIOS:
+                    results[name] = await scenario(c, args, env, fifo, weighted)
+
+    light = {name: r["light"] for name, r in results.items()}
+    share = results["weighted"]["heavy_share"]["weight_4"]
+    checks = {
+        "fair_beats_fifo": 0 < light["fair"]["mean_ms"] < light["fifo"]["mean_ms"],
+        "buckets_light_p99": 0 < light["fair_buckets"]["p99_ms"] <= args.max_light_p99_ms,
+        "weighted_share": abs(share - 0.8) <= args.share_tolerance,
+        "no_errors": not any(r.get("errors") for r in results.values()),
+    }
+    print(json.dumps({**results, "checks": checks}, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--slots", type=int, default=4, help="provider slots (LLM_MAX_CONCURRENCY)")
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="stub LLM latency")
+    ap.add_argument("--heavy", type=int, default=24, help="heavy users, one turn after another")
+    ap.add_argument("--light", type=int, default=20, help="light users")
+    ap.add_argument("--light-gap-ms", type=float, default=10000.0, help="mean time between a light user's turns")
+    ap.add_argument("--duration", type=float, default=15.0, help="measured seconds per scenario")
+    ap.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds at the start of each scenario")
+    ap.add_argument("--max-light-p99-ms", type=float, default=1000.0, help="light-user p99 allowed with fair queuing and buckets")
+    ap.add_argument("--share-tolerance", type=float, default=0.1, help="allowed distance of the weight-4 share from 0.8")
+    ap.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(ap.parse_args()))
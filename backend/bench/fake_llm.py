@@ -0,0 +1,180 @@
+"""Local stub of an OpenAI-compatible chat completions server (and the Gemini
+generateContent API) for benchmarks.
+
+Run standalone:  python -m bench.fake_llm --port 9100 --latency-ms 50
+
+Point the app at it with LLM_BASE_URL=http://127.0.0.1:9100/v1 (openai_compat)
+or GEMINI_BASE_URL=http://127.0.0.1:9100 (gemini).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY = (
+    "Nice! A more natural way: 'Hi, I'm checking in for my flight to Boston.' "
+    "Do you have any bags to check?\n"
+    '{"skills":[{"skill_id":"phrase:check_in","quality":4},{"skill_id":"phrase:polite_request","quality":3}]}'
+)
+
+def make_app(latency_ms: float = 0.0, reply: str | List[str] = REPLY, token_delay_ms: float = 0.0,
+             prompt_token_ms: float = 0.0, fail_rate: float = 0.0, fail_status: int = 503,
+             slow_rate: float = 0.0, slow_ms: float = 0.0) -> FastAPI:
+    """`prompt_token_ms` adds prefill time per prompt token not covered by the (emulated) prefix cache.
+    `reply` may be a list: each request then gets one of them at random.
+
+    Fault injection (also adjustable at runtime via `app.state`): `fail_rate` of
+    requests get `fail_status`; `slow_rate` of requests take an extra `slow_ms`.
+    """
+    app = FastAPI(title="fake-llm")
+    replies = [reply] if isinstance(reply, str) else list(reply)
+    app.state.requests = 0
+    app.state.fail_rate, app.state.fail_status = fail_rate, fail_status
+    app.state.slow_rate, app.state.slow_ms = slow_rate, slow_ms
+
+    async def _delay_or_fail(usage: dict) -> JSONResponse | None:
+        app.state.requests += 1
+        uncached = usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"]
+        delay = latency_ms + prompt_token_ms * uncached
+        if random.random() < app.state.slow_rate:
+            delay += app.state.slow_ms
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+        if random.random() < app.state.fail_rate:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=app.state.fail_status,
+                                headers={"Retry-After": "0"} if app.state.fail_status == 429 else None)
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        out = random.choice(replies)
+        usage = _usage(body, out, remember=True)
+        failed = await _delay_or_fail(usage)
+        if failed is not None:
+            return failed
+        if body.get("stream"):
+            return StreamingResponse(_stream(body.get("model", "stub"), out), media_type="text/event-stream")
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": out}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.post("/{version}/models/{call}")
+    async def gemini_generate(version: str, call: str, request: Request):
+        """generateContent / streamGenerateContent?alt=sse, as the google-genai SDK calls them."""
+        model, _, method = call.partition(":")
+        body = await request.json()
+        text = "\n".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        out = random.choice(replies)
+        usage = _usage({"messages": [{"content": text}]}, out, remember=True)
+        failed = await _delay_or_fail(usage)
+        if failed is not None:
+            return failed
+        meta = {"promptTokenCount": usage["prompt_tokens"], "candidatesTokenCount": usage["completion_tokens"],
+                "totalTokenCount": usage["total_tokens"],
+                "cachedContentTokenCount": usage["prompt_tokens_details"]["cached_tokens"]}
+        if method == "streamGenerateContent":
+            return StreamingResponse(_stream_gemini(model, out, meta), media_type="text/event-stream")
+        return _gemini_chunk(model, out, meta)
+
+    app.state.last_prompt = ""
+
+    def _usage(body, out: str, remember: bool = False) -> dict:
+        # whitespace "tokens" are close enough for counters in benchmarks
+        text = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        prompt = len(text.split())
+        completion = len(out.split())
+        # emulate a provider prefix cache: the prefix shared with the previous prompt counts as cached
+        n = len(os.path.commonprefix([text, app.state.last_prompt]))
+        if remember:
+            app.state.last_prompt = text
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": len(text[:n].split())}}
+
+    async def _stream(model: str, out: str):
+        # word-sized deltas, roughly what a real tokenizer-driven stream looks like
+        for tok in re.findall(r"\S+\s*|\s+", out):
+            if token_delay_ms:
+                await asyncio.sleep(token_delay_ms / 1000.0)
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def _gemini_chunk(model: str, text: str, meta: dict | None) -> dict:
+        chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}], "modelVersion": model}
+        if meta is not None:  # the final chunk carries finishReason and usage
+            chunk["candidates"][0]["finishReason"] = "STOP"
+            chunk["usageMetadata"] = meta
+        return chunk
+
+    async def _stream_gemini(model: str, out: str, meta: dict):
+        toks = re.findall(r"\S+\s*|\s+", out)
+        for i, tok in enumerate(toks):
+            if token_delay_ms:
+                await asyncio.sleep(token_delay_ms / 1000.0)
+            yield f"data: {json.dumps(_gemini_chunk(model, tok, meta if i == len(toks) - 1 else None))}\r\n\r\n"
+
+    return app
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeLLMServer:
+    """Runs the stub app on a background thread; use as a context manager."""
+
+    def __init__(self, latency_ms: float = 0.0, port: int | None = None, **app_kwargs):
+        self.port = port or free_port()
+        self.app = make_app(latency_ms=latency_ms, **app_kwargs)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def gemini_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--token-delay-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    uvicorn.run(make_app(latency_ms=args.latency_ms, token_delay_ms=args.token_delay_ms), host="127.0.0.1", port=args.port, log_level="warning")
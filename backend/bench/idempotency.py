@@ -0,0 +1,101 @@
+"""Concurrent duplicate chat turns: Idempotency-Key coalescing and per-user serialization.
+
+    cd backend && python -m bench.idempotency --users 20 --duplicates 5
+
+Fires every user's duplicates at once against the stub LLM (slow enough that
+they overlap). With a shared Idempotency-Key each user must cost exactly one
+LLM call and one transcript exchange, and every duplicate must get the same
+reply. Without a key the duplicates are separate turns, but they run one at a
+time, so the skill rows stay unique. Exits non-zero if any check fails.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+def db_counts(db_path: str, prefix: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    q = lambda sql: conn.execute(sql, (prefix + "%",)).fetchone()[0]
+    out = {
+        "skill_rows": q("SELECT COUNT(*) FROM skills WHERE user_id LIKE ?"),
+        "distinct_skills": q("SELECT COUNT(*) FROM (SELECT DISTINCT user_id, skill_int_id FROM skills WHERE user_id LIKE ?)"),
+        "skill_reviews": q("SELECT COUNT(*) FROM skill_reviews WHERE user_id LIKE ?"),
+        "chat_turns": q("SELECT COUNT(*) FROM chat_turns WHERE user_id LIKE ?"),
+    }
+    conn.close()
+    return out
+
+async def scenario(c, srv, name: str, users: int, duplicates: int, with_key: bool) -> dict:
+    before = srv.app.state.requests
+    replies, replayed, statuses = {}, 0, []
+
+    async def send(i: int):
+        nonlocal replayed
+        user_id = f"{name}-{i // duplicates}"
+        headers = {"Idempotency-Key": f"{user_id}-turn-1"} if with_key else {}
+        r = await c.post("/api/chat", json={"user_id": user_id, "message": "Hi, I'd like to check in please"},
+                         headers=headers)
+        statuses.append(r.status_code)
+        if r.status_code == 200:
+            replies.setdefault(user_id, set()).add(r.text)
+            replayed += r.headers.get("idempotent-replayed") == "true"
+
+    t0 = time.perf_counter()
+    latencies = await common.run_concurrent(send, users * duplicates, users * duplicates)
+    return {
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+        "requests": common.summarize(latencies),
+        "non_200": sum(s != 200 for s in statuses),
+        "llm_calls": srv.app.state.requests - before,
+        "replayed": replayed,
+        "same_reply_per_user": all(len(v) == 1 for v in replies.values()),
+    }
+
+async def main(args):
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    db_path = f"{tmp}/app.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    from app.main import app
+
+    results = {}
+    with FakeLLMServer(latency_ms=args.latency_ms) as srv:
+        os.environ.update(LLM_PROVIDER="openai_compat", LLM_API_KEY="stub", LLM_BASE_URL=srv.base_url, LLM_MODEL="stub")
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as c:
+                for name, with_key in (("keyed", True), ("unkeyed", False)):
+                    results[name] = await scenario(c, srv, name, args.users, args.duplicates, with_key)
+        # counted after shutdown, once the write-behind buffer is flushed
+        for name in results:
+            results[name].update(db_counts(db_path, name + "-"))
+
+    keyed, unkeyed = results["keyed"], results["unkeyed"]
+    skills_per_reply = 2  # the stub reply tags phrase:check_in and phrase:polite_request
+    checks = {
+        "one_llm_call_per_key": keyed["llm_calls"] == args.users,
+        "duplicates_replayed": keyed["replayed"] == args.users * (args.duplicates - 1) and keyed["same_reply_per_user"],
+        "one_exchange_per_key": keyed["chat_turns"] == 2 * args.users
+                                and keyed["skill_reviews"] == skills_per_reply * args.users,
+        "unkeyed_all_ran": unkeyed["llm_calls"] == args.users * args.duplicates and unkeyed["non_200"] == 0,
+        "no_duplicate_skill_rows": all(r["skill_rows"] == r["distinct_skills"] == skills_per_reply * args.users
+                                       for r in results.values()),
+    }
+    print(json.dumps({**results, "checks": checks}, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--duplicates", type=int, default=5)
+    ap.add_argument("--latency-ms", type=float, default=200.0)
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,52 @@
+"""Turn latency: a fresh httpx client per request vs the pooled provider clients.
+
+    cd backend && python -m bench.llm_clients --turns 500 --concurrency 8 --latency-ms 20
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+async def main(args):
+    import httpx
+    from app.tutor import chat as tutor
+    from app.tutor.clients import close_clients
+
+    history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi! Where are you flying today?"}]
+    message = "Hi, I need to check in for my flight"
+
+    async def per_request(_i: int):
+        # Mirrors the old behaviour: new client (and connection) for every turn
+        payload = tutor.openai_payload("stub", "Airport", "Beginner", message, history)
+        async with httpx.AsyncClient(base_url=os.environ["LLM_BASE_URL"], timeout=40) as client:
+            r = await client.post("/chat/completions", headers={"Authorization": "Bearer stub"}, json=payload)
+            r.raise_for_status()
+            tutor._extract_reply_and_skills(r.json()["choices"][0]["message"]["content"])
+
+    async def pooled(_i: int):
+        await tutor._call_openai_compat("Airport", "Beginner", message, history)
+
+    results = {}
+    for name, fn in (("per_request", per_request), ("pooled", pooled)):
+        await common.run_concurrent(fn, args.warmup, args.concurrency)
+        results[name] = common.summarize(await common.run_concurrent(fn, args.turns, args.concurrency))
+    await close_clients()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--turns", type=int, default=500)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="simulated upstream generation time")
+    ap.add_argument("--http2", action="store_true")
+    args = ap.parse_args()
+
+    with FakeLLMServer(latency_ms=args.latency_ms) as server:
+        os.environ.update(LLM_BASE_URL=server.base_url, LLM_API_KEY="stub", LLM_MODEL="stub")
+        os.environ["LLM_HTTP2"] = "1" if args.http2 else "0"
+        asyncio.run(main(args))
@@ -0,0 +1,279 @@
+"""End-to-end load test: mixed traffic through the app against a temp SQLite DB and the stub LLM.
+
+    cd backend && python -m bench.load --duration 20 --concurrency 32
+    python -m bench.load --provider gemini --token-delay-ms 2   # Gemini-style API via GEMINI_BASE_URL
+    python -m bench.load --save local       # store bench/baselines/local.json
+    python -m bench.load --compare local    # exit 1 if a route regressed against it
+
+Seeds `--users` synthetic users, each with `--skills` skill rows, `--turns` chat
+turns and two weeks of activity, then runs `--concurrency` clients for
+`--duration` seconds (after `--warmup`). Each request is drawn from `--mix`
+(route=weight): chat turns, streamed chat turns, practice/next, progress, the
+skill list and history pages (following the next-page cursor half the time).
+The stub LLM answers after `--llm-latency-ms`, streaming word-sized tokens every
+`--token-delay-ms`; its replies alternate between a correct and a mistaken use of
+a skill, as learners do.
+
+Reported: overall and per-route throughput, p50/p95/p99 and non-2xx counts as
+seen by the clients, and from the app's own metrics the time spent waiting for
+a pooled DB connection, for a user's previous chat turn, and in the write
+commits (which include SQLite's busy waits for the writer lock). Histogram
+quantiles from the metrics are bucket upper bounds.
+
+Baselines are plain JSON (results plus commit, args and platform). `--compare`
+flags a route whose p95/p99 grew, or throughput fell, by more than `--tolerance`
+(ignoring changes under `--min-delta-ms`); compare runs with the same arguments
+on the same machine.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from bench import common
+from bench.fake_llm import REPLY, FakeLLMServer
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines")
+DEFAULT_MIX = "chat=10,stream=5,practice=35,progress=20,skills=15,history=15"
+# the same skill right and wrong: an always-correct review doubles its interval every turn
+MISTAKE_REPLY = REPLY.replace('"phrase:check_in","quality":4', '"phrase:check_in","quality":2')
+MESSAGES = ["Hi, I'm checking in for my flight to Boston.", "My bag might be overweight, what can I do?",
+            "Could I move some things into my carry-on, please?", "Can I change my flight to tomorrow?"]
+CONTEXTS = ["Airport", "Restaurant", "Classroom", "Office", "Shopping"]
+DB_PHASES = ("chat.commit", "chat.persist", "db.write_behind")
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPS:
+            raise SystemExit(f"unknown route in --mix: {name!r} (one of {', '.join(OPS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def seed(db_path: str, args):
+    """Users with large histories, written straight into the (already migrated) file."""
+    rng = random.Random(args.seed)
+    now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    conn = sqlite3.connect(db_path)
+    ids = common.catalog_ids(conn, (f"vocab:w{i}" for i in range(args.skills)))
+    for u in range(args.users):
+        user = f"load{u}"
+        conn.execute("INSERT INTO user_profiles (user_id, native_language, target_language, level, daily_minutes_goal,"
+                     " weekly_minutes_goal, focus_contexts, timezone, created_at, updated_at)"
+                     " VALUES (?, 'English', 'English', 'Beginner', 10, 70, 'Airport,Restaurant', 'UTC', ?, ?)",
+                     (user, str(now), str(now)))
+        conn.executemany(
+            "INSERT INTO skills (user_id, skill_int_id, strength, ease, interval_days, last_seen, next_due, streak, mistakes)"
+            " VALUES (?,?,?,?,?,?,?,?,?)",
+            [(user, ids[f"vocab:w{i}"], rng.random(), 2.0, 4, str(now - timedelta(days=4)),
+              str(now + timedelta(hours=rng.uniform(-96, 24 * 30))), rng.randrange(5), rng.randrange(3))
+             for i in range(args.skills)])
+        start = now - timedelta(days=60)
+        conn.executemany(
+            "INSERT INTO chat_turns (user_id, role, content, ts) VALUES (?,?,?,?)",
+            [(user, "user" if i % 2 == 0 else "assistant", f"({i}) {MESSAGES[i % len(MESSAGES)]}",
+              str(start + timedelta(seconds=i * 60))) for i in range(args.turns)])
+        conn.executemany(
+            "INSERT INTO activity_logs (user_id, context, minutes, turns, ts) VALUES (?,?,?,?,?)",
+            [(user, CONTEXTS[d % len(CONTEXTS)], rng.randrange(1, 20), rng.randrange(1, 30), str(now - timedelta(days=d)))
+             for d in range(14)])
+    conn.commit()
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+async def _chat(c, rng, user, state, stream: bool = False):
+    body = {"user_id": user, "context": rng.choice(CONTEXTS), "message": rng.choice(MESSAGES)}
+    return await c.post("/api/chat/stream" if stream else "/api/chat", json=body)
+
+async def _history(c, rng, user, state):
+    cursor = state.get(user)
+    params = {"limit": 30, **({"cursor": cursor} if cursor and rng.random() < 0.5 else {})}
+    r = await c.get(f"/api/history/{user}", params=params)
+    state[user] = r.headers.get("x-next-cursor")
+    return r
+
+OPS = {
+    "chat": _chat,
+    "stream": lambda c, rng, user, state: _chat(c, rng, user, state, stream=True),
+    "practice": lambda c, rng, user, state: c.post("/api/practice/next", json={"user_id": user, "context": rng.choice(CONTEXTS)}),
+    "progress": lambda c, rng, user, state: c.get(f"/api/progress/{user}"),
+    "skills": lambda c, rng, user, state: c.get(f"/api/skills/{user}"),
+    "history": _history,
+}
+
+def _metric_snapshot() -> Dict[str, Any]:
+    from app.idempotency import TURN_LOCK_WAIT
+    from app.metrics import DB_POOL_WAIT, PHASE_LATENCY
+
+    return {"pool": copy.deepcopy(DB_POOL_WAIT.values), "turn_lock": copy.deepcopy(TURN_LOCK_WAIT.values),
+            "phases": copy.deepcopy(PHASE_LATENCY.values)}
+
+def _hist_delta(before: dict, after: dict, key: tuple, buckets: tuple) -> Dict[str, float]:
+    counts, total = after.get(key, [[0] * (len(buckets) + 1), 0.0])
+    old_counts, old_total = before.get(key, [[0] * (len(buckets) + 1), 0.0])
+    counts = [a - b for a, b in zip(counts, old_counts)]
+    n = sum(counts)
+    out = {"n": n, "total_s": round(total - old_total, 3), "mean_ms": round((total - old_total) / n * 1000, 3) if n else 0.0}
+    for pct in (50, 99):
+        acc, rank = 0, pct / 100 * n
+        for le, c in zip(buckets + (float("inf"),), counts):
+            acc += c
+            if n and acc >= rank:
+                out[f"p{pct}_ms_le"] = le * 1000 if le != float("inf") else None
+                break
+    return out
+
+def db_waits(before: dict, after: dict) -> Dict[str, Any]:
+    from app.idempotency import TURN_LOCK_WAIT
+    from app.metrics import DB_POOL_WAIT, PHASE_LATENCY
+
+    out = {"pool_checkout": _hist_delta(before["pool"], after["pool"], (), DB_POOL_WAIT.buckets),
+           "chat_turn_lock": _hist_delta(before["turn_lock"], after["turn_lock"], (), TURN_LOCK_WAIT.buckets)}
+    for phase in DB_PHASES:
+        if (phase,) in after["phases"]:
+            out[phase] = _hist_delta(before["phases"], after["phases"], (phase,), PHASE_LATENCY.buckets)
+    return out
+
+async def drive(c, args, mix: Dict[str, float], seconds: float) -> Dict[str, Any]:
+    names, weights = list(mix), list(mix.values())
+    samples: Dict[str, List[float]] = {n: [] for n in names}
+    statuses: Dict[str, Dict[int, int]] = {n: {} for n in names}
+    deadline = time.perf_counter() + seconds
+
+    async def client(k: int):
+        rng, cursors = random.Random(args.seed * 1000 + k), {}
+        while time.perf_counter() < deadline:
+            op = rng.choices(names, weights)[0]
+            user = f"load{rng.randrange(args.users)}"
+            t0 = time.perf_counter()
+            r = await OPS[op](c, rng, user, cursors)
+            samples[op].append(time.perf_counter() - t0)
+            statuses[op][r.status_code] = statuses[op].get(r.status_code, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(k) for k in range(args.concurrency)])
+    elapsed = time.perf_counter() - t0
+    routes = {}
+    for op in names:
+        errors = sum(n for status, n in statuses[op].items() if status >= 300)
+        routes[op] = {"rps": round(len(samples[op]) / elapsed, 1), **common.summarize(samples[op]), "non_2xx": errors}
+    total = sum(len(s) for s in samples.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1),
+            "non_2xx": sum(r["non_2xx"] for r in routes.values()), "routes": routes}
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    db_path = f"{tmp}/app.db"
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{db_path}", RETENTION="0", CHAT_ARCHIVE_DIR=f"{tmp}/archive")
+    mix = parse_mix(args.mix)
+    with FakeLLMServer(latency_ms=args.llm_latency_ms, token_delay_ms=args.token_delay_ms, reply=[REPLY, MISTAKE_REPLY]) as srv:
+        if args.provider == "gemini":
+            os.environ.update(LLM_PROVIDER="gemini", GEMINI_API_KEY="stub", GEMINI_MODEL="stub-gemini",
+                              GEMINI_BASE_URL=srv.gemini_base_url)
+        else:
+            os.environ.update(LLM_PROVIDER="openai_compat", LLM_API_KEY="stub", LLM_BASE_URL=srv.base_url, LLM_MODEL="stub")
+        from app.main import app
+        from app.db.rollups import backfill
+        from app.db.session import get_sessionmaker
+
+        async with app.router.lifespan_context(app):
+            pass  # migrate the empty file
+        t0 = time.perf_counter()
+        seed(db_path, args)
+        async with app.router.lifespan_context(app):
+            async with get_sessionmaker()() as db:
+                await backfill(db)
+            seed_s = time.perf_counter() - t0
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=120) as c:
+                if args.warmup:
+                    await drive(c, args, mix, args.warmup)
+                before = _metric_snapshot()
+                result = await drive(c, args, mix, args.duration)
+                result["db_waits"] = db_waits(before, _metric_snapshot())
+    result["seed_s"] = round(seed_s, 2)
+    result["db_mib"] = round(os.path.getsize(db_path) / 2**20, 1)
+    return result
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(__file__))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINES, f"{name}.json")
+
+def compare(base: Dict[str, Any], cur: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions of `cur` against `base`, one line each."""
+    out = []
+    if cur["rps"] < base["rps"] * (1 - tolerance):
+        out.append(f"throughput {base['rps']} -> {cur['rps']} req/s")
+    for route, old in base["routes"].items():
+        new = cur["routes"].get(route)
+        if new is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] >= min_delta_ms:
+                out.append(f"{route} {key} {old[key]} -> {new[key]}")
+        if new["non_2xx"] > old["non_2xx"]:
+            out.append(f"{route} non-2xx {old['non_2xx']} -> {new['non_2xx']}")
+    return out
+
+def main(args):
+    result = asyncio.run(run(args))
+    meta = {"commit": _commit(), "created": datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare", "tolerance", "min_delta_ms")}}
+    report = {"meta": meta, **result}
+    status = 0
+    if args.compare:
+        with open(baseline_path(args.compare), encoding="utf-8") as f:
+            base = json.load(f)
+        if base["meta"].get("args") != meta["args"]:
+            print(f"note: baseline was recorded with different arguments: {base['meta'].get('args')}", file=sys.stderr)
+        regressions = compare(base, result, args.tolerance, args.min_delta_ms)
+        report["compare"] = {"baseline": args.compare, "baseline_commit": base["meta"].get("commit"), "regressions": regressions}
+        status = 1 if regressions else 0
+    print(json.dumps(report, indent=2))
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(baseline_path(args.save), "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in report.items() if k != "compare"}, f, indent=2)
+            f.write("\n")
+    sys.exit(status)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--skills", type=int, default=1000, help="skill rows per user")
+    ap.add_argument("--turns", type=int, default=2000, help="chat turns per user")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of measured traffic")
+    ap.add_argument("--warmup", type=float, default=2.0)
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"route=weight list (default {DEFAULT_MIX})")
+    ap.add_argument("--provider", choices=("openai_compat", "gemini"), default="openai_compat")
+    ap.add_argument("--llm-latency-ms", type=float, default=50.0)
+    ap.add_argument("--token-delay-ms", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--save", metavar="NAME", help="write the results as bench/baselines/NAME.json (or a .json path)")
+    ap.add_argument("--compare", metavar="NAME", help="compare against bench/baselines/NAME.json (or a .json path)")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative p95/p99/throughput change")
+    ap.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+    main(ap.parse_args())
@@ -0,0 +1,76 @@
+"""Check that a slow Gemini generation does not stall other requests on the same worker.
+
+    cd backend && python -m bench.loop_blocking --gen-seconds 1.0
+
+Fires a chat turn against a fake slow Gemini client (one sync-only, one with an
+`aio` API) and, while it is in flight, times GET /api/skills/{user_id}. Exits
+non-zero if the side request is not served within --budget-ms.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+SLOW_REPLY = 'Good try!\n{"skills":[{"skill_id":"phrase:check_in","quality":4}]}'
+
+class SyncSlowGemini:
+    """Only exposes the blocking SDK surface (forces the bounded-executor path)."""
+
+    def __init__(self, seconds: float):
+        def generate_content(**_kwargs):
+            time.sleep(seconds)
+            return SimpleNamespace(text=SLOW_REPLY)
+        self.models = SimpleNamespace(generate_content=generate_content)
+
+class AioSlowGemini(SyncSlowGemini):
+    def __init__(self, seconds: float):
+        super().__init__(seconds)
+
+        async def generate_content(**_kwargs):
+            await asyncio.sleep(seconds)
+            return SimpleNamespace(text=SLOW_REPLY)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+
+async def run_case(app, fake, budget_ms: float) -> dict:
+    import httpx
+    from app.tutor.clients import get_clients
+
+    async with app.router.lifespan_context(app):
+        get_clients().gemini = lambda _key: fake
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            chat = asyncio.create_task(c.post("/api/chat", json={"user_id": "u1", "message": "Hi, checking in please"}))
+            await asyncio.sleep(0.05)  # let the turn reach the provider call
+            t0 = time.perf_counter()
+            r = await c.get("/api/skills/u1")
+            side_ms = (time.perf_counter() - t0) * 1000.0
+            r.raise_for_status()
+            in_flight = not chat.done()
+            (await chat).raise_for_status()
+    return {"side_request_ms": round(side_ms, 2), "chat_in_flight": in_flight, "ok": in_flight and side_ms < budget_ms}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--gen-seconds", type=float, default=1.0)
+    ap.add_argument("--budget-ms", type=float, default=100.0)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/app.db", LLM_PROVIDER="gemini", GEMINI_API_KEY="fake")
+    from app.main import app
+
+    results = {
+        "sync_sdk": asyncio.run(run_case(app, SyncSlowGemini(args.gen_seconds), args.budget_ms)),
+        "aio_sdk": asyncio.run(run_case(app, AioSlowGemini(args.gen_seconds), args.budget_ms)),
+    }
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
+
+if __name__ == "__main__":
+    main()
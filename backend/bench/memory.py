@@ -0,0 +1,99 @@
+"""Prompt tokens and turn latency vs conversation length: last-11 raw turns vs token-budgeted memory.
+
+    cd backend && python -m bench.memory --turns 10 50 200 1000
+
+Seeds one user per size with long tutor replies, then builds the history both
+ways and sends it to the stub LLM (whose latency grows with prompt size via
+--prompt-token-ms). `history_ms` is the time to assemble the history.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+USER = "Could you help me say this better: I want to change my seat to the window because I get sick on planes."
+TUTOR = (
+    "Good try! A more natural way: 'Could I switch to a window seat, please? I get airsick.' "
+    "Tip: 'airsick' is the usual word for feeling sick on a plane, and 'switch' sounds friendlier than 'change'. "
+    "At the desk you might also hear 'Let me see what's available' or 'There's a fee for seat changes on this fare.' "
+    "Now you: ask the agent whether the flight is full and if an aisle seat near the front is possible instead."
+)
+
+def seed(db_path: str, user_id: str, exchanges: int):
+    now = str(datetime.now(tz=timezone.utc).replace(tzinfo=None))
+    rows = []
+    for i in range(exchanges):
+        rows.append((user_id, "user", f"({i}) {USER}", now))
+        rows.append((user_id, "assistant", TUTOR, now))
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO chat_turns (user_id, role, content, ts) VALUES (?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+async def legacy_history(db, user_id: str):
+    from sqlalchemy import select
+    from app.db.models import ChatTurn
+    q = select(ChatTurn.role, ChatTurn.content).where(ChatTurn.user_id == user_id).order_by(ChatTurn.id.desc()).limit(11)
+    return [{"role": r.role, "content": r.content} for r in reversed((await db.execute(q)).all())]
+
+async def main(args):
+    from app.main import app
+    from app.db.session import get_sessionmaker
+    from app.tutor import chat as tutor
+    from app.tutor.memory import estimate_tokens, get_memory, token_budget
+
+    tmp = tempfile.mkdtemp()
+    db_path = f"{tmp}/app.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    async with app.router.lifespan_context(app):
+        pass  # create schema
+    for n in args.turns:
+        seed(db_path, f"user{n}", n)
+
+    budget = token_budget("openai_compat")
+    message = "Is the flight full?"
+    results = {"budget_tokens": budget}
+    with FakeLLMServer(latency_ms=args.latency_ms, prompt_token_ms=args.prompt_token_ms) as srv:
+        os.environ.update(LLM_PROVIDER="openai_compat", LLM_API_KEY="stub", LLM_BASE_URL=srv.base_url, LLM_MODEL="stub")
+        async with app.router.lifespan_context(app):
+            for n in args.turns:
+                user_id = f"user{n}"
+                res = {}
+                for name in ("last_11", "memory"):
+                    async def build():
+                        async with get_sessionmaker()() as db:
+                            if name == "last_11":
+                                return await legacy_history(db, user_id)
+                            return await get_memory().history(db, user_id, budget)
+
+                    history = await build()  # warms the memory window
+                    payload = tutor.openai_payload("stub", "Airport", "Beginner", message, history)
+                    build_s = await common.run_concurrent(lambda _i: build(), args.requests, 1)
+
+                    async def turn(_i):
+                        await tutor._call_openai_compat("Airport", "Beginner", message, history)
+
+                    res[name] = {
+                        "prompt_tokens": sum(estimate_tokens(m["content"]) for m in payload["messages"]),
+                        "history_ms": common.summarize(build_s)["p50_ms"],
+                        "turn": common.summarize(await common.run_concurrent(turn, args.requests, 1)),
+                    }
+                results[n] = res
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200, 1000])
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--prompt-token-ms", type=float, default=0.05)
+    args = ap.parse_args()
+    os.chdir(tempfile.mkdtemp())
+    asyncio.run(main(args))
@@ -0,0 +1,57 @@
+"""Cost of the metrics middleware + spans on a trivial route (in-process ASGI, no network).
+
+    cd backend && python -m bench.metrics_overhead --requests 5000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+
+from bench import common
+
+def build(with_metrics: bool):
+    from fastapi import FastAPI
+    from app.metrics import MetricsMiddleware, render, span
+
+    app = FastAPI()
+
+    @app.get("/api/ping/{user_id}")
+    async def ping(user_id: str):
+        if with_metrics:
+            with span("bench.a"), span("bench.b"):
+                pass
+        return {"ok": True}
+
+    @app.get("/metrics")
+    async def metrics():
+        return render()
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+async def main(args):
+    import httpx
+
+    results = {}
+    for name in ("off", "on"):
+        app = build(name == "on")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            async def call(i: int):
+                (await client.get(f"/api/ping/u{i % 100}")).raise_for_status()
+
+            await common.run_concurrent(call, args.warmup, 1)
+            results[name] = common.summarize(await common.run_concurrent(call, args.requests, 1))
+            if name == "on":
+                t0 = time.perf_counter()
+                size = len((await client.get("/metrics")).text)
+                results["render"] = {"bytes": size, "ms": round((time.perf_counter() - t0) * 1000, 3)}
+    results["overhead_us_per_request"] = round((results["on"]["mean_ms"] - results["off"]["mean_ms"]) * 1000, 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--warmup", type=int, default=200)
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,136 @@
+"""History / skills listing for a heavy user: ORM + jsonable_encoder vs Core projection + orjson + keyset pages.
+
+    cd backend && python -m bench.pagination --turns 100000 --skills 5000
+
+Seeds one user with `--turns` chat turns (interleaved with other users' turns,
+so id ranges are not one user's alone) and `--skills` skill rows. `orm_*` is
+how the routes used to build a response (ORM entities -> dicts -> FastAPI's
+encoder -> json), run in-process for the whole set; `keyset_*` walks the
+paged API with X-Next-Cursor. Each is reported as rows/sec plus the
+tracemalloc peak of a separate run; `keyset_*` also shows per-page latency,
+which should stay flat from the first page to the last.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from bench import common
+
+BIG = "heavy"
+
+async def seed(sessionmaker, args):
+    from sqlalchemy import insert, text
+    from app.db.models import ChatTurn, Skill
+    from app.db.skill_catalog import get_skill_interner
+
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    ids = await get_skill_interner().resolve([f"vocab:w{i}" for i in range(args.skills)])
+    async with sessionmaker() as db:
+        rows = []
+        for i in range(args.turns):
+            rows.append(dict(user_id=BIG, role="user" if i % 2 == 0 else "assistant",
+                             content=f"turn {i}: could I move a few things into my carry-on bag?", ts=t0 + timedelta(seconds=i)))
+            if i % args.other_every == 0:
+                rows.append(dict(user_id=f"other{i % 97}", role="user", content="hi", ts=t0 + timedelta(seconds=i)))
+            if len(rows) >= 2000:
+                await db.execute(insert(ChatTurn).values(rows))
+                rows = []
+        if rows:
+            await db.execute(insert(ChatTurn).values(rows))
+        skills = [dict(user_id=BIG, skill_int_id=ids[f"vocab:w{i}"], strength=(i % 100) / 100, ease=2.0, interval_days=1 + i % 30,
+                       last_seen=t0, next_due=None if i % 50 == 0 else t0 + timedelta(hours=i % 700), streak=i % 5,
+                       mistakes=i % 3) for i in range(args.skills)]
+        for i in range(0, len(skills), 2000):
+            await db.execute(insert(Skill).values(skills[i:i + 2000]))
+        await db.commit()
+        await db.execute(text("ANALYZE"))
+
+async def orm_history(sessionmaker) -> int:
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select
+    from app.db.models import ChatTurn
+
+    async with sessionmaker() as db:
+        q = select(ChatTurn).where(ChatTurn.user_id == BIG).order_by(ChatTurn.id.desc())
+        rows = list(reversed((await db.execute(q)).scalars().all()))
+        out = [{"role": r.role, "content": r.content, "ts": r.ts} for r in rows]
+        return len(json.dumps(jsonable_encoder(out), ensure_ascii=False).encode()) and len(out)
+
+async def orm_skills(sessionmaker) -> int:
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select
+    from app.db.models import Skill
+    from app.db.skill_catalog import get_skill_interner
+
+    names = get_skill_interner().name
+    async with sessionmaker() as db:
+        q = select(Skill).where(Skill.user_id == BIG).order_by(Skill.next_due.asc().nullsfirst())
+        out = [{"skill_id": names(r.skill_int_id), "strength": r.strength, "ease": r.ease, "interval_days": r.interval_days,
+                "last_seen": r.last_seen, "next_due": r.next_due, "streak": r.streak, "mistakes": r.mistakes}
+               for r in (await db.execute(q)).scalars().all()]
+        return len(json.dumps(jsonable_encoder(out), ensure_ascii=False).encode()) and len(out)
+
+async def walk(client, path: str, page: int, pages: list | None = None) -> int:
+    n, cursor = 0, None
+    while True:
+        params = {"limit": page, **({"cursor": cursor} if cursor else {})}
+        t0 = time.perf_counter()
+        r = await client.get(path, params=params)
+        r.raise_for_status()
+        if pages is not None:
+            pages.append(time.perf_counter() - t0)
+        n += len(r.json())
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            return n
+
+async def measure(fn) -> dict:
+    t0 = time.perf_counter()
+    n = await fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": n, "seconds": round(elapsed, 3), "rows_per_s": round(n / elapsed), "peak_mib": round(peak / 2**20, 2)}
+
+async def main(args):
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/app.db", WRITE_BEHIND="0", USER_CACHE="0")
+    from app.main import app
+    from app.db.session import get_sessionmaker
+
+    async with app.router.lifespan_context(app):
+        sm = get_sessionmaker()
+        await seed(sm, args)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as c:
+            history_pages, skill_pages = [], []
+            results = {
+                "orm_history_full": await measure(lambda: orm_history(sm)),
+                "keyset_history": await measure(lambda: walk(c, f"/api/history/{BIG}", args.page)),
+                "orm_skills_full": await measure(lambda: orm_skills(sm)),
+                "keyset_skills": await measure(lambda: walk(c, f"/api/skills/{BIG}", args.page)),
+            }
+            await walk(c, f"/api/history/{BIG}", args.page, history_pages)
+            await walk(c, f"/api/skills/{BIG}", args.page, skill_pages)
+        for name, pages in (("keyset_history", history_pages), ("keyset_skills", skill_pages)):
+            results[name]["page"] = {**common.summarize(pages), "first_ms": round(pages[0] * 1000, 3),
+                                     "last_ms": round(pages[-1] * 1000, 3)}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--turns", type=int, default=100000)
+    ap.add_argument("--skills", type=int, default=5000)
+    ap.add_argument("--page", type=int, default=1000)
+    ap.add_argument("--other-every", type=int, default=3, help="interleave another user's turn every N turns")
+    asyncio.run(main(ap.parse_args()))
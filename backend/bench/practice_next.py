@@ -0,0 +1,109 @@
+"""/api/practice/next latency vs number of skills per user.
+
+    cd backend && python -m bench.practice_next --sizes 100 1000 10000 50000
+
+Seeds one user per size with a mix of due / not-yet-due skills and times the
+route in-process: `stored` serves the precomputed plan (app/practice_plans.py),
+`computed` ranks on every request (PRACTICE_PLANS=0), `after_turn_ms` is the
+first request after a chat turn expired the plan (background refresh racing
+the request). `legacy_ms` is the old approach (load every row, rank in Python)
+for comparison.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench import common
+
+def seed(db_path: str, user_id: str, n: int, due_frac: float):
+    now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    rows = []
+    for i in range(n):
+        hours = random.uniform(-72, 0) if random.random() < due_frac else random.uniform(1, 24 * 30)
+        rows.append((user_id, f"vocab:s{i}", random.random(), 2.0, 2, str(now + timedelta(hours=hours)), 1, 0))
+    conn = sqlite3.connect(db_path)
+    ids = common.catalog_ids(conn, (r[1] for r in rows))
+    conn.executemany(
+        "INSERT INTO skills (user_id, skill_int_id, strength, ease, interval_days, next_due, streak, mistakes) VALUES (?,?,?,?,?,?,?,?)",
+        [(r[0], ids[r[1]], *r[2:]) for r in rows],
+    )
+    conn.commit()
+    conn.close()
+
+async def legacy(db, user_id: str, limit: int):
+    from sqlalchemy import select
+    from app.db.models import Skill
+    from app.adaptive.scheduler import score_candidate
+    from app.routes.practice import as_utc
+
+    skills = (await db.execute(select(Skill).where(Skill.user_id == user_id))).scalars().all()
+    now = datetime.now(tz=timezone.utc)
+    cands = []
+    for s in skills:
+        nd = as_utc(s.next_due)
+        due = nd is None or nd <= now
+        cands.append((score_candidate(due, s.strength, nd), s))
+    cands.sort(key=lambda x: x[0])
+    return cands[: max(limit, 10)]
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.db.session import get_sessionmaker
+
+    tmp = tempfile.mkdtemp()
+    db_path = f"{tmp}/app.db"
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.update(LLM_API_KEY="", GEMINI_API_KEY="")  # chat turns use the local tutor
+
+    async with app.router.lifespan_context(app):
+        pass  # create schema
+    for n in args.sizes:
+        seed(db_path, f"user{n}", n, args.due_frac)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            for n in args.sizes:
+                body = {"user_id": f"user{n}", "limit": 6}
+
+                async def route(_i):
+                    (await c.post("/api/practice/next", json=body)).raise_for_status()
+
+                async def old(_i):
+                    async with get_sessionmaker()() as db:
+                        await legacy(db, body["user_id"], body["limit"])
+
+                await common.run_concurrent(route, 5, 1)
+                res = {"stored": common.summarize(await common.run_concurrent(route, args.requests, 1))}
+                os.environ["PRACTICE_PLANS"] = "0"
+                res["computed"] = common.summarize(await common.run_concurrent(route, args.requests, 1))
+                del os.environ["PRACTICE_PLANS"]
+                after = []
+                for _ in range(5):
+                    (await c.post("/api/chat", json={"user_id": body["user_id"], "message": "my bag is overweight"})).raise_for_status()
+                    after += await common.run_concurrent(route, 1, 1)
+                res["after_turn_ms"] = common.summarize(after)["p50_ms"]
+                res["legacy_ms"] = common.summarize(await common.run_concurrent(old, max(3, args.requests // 20), 1))["p50_ms"]
+                results[n] = res
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--due-frac", type=float, default=0.2)
+    args = ap.parse_args()
+    os.chdir(tempfile.mkdtemp())
+    asyncio.run(main(args))
@@ -0,0 +1,67 @@
+"""Prefix-cache hit rate of the old vs the static-prefix system prompt layout.
+
+    cd backend && python -m bench.prompt_cache --turns 400
+
+Interleaves turns from users in different contexts/levels against the stub LLM,
+which reports the prefix shared with the previous prompt as cached tokens (and
+only charges prefill latency for the rest). Also times prompt rendering.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+CONTEXTS = ["Airport", "Restaurant", "Hotel", "Doctor", "Job interview"]
+LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+def legacy_system_prompt(context: str, level: str) -> str:
+    """The layout before the static prefix: context/level near the top, rendered per call."""
+    from app.tutor.prompts import STATIC_INSTRUCTIONS
+    head, rest = STATIC_INSTRUCTIONS.split("\n\nRules:", 1)
+    return f"{head}\nContext: {context}\nLevel: {level}\n\nRules:{rest}"
+
+async def main(args):
+    import httpx
+    from app.tutor.prompts import system_prompt
+
+    random.seed(7)
+    turns = [(random.choice(CONTEXTS), random.choice(LEVELS)) for _ in range(args.turns)]
+    history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi! How can I help?"}]
+    results = {}
+    with FakeLLMServer(latency_ms=args.latency_ms, prompt_token_ms=args.prompt_token_ms) as srv:
+        async with httpx.AsyncClient(base_url=srv.base_url) as client:
+            for name, render in (("legacy", legacy_system_prompt), ("static_prefix", system_prompt)):
+                prompt_tokens = cached_tokens = 0
+                latencies = []
+                for context, level in turns:
+                    payload = {"model": "stub", "messages": [
+                        {"role": "system", "content": render(context, level)}, *history,
+                        {"role": "user", "content": "Can I get a window seat?"},
+                    ]}
+                    t0 = time.perf_counter()
+                    usage = (await client.post("/chat/completions", json=payload)).json()["usage"]
+                    latencies.append(time.perf_counter() - t0)
+                    prompt_tokens += usage["prompt_tokens"]
+                    cached_tokens += usage["prompt_tokens_details"]["cached_tokens"]
+                t0 = time.perf_counter()
+                for context, level in turns * 25:
+                    render(context, level)
+                results[name] = {
+                    "cached_share": round(cached_tokens / prompt_tokens, 3),
+                    "render_us": round((time.perf_counter() - t0) / (len(turns) * 25) * 1e6, 3),
+                    "turn": common.summarize(latencies),
+                }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--turns", type=int, default=400)
+    ap.add_argument("--latency-ms", type=float, default=5.0)
+    ap.add_argument("--prompt-token-ms", type=float, default=0.1)
+    asyncio.run(main(ap.parse_args()))
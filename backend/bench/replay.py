@@ -0,0 +1,79 @@
+"""Batch replay engine: correctness against the scalar update_skill, then throughput.
+
+    cd backend && python -m bench.replay --skills 200000 --events 2000000
+
+Generates a synthetic review log, replays a sample of skills with the scalar
+reference (adaptive.skill_model.replay) and the whole log with the NumPy
+engine, and exits non-zero on any mismatch.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from app.adaptive.replay import EPOCH, from_us, initial_arrays, replay_arrays, state_at
+from app.adaptive.scheduler import DEFAULT_PARAMS, SchedulerParams
+from app.adaptive.skill_model import SkillEvent, replay
+
+def synth(n_skills: int, n_events: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    group = rng.integers(0, n_skills, n_events)
+    quality = rng.integers(0, 6, n_events)
+    # increasing timestamps (µs) so every group's events are in time order
+    ts_us = 1_700_000_000_000_000 + np.cumsum(rng.integers(1, 10_000_000, n_events))
+    return group, quality, ts_us
+
+def check(group, quality, ts_us, params: SchedulerParams, sample: int) -> int:
+    state = replay_arrays(group, quality, ts_us, initial_arrays(int(group.max()) + 1), params)
+    mismatches = 0
+    for g in np.unique(group)[:sample]:
+        idx = np.flatnonzero(group == g)
+        events = [SkillEvent(skill_id=str(g), quality=int(quality[i]), ts=from_us(ts_us[i])) for i in idx]
+        ref, got = replay(events, params=params), state_at(state, int(g))
+        same = (
+            ref.interval_days == got.interval_days and ref.streak == got.streak and ref.mistakes == got.mistakes
+            and ref.last_seen == got.last_seen and ref.next_due == got.next_due
+            and abs(ref.strength - got.strength) < 1e-12 and abs(ref.ease - got.ease) < 1e-12
+        )
+        if not same:
+            mismatches += 1
+            if mismatches <= 3:
+                print("mismatch", int(g), ref, got, file=sys.stderr)
+    return mismatches
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--skills", type=int, default=200_000)
+    ap.add_argument("--events", type=int, default=2_000_000)
+    ap.add_argument("--sample", type=int, default=500, help="skills checked against the scalar reference")
+    args = ap.parse_args()
+
+    results = {}
+    for name, params in (("default", DEFAULT_PARAMS), ("tuned", SchedulerParams(retry_hours=6, first_interval_days=3, gain_base=0.1))):
+        small = synth(2_000, 40_000, seed=len(name))
+        results[f"mismatches_{name}"] = check(*small, params=params, sample=args.sample)
+
+    group, quality, ts_us = synth(args.skills, args.events)
+    state = initial_arrays(args.skills)
+    t0 = time.perf_counter()
+    replay_arrays(group, quality, ts_us, state)
+    dt = time.perf_counter() - t0
+    results.update(events=args.events, skills=args.skills, replay_s=round(dt, 3), events_per_s=round(args.events / dt))
+
+    # scalar baseline on a slice, for scale
+    n = min(args.events, 100_000)
+    t0 = time.perf_counter()
+    states = {}
+    for g, q, t in zip(group[:n].tolist(), quality[:n].tolist(), ts_us[:n].tolist()):
+        states[g] = replay([SkillEvent(str(g), q, EPOCH + timedelta(microseconds=t))], states.get(g))
+    results["scalar_events_per_s"] = round(n / (time.perf_counter() - t0))
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["mismatches_default"] or results["mismatches_tuned"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""SQLite file size and request latency with and without the retention pass, over several growth cycles.
+
+    cd backend && python -m bench.retention --users 20 --turns 2000 --cycles 4
+
+Each cycle adds `--turns` backdated chat turns per user, then (for `retention`)
+runs one pass: turns older than RETENTION_TURNS_DAYS move to archive segments,
+the newest RETENTION_TURNS_KEEP per user stay, free pages go back via
+incremental VACUUM. Reported per cycle: database file size, archive size, and
+history latency for the first page and for a page deep in the past (served from
+the archive once it is there). Writes (/api/activity/log) run during the pass;
+their p99 against an idle baseline shows whether the chunked deletes block them.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench import common
+
+def _size(path: str) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path) if os.path.isdir(path) else [("", [], [path])]:
+        for name in names:
+            p = os.path.join(dirpath, name)
+            total += os.path.getsize(p) if os.path.exists(p) else 0
+    return total
+
+async def seed(sessionmaker, users: int, turns: int, start: int):
+    from sqlalchemy import insert
+    from app.db.models import ChatTurn
+
+    t0 = datetime.now(tz=timezone.utc) - timedelta(days=365)
+    async with sessionmaker() as db:
+        rows = [dict(user_id=f"u{u}", role="user" if i % 2 == 0 else "assistant",
+                     content=f"turn {start + i}: could I move a few things into my carry-on bag please?",
+                     ts=t0 + timedelta(seconds=start + i)) for i in range(turns) for u in range(users)]
+        for i in range(0, len(rows), 2000):
+            await db.execute(insert(ChatTurn).values(rows[i:i + 2000]))
+        await db.commit()
+
+async def history_latency(c, user: str, samples: int = 20) -> dict:
+    first, deep = [], []
+    r = await c.get(f"/api/history/{user}", params={"limit": 200})
+    cursor = r.headers.get("x-next-cursor")
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        (await c.get(f"/api/history/{user}", params={"limit": 30})).raise_for_status()
+        first.append(time.perf_counter() - t0)
+        if cursor:
+            t0 = time.perf_counter()
+            (await c.get(f"/api/history/{user}", params={"limit": 30, "cursor": cursor})).raise_for_status()
+            deep.append(time.perf_counter() - t0)
+    return {"first_page_p50_ms": common.summarize(first)["p50_ms"], "older_page_p50_ms": common.summarize(deep)["p50_ms"]}
+
+async def writes_during(c, work) -> dict:
+    """p99 of activity writes while `work` runs."""
+    latencies, stop = [], asyncio.Event()
+
+    async def writer():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            (await c.post("/api/activity/log", json={"user_id": "writer", "minutes": 1})).raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.02)  # a steady trickle, not a flood that grows the file itself
+
+    task = asyncio.create_task(writer())
+    try:
+        result = await work()
+    finally:
+        stop.set()
+        await task
+    return {"result": result, "writes": common.summarize(latencies)}
+
+async def run_mode(args, retention: bool) -> list:
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    db_path = f"{tmp}/app.db"
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{db_path}", WRITE_BEHIND="0", RETENTION="0",
+                      CHAT_ARCHIVE_DIR=f"{tmp}/archive")
+    from app.main import app
+    from app.db.retention import Retention
+    from app.db.session import get_sessionmaker
+
+    cycles = []
+    async with app.router.lifespan_context(app):
+        sm = get_sessionmaker()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as c:
+            for cycle in range(args.cycles):
+                await seed(sm, args.users, args.turns, cycle * args.turns)
+                row = {"cycle": cycle + 1}
+                if retention:
+                    idle = await writes_during(c, lambda: asyncio.sleep(0.5))
+                    t0 = time.perf_counter()
+                    busy = await writes_during(c, lambda: Retention(sm).run_once())
+                    row.update(pass_s=round(time.perf_counter() - t0, 2), **busy["result"],
+                               write_p99_idle_ms=idle["writes"]["p99_ms"], write_p99_during_pass_ms=busy["writes"]["p99_ms"])
+                row.update(db_mib=round(_size(db_path) / 2**20, 2), wal_mib=round(_size(db_path + "-wal") / 2**20, 2),
+                           archive_mib=round(_size(f"{tmp}/archive") / 2**20, 2), **await history_latency(c, "u0"))
+                cycles.append(row)
+    return cycles
+
+async def main(args):
+    os.environ.update(RETENTION_TURNS_DAYS=str(args.keep_days), RETENTION_TURNS_KEEP=str(args.keep))
+    print(json.dumps({"no_retention": await run_mode(args, False), "retention": await run_mode(args, True)}, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=2000, help="turns added per user per cycle")
+    ap.add_argument("--cycles", type=int, default=4)
+    ap.add_argument("--keep-days", type=int, default=30)
+    ap.add_argument("--keep", type=int, default=200)
+    asyncio.run(main(ap.parse_args()))
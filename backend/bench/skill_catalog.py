@@ -0,0 +1,171 @@
+"""Skill catalog: storage and index size of the skill tables before / after interning names (migration 7).
+
+    cd backend && python -m bench.skill_catalog --users 2000 --skills 150 --reviews 6
+
+Builds a SQLite file at the previous schema (migrations 1-6: `skills`,
+`skill_reviews` and `skill_baselines` keyed on the skill name string), with
+`--users` users x `--skills` skills drawn from a `--vocab`-sized set of names,
+`--reviews` review rows per skill and a `--dup-rate` share of rows written
+with a near-duplicate spelling (`vocab:carry_on_bag` / `Vocab:Carry-On Bag` /
+`vocab:carryonbag`). Then runs init_db on it (migration 7) and VACUUMs both
+versions. Reports bytes per table and index (dbstat), the file size, the
+migration time, rows merged, and the interner's lookup cost per tag.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench import common
+
+SKILL_TABLES = ("skills", "skill_reviews", "skill_baselines")
+OLD_DDL = """
+CREATE TABLE skills (id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR NOT NULL, skill_id VARCHAR NOT NULL,
+    strength FLOAT NOT NULL, ease FLOAT NOT NULL, interval_days INTEGER NOT NULL, last_seen DATETIME, next_due DATETIME,
+    streak INTEGER NOT NULL, mistakes INTEGER NOT NULL);
+CREATE UNIQUE INDEX uq_skills_user_skill ON skills (user_id, skill_id);
+CREATE INDEX ix_skills_user_next_due ON skills (user_id, next_due);
+CREATE INDEX ix_skills_user_strength ON skills (user_id, strength, next_due);
+CREATE TABLE skill_reviews (id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR NOT NULL, skill_id VARCHAR NOT NULL,
+    quality INTEGER NOT NULL, ts DATETIME NOT NULL);
+CREATE INDEX ix_skill_reviews_user_skill ON skill_reviews (user_id, skill_id, id);
+CREATE TABLE skill_baselines (id INTEGER NOT NULL PRIMARY KEY, user_id VARCHAR NOT NULL, skill_id VARCHAR NOT NULL,
+    strength FLOAT NOT NULL, ease FLOAT NOT NULL, interval_days INTEGER NOT NULL, last_seen DATETIME, next_due DATETIME,
+    streak INTEGER NOT NULL, mistakes INTEGER NOT NULL);
+CREATE UNIQUE INDEX uq_skill_baselines_user_skill ON skill_baselines (user_id, skill_id);
+"""
+WORDS = ("carry", "on", "bag", "check", "in", "boarding", "pass", "order", "table", "refund", "receipt", "polite",
+         "request", "past", "tense", "deadline", "meeting", "status", "update", "allergy", "discount", "warranty",
+         "question", "form", "window", "seat", "gate", "delay", "invoice", "schedule", "extension", "menu")
+
+def vocab(n: int, rng: random.Random):
+    names = set()
+    while len(names) < n:
+        kind = rng.choice(("vocab", "phrase", "grammar"))
+        names.add(f"{kind}:{'_'.join(rng.sample(WORDS, rng.randint(2, 3)))}")
+    return sorted(names)
+
+def misspell(name: str, rng: random.Random) -> str:
+    kind, _, rest = name.partition(":")
+    return rng.choice((f"{kind.title()}:{rest.replace('_', '-').title()}", f"{kind}:{rest.replace('_', '')}",
+                       f"{kind}:{rest.replace('_', ' ')}"))
+
+def build(db_path: str, args):
+    """A file at schema version 6 with the synthetic skill data."""
+    from sqlalchemy import create_engine
+    from app.db.models import Base, SchemaVersion
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    old = set(SKILL_TABLES) | {"skill_catalog", "skill_aliases"}
+    Base.metadata.create_all(engine, tables=[t for name, t in Base.metadata.tables.items() if name not in old])
+    engine.dispose()
+    rng = random.Random(args.seed)
+    names = vocab(args.vocab, rng)
+    now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(OLD_DDL)
+    conn.executemany("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                     [(v, f"v{v}", str(now)) for v in range(1, 7)])
+    for u in range(args.users):
+        user = f"user-{u:06d}"
+        picked = rng.sample(names, args.skills)
+        spellings = {n: n for n in picked}
+        # near-duplicates: the same skill once more under another spelling (a second row before interning)
+        extra = [(misspell(n, rng), n) for n in picked if rng.random() < args.dup_rate]
+        rows = [(user, s, rng.random(), 2.0, 4, str(now - timedelta(days=rng.randrange(30))),
+                 str(now + timedelta(hours=rng.uniform(-96, 720))), rng.randrange(5), rng.randrange(3))
+                for s in list(spellings) + [s for s, _ in extra]]
+        conn.executemany("INSERT INTO skills (user_id, skill_id, strength, ease, interval_days, last_seen, next_due, streak,"
+                         " mistakes) VALUES (?,?,?,?,?,?,?,?,?)", rows)
+        conn.executemany("INSERT INTO skill_baselines (user_id, skill_id, strength, ease, interval_days, last_seen, next_due,"
+                         " streak, mistakes) VALUES (?,?,?,?,?,?,?,?,?)", rows[: len(rows) // 4])
+        conn.executemany("INSERT INTO skill_reviews (user_id, skill_id, quality, ts) VALUES (?,?,?,?)",
+                         [(user, r[1], rng.randrange(6), str(now - timedelta(minutes=k))) for r in rows for k in range(args.reviews)])
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def sizes(db_path: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    objects = dict(conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"))
+    per = {name: size for name, size in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+           if objects.get(name) in SKILL_TABLES + ("skill_catalog", "skill_aliases")}
+    rows = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in SKILL_TABLES}
+    conn.close()
+    tables = sum(size for name, size in per.items() if name == objects[name])
+    return {"objects_bytes": dict(sorted(per.items())), "skill_tables_bytes": tables,
+            "skill_indexes_bytes": sum(per.values()) - tables, "file_bytes": os.path.getsize(db_path), "rows": rows}
+
+async def migrate(db_path: str) -> dict:
+    from app.db.init_db import init_db
+    from app.db.session import dispose_engine, init_engine
+    from app.db.skill_catalog import get_skill_interner
+
+    t0 = time.perf_counter()
+    applied = await init_db(init_engine(f"sqlite+aiosqlite:///{db_path}"))
+    elapsed = time.perf_counter() - t0
+    interner = get_skill_interner()
+    await interner.load()
+    await dispose_engine()
+    return {"applied": applied, "migration_s": round(elapsed, 2), "interner": interner}
+
+def lookups(interner, names, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        for n in names:
+            s = time.perf_counter_ns()
+            interner.lookup(n)
+            samples.append(time.perf_counter_ns() - s)
+    return {"p50_us": round(common.percentile(samples, 50) / 1000, 3), "p99_us": round(common.percentile(samples, 99) / 1000, 3)}
+
+def main(args):
+    db_path = os.path.join(tempfile.mkdtemp(), "app.db")
+    build(db_path, args)
+    before = sizes(db_path)
+    out = asyncio.run(migrate(db_path))
+    after = sizes(db_path)
+    interner = out.pop("interner")
+    conn = sqlite3.connect(db_path)
+    catalog, aliases = (conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("skill_catalog", "skill_aliases"))
+    spellings = [r[0] for r in conn.execute("SELECT name FROM skill_catalog")] + [r[0] for r in conn.execute("SELECT alias FROM skill_aliases")]
+    conn.close()
+    rng = random.Random(args.seed)
+    cold = [misspell(n, rng) for n in spellings[:2000]]
+
+    def pct(a, b):
+        return f"{(1 - b / a) * 100:.1f}%" if a else "n/a"
+
+    results = {
+        "before": before,
+        "after": after,
+        **out,
+        "catalog_rows": catalog,
+        "aliases": aliases,
+        "rows_merged": {t: before["rows"][t] - after["rows"][t] for t in SKILL_TABLES},
+        "saved": {"skill_tables": pct(before["skill_tables_bytes"], after["skill_tables_bytes"]),
+                  "skill_indexes": pct(before["skill_indexes_bytes"], after["skill_indexes_bytes"]),
+                  "file": pct(before["file_bytes"], after["file_bytes"])},
+        "lookup_first_spelling": lookups(interner, cold, 1),  # normalize + key lookup, then remembered
+        "lookup": lookups(interner, cold + spellings, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--skills", type=int, default=150, help="skills per user")
+    ap.add_argument("--reviews", type=int, default=6, help="review rows per skill row")
+    ap.add_argument("--vocab", type=int, default=3000, help="distinct skill names")
+    ap.add_argument("--dup-rate", type=float, default=0.03, help="share of skills also stored under a near-duplicate spelling")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    os.chdir(tempfile.mkdtemp())
+    main(args)
@@ -0,0 +1,96 @@
+"""Local skill tagger: accuracy on a labelled corpus and per-message cost, vs the old substring checks.
+
+    cd backend && python -m bench.tagger --repeat 2000
+
+`bench/tagger_corpus.jsonl` holds learner messages across the five contexts,
+each labelled with the skills (and SM-2 qualities) a tutor should record.
+Reported per tagger: skill precision / recall, the share of found skills with
+the expected quality, and tagging latency (p50 / p99 microseconds, messages/sec)
+over the corpus repeated `--repeat` times. `lexicon_build_ms` is the one-off
+compile at startup. Exits non-zero if the lexicon tagger's precision or recall
+falls below `--min-precision` / `--min-recall`.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+CORPUS = os.path.join(os.path.dirname(__file__), "tagger_corpus.jsonl")
+
+def substring_tags(message: str) -> List[Dict[str, Any]]:
+    """What tutor/chat._fallback_local did before the lexicon tagger."""
+    skills = []
+    low = message.lower()
+    if "bag" in low or "overweight" in low:
+        skills.append({"skill_id": "vocab:overweight_bag", "quality": 4})
+    if "please" not in low:
+        skills.append({"skill_id": "phrase:polite_request", "quality": 2})
+    if not skills:
+        skills.append({"skill_id": "phrase:basic_response", "quality": 3})
+    return skills
+
+def accuracy(tag, corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    tp = fp = fn = same_q = 0
+    misses = []
+    for row in corpus:
+        got = {s["skill_id"]: s["quality"] for s in tag(row["message"])}
+        want = row["skills"]
+        hit = got.keys() & want.keys()
+        tp, fp, fn = tp + len(hit), fp + len(got.keys() - want.keys()), fn + len(want.keys() - got.keys())
+        same_q += sum(got[s] == want[s] for s in hit)
+        if got != want:
+            misses.append({"message": row["message"], "got": got, "want": want})
+    return {
+        "precision": round(tp / max(1, tp + fp), 3),
+        "recall": round(tp / max(1, tp + fn), 3),
+        "quality_match": round(same_q / max(1, tp), 3),
+        "exact_messages": f"{len(corpus) - len(misses)}/{len(corpus)}",
+        "_misses": misses,
+    }
+
+def latency(tag, messages: List[str], repeat: int) -> Dict[str, float]:
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for m in messages:
+            s = time.perf_counter_ns()
+            tag(m)
+            samples.append(time.perf_counter_ns() - s)
+    elapsed = time.perf_counter() - t0
+    samples.sort()
+    return {
+        "p50_us": round(samples[len(samples) // 2] / 1000, 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)] / 1000, 2),
+        "msgs_per_s": round(len(samples) / elapsed),
+    }
+
+def main(args):
+    from app.tutor.tagger import SkillTagger, load_lexicon
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    t0 = time.perf_counter()
+    tagger = SkillTagger(load_lexicon())
+    build_ms = (time.perf_counter() - t0) * 1000
+    messages = [row["message"] for row in corpus]
+    results = {}
+    for name, tag in (("substring", substring_tags), ("lexicon", tagger.tag)):
+        results[name] = {**accuracy(tag, corpus), **latency(tag, messages, args.repeat)}
+        if not args.show_misses:
+            results[name].pop("_misses")
+    results["lexicon"].update(lexicon_build_ms=round(build_ms, 2), skills=len(tagger.skills), phrases=len(tagger.phrases))
+    lexicon = results["lexicon"]
+    checks = {"precision": lexicon["precision"] >= args.min_precision, "recall": lexicon["recall"] >= args.min_recall}
+    print(json.dumps({**results, "checks": checks}, indent=2, ensure_ascii=False))
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=2000)
+    ap.add_argument("--show-misses", action="store_true", help="list the messages each tagger got wrong")
+    ap.add_argument("--min-precision", type=float, default=0.95)
+    ap.add_argument("--min-recall", type=float, default=0.95)
+    main(ap.parse_args())
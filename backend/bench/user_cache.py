@@ -0,0 +1,71 @@
+"""Home-page polling cost: user cache off vs on, and ETag revalidation (304s).
+
+    cd backend && python -m bench.user_cache --polls 300
+
+Seeds users with a few chat turns, then replays the frontend's polls
+(GET profile / skills / progress, POST practice/next) in-process. The `etag`
+run sends If-None-Match from the previous response, as a browser does.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from bench import common
+
+POLLS = [("GET", "/api/profile/{u}"), ("GET", "/api/skills/{u}"), ("GET", "/api/progress/{u}"),
+         ("POST", "/api/practice/next")]
+
+async def run(app, args, cache: bool, etag: bool) -> dict:
+    import httpx
+    from app import user_cache
+
+    user_cache._cache = None
+    os.environ["USER_CACHE"] = "1" if cache else "0"
+    tags, statuses, per_route = {}, {}, {path: [] for _, path in POLLS}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        for i in range(args.polls):
+            u = f"user{i % args.users}"
+            for method, path in POLLS:
+                url = path.format(u=u)
+                headers = {"If-None-Match": tags[url]} if etag and url in tags else {}
+                t0 = time.perf_counter()
+                if method == "GET":
+                    r = await c.get(url, headers=headers)
+                else:
+                    r = await c.post(url, json={"user_id": u, "context": "Airport"})
+                per_route[path].append(time.perf_counter() - t0)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                if "etag" in r.headers:
+                    tags[url] = r.headers["etag"]
+    return {"status_counts": statuses, **{path: common.summarize(s) for path, s in per_route.items()}}
+
+async def main(args):
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/app.db", WRITE_BEHIND="0")
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            for u in range(args.users):  # local tutor replies tag a few skills per turn
+                for msg in ("my bag is overweight", "please help me check in", "can I change my flight please"):
+                    (await c.post("/api/chat", json={"user_id": f"user{u}", "message": msg})).raise_for_status()
+        results = {
+            "no_cache": await run(app, args, cache=False, etag=False),
+            "cache": await run(app, args, cache=True, etag=False),
+            "cache_etag": await run(app, args, cache=True, etag=True),
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--polls", type=int, default=300)
+    ap.add_argument("--users", type=int, default=20)
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,95 @@
+"""Chat + activity throughput with transcript/activity rows written through vs write-behind.
+
+    cd backend && python -m bench.write_behind --turns 2000 --concurrency 32
+
+Drives /api/chat (stub LLM) and /api/activity/log through the ASGI app for
+WRITE_BEHIND=0 and =1, each on a fresh SQLite file. Every few turns the same
+user's /api/history is read back to check read-your-writes. After the app
+shuts down, the row counts and rollup totals are checked against what was sent,
+so a lost flush shows up as `rows_ok: false`. Failed requests (SQLite lock
+errors under write contention) are counted in `errors`.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench import common
+from bench.fake_llm import FakeLLMServer
+
+NO_SKILLS_REPLY = "Nice! A more natural way: 'Hi, I'm checking in for my flight to Boston.'"
+
+async def run_mode(app, mode: str, args) -> dict:
+    import httpx
+
+    tmp = tempfile.mkdtemp()
+    db_path = f"{tmp}/app.db"
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{db_path}", WRITE_BEHIND=mode)
+    users = max(1, args.turns // args.turns_per_user)
+    stale = errors = logs = 0
+    t0 = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as c:
+            async def turn(i: int):
+                nonlocal stale, errors, logs
+                user_id = f"wb{mode}-{i % users}"
+                message = f"({i}) Hi, I'm checking in for my flight"
+                r = await c.post("/api/chat", json={"user_id": user_id, "message": message})
+                if r.status_code != 200:  # e.g. "database is locked" under write contention
+                    errors += 1
+                    return
+                if i % args.log_every == 0:
+                    r = await c.post("/api/activity/log", json={"user_id": user_id, "minutes": 2})
+                    logs += r.status_code == 200
+                if i % args.read_every == 0:
+                    hist = (await c.get(f"/api/history/{user_id}", params={"limit": 10})).json()
+                    stale += message not in [h["content"] for h in hist]
+
+            latencies = await common.run_concurrent(turn, args.turns, args.concurrency)
+    elapsed = time.perf_counter() - t0  # includes the final flush at shutdown
+
+    ok = args.turns - errors
+    conn = sqlite3.connect(db_path)
+    turns = conn.execute("SELECT COUNT(*) FROM chat_turns").fetchone()[0]
+    activity = conn.execute("SELECT COUNT(*), SUM(minutes) FROM activity_logs").fetchone()
+    rollup = conn.execute("SELECT SUM(minutes), SUM(turns) FROM activity_daily").fetchone()
+    conn.close()
+    expected_minutes = ok + 2 * logs
+    return {
+        "turns_per_s": round(ok / elapsed, 1),
+        "chat": common.summarize(latencies),
+        "errors": errors,
+        "stale_history_reads": stale,
+        "rows_ok": turns == 2 * ok and activity == (ok + logs, expected_minutes)
+                   and rollup == (expected_minutes, ok + logs),
+    }
+
+async def main(args):
+    from app.main import app
+
+    reply = {} if args.skills else {"reply": NO_SKILLS_REPLY}
+    results = {}
+    with FakeLLMServer(latency_ms=args.latency_ms, **reply) as srv:
+        os.environ.update(LLM_PROVIDER="openai_compat", LLM_API_KEY="stub", LLM_BASE_URL=srv.base_url, LLM_MODEL="stub")
+        for mode, name in (("0", "write_through"), ("1", "write_behind")):
+            results[name] = await run_mode(app, mode, args)
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(r["rows_ok"] and not r["stale_history_reads"] for r in results.values()) else 1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--turns", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--turns-per-user", type=int, default=10)
+    ap.add_argument("--log-every", type=int, default=4, help="also POST /api/activity/log every N turns")
+    ap.add_argument("--read-every", type=int, default=5, help="read the user's history back every N turns")
+    ap.add_argument("--latency-ms", type=float, default=5.0)
+    ap.add_argument("--skills", action=argparse.BooleanOptionalAction, default=False,
+                    help="stub replies carry skill tags (adds the synchronous skills commit)")
+    asyncio.run(main(ap.parse_args()))
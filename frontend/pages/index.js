@@ -11,6 +11,8 @@ export default function Home() {
   const [level, setLevel] = useState("Beginner");
   const [message, setMessage] = useState("");
   const [busy, setBusy] = useState(false);
+  // the last turn that failed, kept with its Idempotency-Key so a retry reuses it
+  const [failed, setFailed] = useState(null);
 
   const [chat, setChat] = useState([
     { role: "assistant", content: "Hey! Pick a context and talk to me like it’s real life. I’ll coach you and adapt what we practice next." }
@@ -47,18 +49,25 @@ async function refreshProfile() {
     const userMsg = message.trim();
     setMessage("");
     setChat((c) => [...c, { role: "user", content: userMsg }]);
+    // one key per message, made when it is queued: if the request is retried, the backend runs the turn once
+    await deliver({
+      body: { user_id: userId, context, level, message: userMsg },
+      key: crypto.randomUUID()
+    });
+  }
+
+  async function deliver(turn) {
+    setFailed(null);
     setBusy(true);
+    let answered = false;
     try {
-      const res = await post("/api/chat", {
-        user_id: userId,
-        context,
-        level,
-        message: userMsg
-      });
+      const res = await post("/api/chat", turn.body, { "Idempotency-Key": turn.key });
+      answered = true;
       setChat((c) => [...c, { role: "assistant", content: res.reply }]);
       await refreshPlan();
       await refreshProgress();
     } catch (e) {
+      if (!answered) setFailed(turn);
       setChat((c) => [...c, { role: "assistant", content: "Error talking to backend. Check backend is running + CORS is set.\n\n" + String(e.message || e) }]);
     } finally {
       setBusy(false);
@@ -112,6 +121,7 @@ async function refreshProfile() {
               disabled={busy}
             />
             <button onClick={send} disabled={busy}>Send</button>
+            {failed && <button onClick={() => deliver(failed)} disabled={busy}>Retry</button>}
           </div>
 
           <div className="small" style={{marginTop: 8}}>
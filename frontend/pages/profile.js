@@ -43,7 +43,8 @@ export default function Profile() {
           level: profile.level,
           daily_minutes_goal: Number(profile.daily_minutes_goal),
           weekly_minutes_goal: Number(profile.weekly_minutes_goal),
-          focus_contexts: profile.focus_contexts || []
+          focus_contexts: profile.focus_contexts || [],
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
         })
       });
       if (!r.ok) throw new Error(await r.text());